@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+"""A resident axs process that keeps a warm kernel (imported code, loaded entries and collection indices)
+    and serves pipelines sent by the axs script over a Unix socket.
+
+    Each request is served by a fork of the daemon, which adopts the client's stdin/stdout/stderr (passed over the socket),
+    current directory and environment, runs the parsed pipeline and sends back the pickled result and the exit code.
+    Whatever the fork changes in memory is discarded with it, but it reports the paths of the entries it has loaded,
+    and the daemon loads them (data and code) itself before serving the next request, so that they stay warm for the following forks.
+    The daemon also reloads the entries that have changed on disk (by mtime) before serving the next request.
+
+    The axs script forwards to a running daemon transparently, unless AXS_NO_DAEMON is set.
+    The socket path can be overridden with AXS_DAEMON_SOCKET .
+
+Usage examples :
+                axs daemon &
+                axs byquery shell_tool,can_download_url , get tool_path     # served by the daemon
+                AXS_NO_DAEMON=1 axs byname shell , get_path                 # not served by the daemon
+                axs stop_daemon
+"""
+
+import logging
+import os
+import pickle
+import select
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import traceback
+
+HEADER_format   = '!I'                          # the length of a pickled message that follows
+HEADER_size     = struct.calcsize(HEADER_format)
+
+serving_pid     = None                          # set in the daemon process (and inherited by its forks)
+
+
+def default_socket_path():
+    return os.getenv('AXS_DAEMON_SOCKET') or os.path.join( tempfile.gettempdir(), f"axs_daemon_{os.getuid()}.sock" )
+
+
+def kernel_identity():
+    "Requests are only served by a daemon running the same kernel with the same interpreter"
+
+    return ( os.path.dirname( os.path.realpath(__file__) ), sys.executable )
+
+
+def send_message(sock, message, fds=None):
+    payload = pickle.dumps( message )
+    header  = struct.pack( HEADER_format, len(payload) )
+    if fds:
+        socket.send_fds( sock, [ header ], fds )
+    else:
+        sock.sendall( header )
+    sock.sendall( payload )
+
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size>0:
+        chunk = sock.recv( size )
+        if not chunk:
+            raise ConnectionError("axs daemon connection closed prematurely")
+        chunks.append( chunk )
+        size -= len(chunk)
+    return b''.join( chunks )
+
+
+def recv_message(sock, max_fds=0):
+    if max_fds:
+        header, fds, _, _ = socket.recv_fds( sock, HEADER_size, max_fds )
+        if len(header)<HEADER_size:
+            header += recv_exactly( sock, HEADER_size-len(header) )
+    else:
+        header, fds = recv_exactly( sock, HEADER_size ), []
+
+    (payload_size,) = struct.unpack( HEADER_format, header )
+    return pickle.loads( recv_exactly( sock, payload_size ) ), fds
+
+
+def can_forward(pipeline):
+    "Whether this pipeline should be offered to a daemon at all"
+
+    if os.getenv('AXS_NO_DAEMON') or not hasattr(socket, 'AF_UNIX') or not hasattr(socket, 'send_fds'):
+        return False
+    if pipeline and type(pipeline[0])==list and pipeline[0][:1]==['daemon']:
+        return False
+    return os.path.exists( default_socket_path() )
+
+
+def forward(pipeline):
+    """Try to run the pipeline in a daemon. Returns (exit_code, printable_results), or None if no daemon would serve it.
+        printable_results is a list of one item if the pipeline has completed, empty otherwise.
+    """
+    if not can_forward(pipeline):
+        return None
+
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        sock.connect( default_socket_path() )
+    except OSError:
+        sock.close()
+        return None                 # a stale socket file
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    with sock:
+        send_message( sock, {
+            "identity": kernel_identity(),
+            "pipeline": pipeline,
+            "cwd":      os.getcwd(),
+            "env":      dict(os.environ),
+        }, [ 0, 1, 2 ] )
+
+        accepted, _ = recv_message( sock )
+        if not accepted:
+            return None             # a daemon of a different kernel or interpreter
+
+        try:
+            (exit_code, printable_results), _ = recv_message( sock )
+        except KeyboardInterrupt:
+            os.kill( accepted, signal.SIGINT )
+            (exit_code, printable_results), _ = recv_message( sock )
+
+    return exit_code, printable_results
+
+
+def run_pipeline(ak, pipeline):
+    "The same as running the pipeline by axs script itself"
+
+    import chrome_trace     # not needed at all when the pipeline is forwarded to a daemon
+    import profiler
+
+    active_sinks = [ sink for sink in (profiler.from_environment(), chrome_trace.from_environment()) if sink ]
+    try:
+        result = ak.execute(pipeline)
+    except RuntimeError as e:
+        logging.error(f"RuntimeError: {e}")
+        result = None
+    finally:
+        for sink in active_sinks:
+            sink.finish()
+    return ak.pickle_struct(result)
+
+
+def serve_request(ak, conn, request, fds):
+    "Runs in a fork of the daemon, on behalf of the client"
+
+    import metrics
+    import tracing
+
+    for target_fd, client_fd in enumerate(fds):
+        os.dup2( client_fd, target_fd )
+        os.close( client_fd )
+
+    os.chdir( request["cwd"] )
+    os.environ.clear()
+    os.environ.update( request["env"] )
+
+    tracing.refresh()
+    metrics.reset()     # count this request's own work, as a separate axs process would
+
+    signal.signal( signal.SIGINT, signal.default_int_handler )
+    signal.signal( signal.SIGCHLD, signal.SIG_DFL )     # so that subprocesses' exit codes can be collected
+    send_message( conn, os.getpid() )
+
+    exit_code, printable_results = 0, []
+    try:
+        printable_results.append( run_pipeline( ak, request["pipeline"] ) )
+    except SystemExit as e:
+        exit_code = e.code if type(e.code)==int else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+
+    metrics.dump_on_exit()      # this fork leaves via os._exit(), bypassing atexit
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        pickle.dumps( printable_results )
+    except Exception:
+        printable_results = [ str(printable_result) for printable_result in printable_results ]
+
+    send_message( conn, (exit_code, printable_results) )
+
+
+def detach_from_client(conn):
+    "Let go of the client's connection and stdin/stdout/stderr, so that nobody waits for this fork any longer"
+
+    conn.close()
+    devnull_fd = os.open( os.devnull, os.O_RDWR )
+    for target_fd in range(3):
+        os.dup2( devnull_fd, target_fd )
+    os.close( devnull_fd )
+
+
+def loaded_entries(ak):
+    "The entries whose data has been loaded from disk, as (entry_path, entry_name, container_path, code_loaded) tuples"
+
+    reported_entries = []
+    for entry_path, entry in list( ak.entry_cache.items() ):
+        if entry.loaded_disk_stamp is not None:
+            container = entry.get_container()
+            reported_entries.append( (entry_path, entry.get_name(), container and container.get_path(), bool(entry.own_functions_cache)) )
+    return reported_entries
+
+
+def report_loaded_entries(ak, report_fd):
+    "Runs in a fork of the daemon once the request has been served: tells the daemon which entries are worth keeping warm"
+
+    try:
+        with os.fdopen( report_fd, 'wb' ) as report_file:
+            pickle.dump( loaded_entries(ak), report_file )
+    except Exception as e:
+        logging.debug(f"Could not report the loaded entries to the axs daemon: {e}")
+
+
+def warm_up(ak, report_fds):
+    """Load the entries reported by the finished forks into the daemon's own kernel (skipping the ones gone from disk).
+        Returns the report_fds of the forks that are still running.
+    """
+    if not report_fds:
+        return report_fds
+
+    ready_fds, _, _ = select.select( report_fds, [], [], 0 )
+    for report_fd in ready_fds:
+        with os.fdopen( report_fd, 'rb' ) as report_file:
+            try:
+                reported_entries = pickle.load( report_file )
+            except Exception:       # the fork has died before reporting
+                reported_entries = []
+
+        for entry_path, entry_name, container_path, code_loaded in reported_entries:
+            if os.path.exists( entry_path ) and not (entry_path in ak.entry_cache and ak.entry_cache[entry_path].loaded_disk_stamp):
+                try:
+                    container   = ak.bypath( container_path ) if container_path else None
+                    entry       = ak.bypath( entry_path, name=entry_name, container=container )
+                    entry.own_data()
+                    if code_loaded:
+                        entry.own_functions()
+                except Exception as e:
+                    logging.debug(f"axs daemon could not warm up {entry_path}: {e}")
+
+    return [ report_fd for report_fd in report_fds if report_fd not in ready_fds ]
+
+
+def serve(ak, socket_path=None):
+    """Keep the given kernel warm and serve the requests until terminated.
+    """
+    global serving_pid
+
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists( socket_path ):
+        probe = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            probe.connect( socket_path )
+            probe.close()
+            raise RuntimeError( f"Another axs daemon is already listening on {socket_path}" )
+        except OSError:
+            os.unlink( socket_path )    # a stale socket file
+
+    ak.work_collection()                # warming up the collections, their indices and code
+    ak.core_collection()
+    ak.byname('shell')
+
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    old_umask = os.umask( 0o177 )       # only the owner can connect
+    try:
+        server.bind( socket_path )
+    finally:
+        os.umask( old_umask )
+    server.listen( 64 )
+
+    serving_pid = os.getpid()
+    report_fds  = []                                    # the read ends of the pipes the running forks will report their loaded entries into
+    signal.signal( signal.SIGCHLD, signal.SIG_IGN )     # the forks are reaped automatically
+    signal.signal( signal.SIGTERM, lambda signum, frame: sys.exit(0) )
+    logging.warning(f"axs daemon (pid={serving_pid}) is serving on {socket_path}")
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    request, fds = recv_message( conn, 3 )
+                except (ConnectionError, pickle.UnpicklingError, struct.error) as e:
+                    logging.warning(f"axs daemon dropped a malformed request: {e}")
+                    continue
+
+                try:
+                    if request.get("identity")!=kernel_identity() or len(fds)!=3:
+                        send_message( conn, None )
+                        continue
+
+                    report_fds  = warm_up( ak, report_fds )
+                    refreshed   = ak.refresh_stale_entries()
+                    if refreshed:
+                        logging.info(f"axs daemon reloaded the entries changed on disk: {refreshed}")
+
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    report_read_fd, report_write_fd = os.pipe()
+                    if os.fork()==0:
+                        server.close()
+                        for report_fd in report_fds + [ report_read_fd ]:
+                            os.close( report_fd )
+                        try:
+                            serve_request( ak, conn, request, fds )
+                        finally:
+                            detach_from_client( conn )
+                            report_loaded_entries( ak, report_write_fd )
+                            os._exit(0)
+                    os.close( report_write_fd )
+                    report_fds.append( report_read_fd )
+                finally:
+                    for fd in fds:
+                        try:
+                            os.close( fd )
+                        except OSError:
+                            pass
+    finally:
+        server.close()
+        if os.path.exists( socket_path ):
+            os.unlink( socket_path )
+
+    return socket_path
+
+
+def stop():
+    "Terminate the daemon serving the current pipeline, if any"
+
+    if serving_pid:
+        os.kill( serving_pid, signal.SIGTERM )
+        return serving_pid
+    else:
+        return None
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark of the per-call cost of a runtime stack frame
+
+    "Runnable"  builds a full Runnable for the frame (as local_call() and execute() used to do),
+    "CallFrame" acquires a pooled CallFrame and releases it back.
+
+Usage examples :
+                python3 benchmarks/bench_call_frames.py
+                python3 benchmarks/bench_call_frames.py 200000
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+
+from kernel import default_kernel as ak
+from runnable import Runnable, CallFrame
+
+
+def runnable_frame(caller, edits):
+    frame = Runnable(name='rt_call_specific_bench', own_data={}, parent_objects=[ caller ], kernel=ak)
+    frame.set_own_data( edits, topup=True )
+    return frame
+
+
+def pooled_frame(caller, edits):
+    frame = CallFrame.acquire('rt_call_specific_bench', {}, caller, ak, adopt_data=True)
+    frame.set_own_data( edits, topup=True )
+    frame.release()
+    return frame
+
+
+def allocated_per_frame(make_frame, caller, edits, number):
+    "Bytes allocated at peak while making (and dropping or releasing) one frame, averaged"
+
+    make_frame(caller, edits)       # warm up the pool
+    tracemalloc.start()
+    peak_sum = 0
+    for _ in range(number):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        make_frame(caller, edits)
+        peak_sum += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return peak_sum / number
+
+
+def main(number=100000):
+
+    caller  = ak.fresh_entry(own_data={ "mate": "world" })
+    cases   = [
+        ( "no edits",   {} ),
+        ( "two edits",  { "alpha": 10, "beta": 20 } ),
+    ]
+
+    print(f"{'frame':12} {'Runnable, us':>13} {'CallFrame, us':>14} {'Runnable, bytes':>16} {'CallFrame, bytes':>17}")
+    for case_name, edits in cases:
+        runnable_us = timeit.timeit( lambda: runnable_frame(caller, edits), number=number ) / number * 1e6
+        pooled_us   = timeit.timeit( lambda: pooled_frame(caller, edits), number=number ) / number * 1e6
+
+        runnable_bytes  = allocated_per_frame( runnable_frame, caller, edits, min(number, 1000) )
+        pooled_bytes    = allocated_per_frame( pooled_frame, caller, edits, min(number, 1000) )
+
+        print(f"{case_name:12} {runnable_us:13.2f} {pooled_us:14.2f} {runnable_bytes:16.0f} {pooled_bytes:17.0f}")
+
+
+if __name__ == '__main__':
+    main( *[ int(arg) for arg in sys.argv[1:2] ] )
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark of the per-call cost of building a call_record_entry
+
+    "eager" records every call (as local_call() used to do, now available via AXS_RECORD_CALLS=on),
+    "lazy"  only builds the record when the action, an input label or a parameter asks for __record_entry__ .
+
+    The calls are non-deterministic to bypass the call cache, so every one of them runs in full.
+
+Usage examples :
+                python3 benchmarks/bench_call_recording.py
+                python3 benchmarks/bench_call_recording.py 20000
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+
+from kernel import default_kernel as ak
+from runnable import Runnable
+
+
+def measure(entry, action_name, pos_params, number):
+    "Returns (microseconds per call, bytes allocated at peak per call, call records built per call)"
+
+    records_built = [ 0 ]
+    original_new_call_record_entry = Runnable.new_call_record_entry
+
+    def counting_new_call_record_entry(self, action_name):
+        records_built[0] += 1
+        return original_new_call_record_entry(self, action_name)
+
+    Runnable.new_call_record_entry = counting_new_call_record_entry
+    try:
+        call    = lambda: entry.local_call(action_name, pos_params, deterministic=False)
+        call()      # warm up the caches of actions and signatures
+
+        per_call_us = timeit.timeit( call, number=number ) / number * 1e6
+
+        tracemalloc.start()
+        peak_sum = 0
+        for _ in range(min(number, 1000)):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call()
+            peak_sum += tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+    finally:
+        Runnable.new_call_record_entry = original_new_call_record_entry
+
+    return per_call_us, peak_sum / min(number, 1000), records_built[0] / (number + min(number, 1000) + 1)
+
+
+def main(number=10000):
+
+    entry = ak.fresh_entry(own_data={ "mate": "world", "deep": { "hole": [10, 20, 30] } })
+
+    cases = [
+        ( "substitute",     "substitute",   [ "Hello, #{mate}#!" ] ),
+        ( "dig",            "dig",          [ "deep.hole.2" ] ),
+        ( "get",            "get",          [ "mate" ] ),
+    ]
+
+    print(f"{'action':16} {'eager, us/call':>15} {'lazy, us/call':>14} {'eager, bytes':>13} {'lazy, bytes':>12} {'records/call':>13}")
+    for case_name, action_name, pos_params in cases:
+        Runnable.RECORD_all_calls = True
+        eager_us, eager_bytes, eager_records = measure(entry, action_name, pos_params, number)
+        Runnable.RECORD_all_calls = False
+        lazy_us, lazy_bytes, lazy_records = measure(entry, action_name, pos_params, number)
+
+        print(f"{case_name:16} {eager_us:15.2f} {lazy_us:14.2f} {eager_bytes:13.0f} {lazy_bytes:12.0f} {eager_records:6.1f} -> {lazy_records:.1f}")
+
+
+if __name__ == '__main__':
+    main( *[ int(arg) for arg in sys.argv[1:2] ] )
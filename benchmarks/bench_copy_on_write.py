@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark of evaluating AS^IS escapes and planting into large inherited values
+
+    "deepcopy"      copies the whole substructure every time (as nested_calls() and plant() used to do),
+    "copy-on-write" shares it, copying only the containers along the edited path.
+
+Usage examples :
+                python3 benchmarks/bench_copy_on_write.py
+                python3 benchmarks/bench_copy_on_write.py 50000
+"""
+
+import os
+import sys
+import timeit
+from copy import deepcopy
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+
+import ufun
+from runnable import Runnable
+
+
+def main(list_size=50000, number=20):
+
+    big_list    = [ f"ILSVRC2012_val_{i:08d}.JPEG" for i in range(list_size) ]
+    big_dict    = { f"entry_{i}": f"entry_{i}" for i in range(list_size) }
+    parent      = Runnable(name='parent', own_data={ "input_file_list": big_list, "contained_entries": big_dict, "escaped": { "AS^IS": { "contained_entries": big_dict } } })
+
+    def escape_deepcopy():
+        return deepcopy( parent.own_data()["escaped"]["AS^IS"] )
+
+    def escape_shared():
+        return parent.nested_calls( parent.own_data()["escaped"] )
+
+    def plant_deepcopy():
+        child = Runnable(name='child', parent_objects=[ parent ])
+        child['contained_entries'] = deepcopy( parent['contained_entries'] )
+        ufun.edit_structure( child.own_data(), ['contained_entries', 'new_entry'], 'new_entry' )
+        return child
+
+    def plant_copy_on_write():
+        child = Runnable(name='child', parent_objects=[ parent ])
+        child.plant( 'contained_entries.new_entry', 'new_entry' )
+        return child
+
+    assert escape_deepcopy()==escape_shared(), "the same escaped value"
+    assert plant_deepcopy()['contained_entries']==plant_copy_on_write()['contained_entries'], "the same planted value"
+    assert 'new_entry' not in parent['contained_entries'], "the inherited value stays intact"
+
+    print(f"{'operation (' + str(list_size) + ' items)':32} {'deepcopy, ms':>13} {'copy-on-write, ms':>18}")
+    for case_name, before, after in (
+        ( "AS^IS escape",               escape_deepcopy,    escape_shared ),
+        ( "plant into inherited dict",  plant_deepcopy,     plant_copy_on_write ),
+    ):
+        before_ms   = timeit.timeit( before, number=number ) / number * 1e3
+        after_ms    = timeit.timeit( after,  number=number ) / number * 1e3
+        print(f"{case_name:32} {before_ms:13.3f} {after_ms:18.3f}")
+
+
+if __name__ == '__main__':
+    main( *[ int(arg) for arg in sys.argv[1:2] ] )
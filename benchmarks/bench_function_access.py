@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark of the per-call overhead of function_access.prep()
+
+    "before" re-introspects the signature on every call (as prep() used to do),
+    "after"  goes through the signature cache.
+
+Usage examples :
+                python3 benchmarks/bench_function_access.py
+                python3 benchmarks/bench_function_access.py 200000
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+
+import function_access
+from param_source import ParamSource
+
+
+def prep_uncached(action_object, given_arg_list, dict_like_object, mapping_used=None):
+    "What prep() used to cost: a fresh signature introspection per call"
+
+    joint_arg_tuple, optional_arg_dict = function_access.CallBinder(action_object).bind(given_arg_list, dict_like_object, mapping_used)
+    return action_object, joint_arg_tuple, optional_arg_dict
+
+
+def main(number=100000):
+
+    params = ParamSource(name='bench_params', own_data={ "mate": "world", "deep": { "hole": [10, 20, 30] }, "beta": 6000, "delta": 8000 })
+
+    cases = [
+        ( "four_param_example_func (dict)", function_access.four_param_example_func,        (5000,),                { "beta": 6000, "delta": 8000 } ),
+        ( "four_param_example_func",        function_access.four_param_example_func,        (5000,),                params ),
+        ( "vararg_supporting_example_func", function_access.vararg_supporting_example_func, (1, 2, 3, 4),           params ),
+        ( "ParamSource.substitute",         params.substitute,                              ("Hello, #{mate}#!",),  params ),
+        ( "ParamSource.dig",                params.dig,                                     ("deep.hole.2",),       params ),
+    ]
+
+    print(f"{'action':32} {'before, us/call':>16} {'after, us/call':>16} {'speedup':>8}")
+    for case_name, action_object, given_arg_list, dict_like_object in cases:
+        assert function_access.prep(action_object, given_arg_list, dict_like_object)==prep_uncached(action_object, given_arg_list, dict_like_object), f"{case_name}: same binding"
+
+        before  = timeit.timeit( lambda: prep_uncached(action_object, given_arg_list, dict_like_object), number=number ) / number * 1e6
+        after   = timeit.timeit( lambda: function_access.prep(action_object, given_arg_list, dict_like_object), number=number ) / number * 1e6
+        print(f"{case_name:32} {before:16.2f} {after:16.2f} {before/after:7.1f}x")
+
+
+if __name__ == '__main__':
+    main( *[ int(arg) for arg in sys.argv[1:2] ] )
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""Benchmark suite of the kernel's hot paths over synthetic collections, reporting machine-readable JSON
+
+    For every collection size a synthetic collection is generated on disk and measured in a fresh process
+    (so that nothing stays cached from the previous size). A collection of N entries contains:
+        chains of base entries (--depth long, --chains of them), each base inheriting from the one below it,
+        with "deep_param" defined only at the bottom of the chains;
+        N leaf entries tagged "synthetic", each inheriting from --fanout of the chain tops;
+        a --rule_density fraction of the leaves advertising a _producer_rule (that no benchmark query matches).
+
+    The benchmarks (each over a sample of distinct leaves; "cold_us" is the first pass, "warm_us" the best of the repeated ones):
+        byname                  fetching leaves by name
+        byquery_hit             fetching leaves by a query matching exactly one of them
+        byquery_miss            queries that match no entry and no rule (the producer rules still get searched)
+        all_byquery_template    all the leaves of one group, rendered through a template
+        getitem_deep            a parameter found at the bottom of the inheritance chains
+        substitute              a string with several substitutions
+        nested_calls            a structure of --nested_size nested ^^ calls
+        save                    saving new entries into the large collection
+
+    The report contains the kernel version and git commit, so that reports of different kernel versions can be compared:
+        python3 benchmarks/bench_kernel_suite.py compare old.json new.json
+
+Usage examples :
+                python3 benchmarks/bench_kernel_suite.py
+                python3 benchmarks/bench_kernel_suite.py --sizes=1000,10000,100000 --depth=5 --fanout=3 --rule_density=0.05 --output=bench.json
+                python3 benchmarks/bench_kernel_suite.py compare bench_before.json bench_after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+KERNEL_dir      = os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) )
+BENCHMARK_names = ( 'byname', 'byquery_hit', 'byquery_miss', 'all_byquery_template', 'getitem_deep', 'substitute', 'nested_calls', 'save' )
+GROUPS_number   = 100
+
+
+def write_entry(entry_path, data):
+    os.makedirs( entry_path, exist_ok=True )
+    with open( os.path.join( entry_path, 'data_axs.json' ), 'w' ) as data_file:
+        json.dump( data, data_file )
+
+
+def generate_collection(collection_path, size, depth, chains, fanout, rule_density):
+    "Write a synthetic collection of the given shape, return the names of its leaves"
+
+    contained_entries = {}
+
+    for chain_idx in range(chains):
+        for level in range(depth):
+            base_name = f"base_{chain_idx}_{level}"
+            base_data = { "tags": [ "synthetic_base" ], f"level_{level}": level }
+            if level==0:
+                base_data["deep_param"] = f"deep_{chain_idx}"
+            else:
+                base_data["_parent_entries"] = [ [ "^", "byname", f"base_{chain_idx}_{level-1}" ] ]
+            write_entry( os.path.join( collection_path, base_name ), base_data )
+            contained_entries[base_name] = base_name
+
+    rule_every  = round( 1/rule_density ) if rule_density else 0
+    leaf_names  = []
+    for leaf_idx in range(size):
+        leaf_name = f"leaf_{leaf_idx}"
+        leaf_data = {
+            "_parent_entries":  [ [ "^", "byname", f"base_{(leaf_idx+p) % chains}_{depth-1}" ] for p in range(fanout) ],
+            "tags":             [ "synthetic" ],
+            "serial":           leaf_idx,
+            "group":            leaf_idx % GROUPS_number,
+            "label":            f"label_{leaf_idx}",
+        }
+        if rule_every and leaf_idx % rule_every==0:
+            leaf_data["_producer_rules"] = [ [ [ "synthetic_product", f"variant={leaf_idx}" ], [[ "get", "label" ]], {} ] ]
+        write_entry( os.path.join( collection_path, leaf_name ), leaf_data )
+        contained_entries[leaf_name] = leaf_name
+        leaf_names.append( leaf_name )
+
+    with open( os.path.join( collection_path, 'data_axs.json' ), 'w' ) as data_file:
+        json.dump( { "_parent_entries": [ [ "^", "core_collection" ] ], "tags": [ "collection" ], "contained_entries": contained_entries }, data_file )
+
+    return leaf_names
+
+
+def measure(operation, arguments, repeat):
+    "Time the operation over all the arguments: the first pass (cold) and the best of the following ones (warm), in microseconds per call"
+
+    pass_times = []
+    for _ in range(1 + repeat):
+        start_time = time.perf_counter()
+        for argument in arguments:
+            operation( argument )
+        pass_times.append( (time.perf_counter() - start_time) / len(arguments) * 1e6 )
+
+    return { "ops": len(arguments), "cold_us": round( pass_times[0], 3 ), "warm_us": round( min( pass_times[1:] or pass_times ), 3 ) }
+
+
+def run_size(config, size):
+    """Generate a collection of the given size and run all the benchmarks on it in this process.
+        The kernel is imported only here, after pointing AXS_WORK_COLLECTION at a scratch work_collection.
+    """
+    scratch_dir         = tempfile.mkdtemp( prefix='axs_bench_' )
+    collection_path     = os.path.join( scratch_dir, 'synthetic_collection' )
+    work_collection_path= os.path.join( scratch_dir, 'work_collection' )
+    try:
+        generation_start = time.perf_counter()
+        leaf_names = generate_collection( collection_path, size, config.depth, config.chains, config.fanout, config.rule_density )
+        write_entry( work_collection_path, { "_parent_entries": [ [ "^", "core_collection" ] ], "tags": [ "collection" ], "contained_entries": {
+            "core_collection": [ "^", "execute", [[ [ "core_collection" ], [ "get_path" ] ]] ],
+            "synthetic_collection": collection_path,
+        } } )
+        generation_seconds = time.perf_counter() - generation_start
+
+        os.environ['AXS_WORK_COLLECTION'] = work_collection_path
+        sys.path.insert( 0, KERNEL_dir )
+        from kernel import default_kernel as ak
+
+        step            = max( 1, size // config.sample )
+        sample_indices  = list( range( 0, size, step ) )[:config.sample]
+        sample_names    = [ leaf_names[i] for i in sample_indices ]
+        collection      = ak.bypath( collection_path )
+        nested_struct   = { f"key_{k}": [ "^^", "substitute", f"#{{label}}#_{k}" ] for k in range(config.nested_size) }
+        saved_count     = [ 0 ]
+
+        def save_new_entry(_):
+            saved_count[0] += 1
+            ak.fresh_entry( container=collection, name=f"saved_{saved_count[0]}", own_data={ "tags": [ "synthetic_saved" ], "n": saved_count[0] } ).save()
+
+        results = {}
+        results["byname"]               = measure( lambda name: ak.byname(name), sample_names, config.repeat )
+        results["byquery_hit"]          = measure( lambda i: ak.byquery(f"synthetic,serial={i}"), sample_indices, config.repeat )
+        results["byquery_miss"]         = measure( lambda i: ak.byquery(f"synthetic,serial={size+i}"), sample_indices, config.repeat )
+        results["all_byquery_template"] = measure( lambda g: ak.all_byquery(f"synthetic,group={g}", template="#{label}#:#{deep_param}#"), list(range(min(10, GROUPS_number))), config.repeat )
+        results["getitem_deep"]         = measure( lambda name: ak.byname(name)["deep_param"], sample_names, config.repeat )
+        results["substitute"]           = measure( lambda name: ak.byname(name).substitute("#{label}#/#{deep_param}#/#{serial}#/#{group}#"), sample_names, config.repeat )
+        results["nested_calls"]         = measure( lambda name: ak.byname(name).nested_calls(nested_struct), sample_names[:max(1, config.sample//10)], config.repeat )
+        results["save"]                 = measure( save_new_entry, list(range(config.save_count)), config.repeat )
+
+        assert ak.byname(sample_names[-1])["deep_param"].startswith("deep_"), "the inheritance chains resolve"
+        assert ak.byquery(f"synthetic,serial={sample_indices[-1]}").get_name()==sample_names[-1], "the queries hit"
+
+        return { "size": size, "generation_s": round( generation_seconds, 3 ), "results": results }
+    finally:
+        shutil.rmtree( scratch_dir, ignore_errors=True )
+
+
+def kernel_description():
+    try:
+        git_commit = subprocess.run( [ 'git', 'rev-parse', 'HEAD' ], cwd=KERNEL_dir, capture_output=True, text=True ).stdout.strip() or None
+    except OSError:
+        git_commit = None
+
+    sys.path.insert( 0, KERNEL_dir )
+    import kernel
+    return { "version": kernel.__version__, "git_commit": git_commit }
+
+
+def compare(old_report_path, new_report_path):
+    "Print the ratios new/old of the timings present in both reports (above 1.0 is slower)"
+
+    with open(old_report_path) as old_file, open(new_report_path) as new_file:
+        old_report, new_report = json.load( old_file ), json.load( new_file )
+
+    print(f"old: {old_report['kernel']}\nnew: {new_report['kernel']}")
+    print(f"{'size':>8} {'benchmark':<22} {'old_cold':>10} {'new_cold':>10} {'ratio':>7} {'old_warm':>10} {'new_warm':>10} {'ratio':>7}")
+    old_runs = { run["size"]: run for run in old_report["runs"] }
+    for new_run in new_report["runs"]:
+        old_run = old_runs.get( new_run["size"] )
+        if not old_run:
+            continue
+        for benchmark_name, new_result in new_run["results"].items():
+            old_result = old_run["results"].get( benchmark_name )
+            if old_result:
+                ratios = [ new_result[k] / old_result[k] if old_result[k] else float('nan') for k in ("cold_us", "warm_us") ]
+                print(f"{new_run['size']:8d} {benchmark_name:<22} {old_result['cold_us']:10.1f} {new_result['cold_us']:10.1f} {ratios[0]:7.2f} "
+                      f"{old_result['warm_us']:10.1f} {new_result['warm_us']:10.1f} {ratios[1]:7.2f}")
+
+
+def main():
+    if sys.argv[1:2]==[ 'compare' ]:
+        return compare( *sys.argv[2:4] )
+
+    arg_parser = argparse.ArgumentParser( description="Benchmark the kernel's hot paths over synthetic collections" )
+    arg_parser.add_argument( '--sizes',         default='1000,10000',   help="comma-separated numbers of leaf entries (e.g. 1000,10000,100000)" )
+    arg_parser.add_argument( '--depth',         default=3,   type=int,  help="the length of every inheritance chain" )
+    arg_parser.add_argument( '--chains',        default=8,   type=int,  help="the number of inheritance chains" )
+    arg_parser.add_argument( '--fanout',        default=2,   type=int,  help="the number of parents of every leaf" )
+    arg_parser.add_argument( '--rule_density',  default=0.01,type=float,help="the fraction of leaves advertising a _producer_rule" )
+    arg_parser.add_argument( '--sample',        default=200, type=int,  help="the number of distinct leaves every benchmark runs over" )
+    arg_parser.add_argument( '--repeat',        default=3,   type=int,  help="the number of warm passes" )
+    arg_parser.add_argument( '--nested_size',   default=500, type=int,  help="the number of nested calls in the nested_calls structure" )
+    arg_parser.add_argument( '--save_count',    default=50,  type=int,  help="the number of entries saved per pass" )
+    arg_parser.add_argument( '--output',        default=None,           help="where to write the JSON report (stdout by default)" )
+    arg_parser.add_argument( '--only_size',     default=None,type=int,  help=argparse.SUPPRESS )   # runs one size in this process
+    config = arg_parser.parse_args()
+    config.chains = max( config.chains, config.fanout )
+
+    if config.only_size is not None:
+        json.dump( run_size( config, config.only_size ), sys.stdout )
+        return
+
+    runs = []
+    for size in [ int(size) for size in config.sizes.split(',') ]:
+        print(f"Benchmarking a collection of {size} entries ...", file=sys.stderr)
+        child_argv = [ arg for arg in sys.argv[1:] if not arg.startswith('--output') ]
+        completed_process = subprocess.run( [ sys.executable, os.path.realpath(__file__), *child_argv, f"--only_size={size}" ],
+                                            stdout=subprocess.PIPE, text=True, check=True )
+        runs.append( json.loads( completed_process.stdout.strip().splitlines()[-1] ) )
+
+    report = {
+        "kernel":   kernel_description(),
+        "python":   platform.python_version(),
+        "platform": platform.platform(),
+        "config":   { k: v for k, v in vars(config).items() if k not in ('output', 'only_size') },
+        "runs":     runs,
+    }
+    report_json = json.dumps( report, indent=2 )
+    if config.output:
+        with open(config.output, 'w') as output_file:
+            output_file.write( report_json + '\n' )
+        print(f"The report has been written into {config.output}", file=sys.stderr)
+    else:
+        print( report_json )
+
+
+if __name__ == '__main__':
+    main()
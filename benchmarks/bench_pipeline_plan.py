@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark of running the same pipeline over many entries (as all_byquery's pipeline mode does)
+
+    "execute"       interprets the pipeline on every run (compiling it each time),
+    "execute_plan"  compiles it once and runs the plan.
+
+Usage examples :
+                python3 benchmarks/bench_pipeline_plan.py
+                python3 benchmarks/bench_pipeline_plan.py 20000
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.realpath(__file__) ) ) )
+
+import pipeline_plan
+from kernel import default_kernel as ak
+
+
+def main(number=5000):
+
+    entries     = [ ak.fresh_entry(own_data={ "n": n, "name": f"entry_{n}" }) for n in range(100) ]
+    pipeline    = [ [ "get", "n", {}, "n_label" ], [], [ "noop", [ "x" ] ], 0, [ "func", "str" ], [], [ "get", "name" ] ]
+
+    plan        = pipeline_plan.compile_pipeline( pipeline )
+    assert [ e.execute(pipeline) for e in entries ]==[ e.execute_plan(plan) for e in entries ], "the same results"
+
+    compile_us  = timeit.timeit( lambda: pipeline_plan.compile_pipeline(pipeline), number=number ) / number * 1e6
+    execute_us  = timeit.timeit( lambda: [ e.execute(pipeline) for e in entries ], number=number//100 ) / (number//100) / len(entries) * 1e6
+    plan_us     = timeit.timeit( lambda: [ e.execute_plan(plan) for e in entries ], number=number//100 ) / (number//100) / len(entries) * 1e6
+
+    print(f"compile_pipeline:       {compile_us:8.2f} us")
+    print(f"execute per entry:      {execute_us:8.2f} us")
+    print(f"execute_plan per entry: {plan_us:8.2f} us")
+
+
+if __name__ == '__main__':
+    main( *[ int(arg) for arg in sys.argv[1:2] ] )
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"A bounded cache for the results of Runnable.local_call()"
+
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+def env_limit(env_var_name, default_value, value_type=int):
+    "Read a numeric limit from the environment, 0 meaning 'no limit'"
+
+    env_value = os.getenv(env_var_name)
+    if env_value is None:
+        return default_value
+    try:
+        return value_type(env_value)
+    except ValueError:
+        logging.warning(f"Could not parse {env_var_name}={env_value}, using the default of {default_value}")
+        return default_value
+
+
+def approximate_size(value, depth=4):
+    "A cheap estimate of the memory footprint of a (JSON-like) value, not following ParamSource objects"
+
+    size = sys.getsizeof(value)
+    if depth>0:
+        if type(value)==dict:
+            size += sum( approximate_size(k, depth-1) + approximate_size(v, depth-1) for k, v in value.items() )
+        elif type(value) in (list, tuple):
+            size += sum( approximate_size(e, depth-1) for e in value )
+    return size
+
+
+class CallCache:
+    """A per-Runnable cache of call results, unbounded by default (as the memoization it replaces was),
+        optionally turned into an LRU bounded by the number of entries and/or their approximate size in bytes, with a time-to-live.
+        Each cache counts its own hits, misses and evictions, and so does the whole process.
+
+        The limits are shared by all the caches of the process and can be set via the environment:
+            AXS_CALL_CACHE_SIZE     (max number of results per Runnable, 0 for no limit)
+            AXS_CALL_CACHE_BYTES    (max approximate size of the results per Runnable, 0 for no limit)
+            AXS_CALL_CACHE_TTL      (max age of a result in seconds, 0 for no limit)
+        or from the kernel:
+                axs call_cache_limits --max_entries=256 --ttl=600
+    """
+
+    limits          = {
+        "max_entries":  env_limit('AXS_CALL_CACHE_SIZE',  0),
+        "max_bytes":    env_limit('AXS_CALL_CACHE_BYTES', 0),
+        "ttl":          env_limit('AXS_CALL_CACHE_TTL',   0, float),
+    }
+    global_counters = { "hits": 0, "misses": 0, "evictions": 0, "expirations": 0 }
+    live_caches     = weakref.WeakSet()
+
+    def __init__(self, owner_name=None):
+        self.owner_name     = owner_name
+        self.records        = OrderedDict()     # cache_key -> [result, deps, cacheable, size, timestamp]
+        self.total_bytes    = 0
+        self.counters       = { "hits": 0, "misses": 0, "evictions": 0, "expirations": 0 }
+        self.lock           = threading.RLock()     # the same Runnable may be called from several worker threads
+
+        CallCache.live_caches.add( self )
+
+
+    @classmethod
+    def set_limits(cls, max_entries=None, max_bytes=None, ttl=None):
+        "Change the limits of all the caches (only the given ones), returning the resulting limits"
+
+        for limit_name, limit_value in (("max_entries", max_entries), ("max_bytes", max_bytes), ("ttl", ttl)):
+            if limit_value is not None:
+                cls.limits[limit_name] = limit_value
+
+        for call_cache in list( cls.live_caches ):
+            call_cache.enforce_limits()
+
+        return dict( cls.limits )
+
+
+    def count(self, counter_name):
+        self.counters[counter_name] += 1
+        CallCache.global_counters[counter_name] += 1
+
+
+    def lookup(self, cache_key):
+        "Returns the record [result, deps, cacheable, ...] or None, keeping the counters"
+
+        with self.lock:
+            record = self.records.get(cache_key)
+            if record is None:
+                self.count("misses")
+                return None
+
+            ttl = self.limits["ttl"]
+            if ttl and time.monotonic()-record[4] > ttl:
+                self.discard( cache_key )
+                self.count("expirations")
+                self.count("misses")
+                return None
+
+            self.records.move_to_end( cache_key )
+            self.count("hits")
+            return record
+
+
+    def store(self, cache_key, result, deps=None, cacheable=True):
+
+        size = approximate_size(result) if self.limits["max_bytes"] else 0
+
+        with self.lock:
+            self.discard( cache_key )
+            self.records[cache_key] = [ result, deps, cacheable, size, time.monotonic() ]
+            self.total_bytes += size
+
+            self.enforce_limits()
+
+
+    def discard(self, cache_key):
+        with self.lock:
+            record = self.records.pop(cache_key, None)
+            if record is not None:
+                self.total_bytes -= record[3]
+
+
+    def enforce_limits(self):
+        "Evict the least recently used results until the limits are satisfied"
+
+        max_entries, max_bytes = self.limits["max_entries"], self.limits["max_bytes"]
+
+        with self.lock:
+            while self.records and ( (max_entries and len(self.records)>max_entries) or (max_bytes and self.total_bytes>max_bytes) ):
+                _, record = self.records.popitem(last=False)
+                self.total_bytes -= record[3]
+                self.count("evictions")
+
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            self.total_bytes = 0
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def stats(self):
+        return { "owner": self.owner_name, "entries": len(self.records), "bytes": self.total_bytes, **self.counters }
+
+
+    @classmethod
+    def global_stats(cls):
+        live_caches = list( cls.live_caches )
+        return {
+            **cls.global_counters,
+            "live_caches":  len(live_caches),
+            "entries":      sum( len(call_cache) for call_cache in live_caches ),
+            "bytes":        sum( call_cache.total_bytes for call_cache in live_caches ),
+            "limits":       dict( cls.limits ),
+        }
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s %(message)s")
+
+    print('-'*20 + ' LRU eviction: ' + '-'*20)
+
+    CallCache.set_limits(max_entries=2, max_bytes=0, ttl=0)
+    cc = CallCache('test')
+    cc.store('a', 1)
+    cc.store('b', 2)
+    assert cc.lookup('a')[0]==1, "a fresh hit"
+    cc.store('c', 3)
+    assert cc.lookup('b') is None, "the least recently used result has been evicted"
+    assert cc.lookup('a')[0]==1 and cc.lookup('c')[0]==3, "the more recently used results stay"
+    assert cc.stats()["evictions"]==1 and cc.stats()["hits"]==3 and cc.stats()["misses"]==1, "counting hits, misses and evictions"
+
+    print('-'*20 + ' Byte limit and TTL: ' + '-'*20)
+
+    CallCache.set_limits(max_entries=0, max_bytes=approximate_size(list(range(100)))+approximate_size(7))
+    cc.clear()
+    cc.store('big', list(range(100)))
+    cc.store('small', 7)
+    assert len(cc)==2 and cc.lookup('big') is not None, "within the byte limit"
+    cc.store('another_big', list(range(100)))
+    assert cc.lookup('small') is None and cc.lookup('big') is None, "evicted to fit the byte limit"
+
+    CallCache.set_limits(max_bytes=0, ttl=0.01)
+    time.sleep(0.02)
+    assert cc.lookup('another_big') is None and cc.stats()["expirations"]==1, "expired"
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Exporting the kernel's activity on a timeline, in the Chrome Trace Event Format (viewable in Perfetto or chrome://tracing).
+
+    The spans the kernel emits (pipeline execution and its steps, action calls, parameters, nested calls, byquery,
+    find_matching_rules and producer rules, code and data loading, waiting for other producers, shell.run subprocesses)
+    become complete ("X") events on the track of the thread that ran them, the cache hits become instant events.
+    Every subprocess also gets a track of its own, under its pid, so that it can be correlated with system profilers;
+    the timestamps are those of the monotonic clock (the one `perf` uses) in microseconds.
+
+    Switched on by `axs --chrome_trace=trace.json ...` (or AXS_CHROME_TRACE=trace.json), the file is written when the pipeline is done.
+
+Usage examples :
+                axs --chrome_trace=/tmp/axs_trace.json byquery shell_tool,can_download_url
+                python3 chrome_trace.py
+"""
+
+import json
+import logging
+import os
+import threading
+
+import tracing
+from profiler import Profiler, span_label
+
+NODE_internal_keys  = ('kind', 'children', 'start', 'wall', 'cpu', 'tid', 'thread')
+
+
+class ChromeTrace(Profiler):
+    "Collects the spans as the Profiler does, but writes them out as a timeline"
+
+    def __init__(self, trace_path):
+        super().__init__()
+        self.trace_path = trace_path
+
+
+    def trace_events(self):
+        "Convert the collected span trees into a list of trace events"
+
+        pid             = os.getpid()
+        to_microseconds = lambda relative_seconds: (self.started + relative_seconds) * 1e6
+        trace_events    = [ { "name": "process_name", "ph": "M", "pid": pid, "args": { "name": f"axs {pid}" } } ]
+        thread_names    = {}
+
+        to_visit = [ (root, root["tid"]) for root in reversed(self.roots) ]
+        for root in self.roots:
+            thread_names.setdefault( root["tid"], root.get("thread", "main") )
+
+        while to_visit:
+            node, tid = to_visit.pop()
+            trace_event = { "name": span_label(node), "cat": node["kind"], "pid": pid, "tid": tid, "ts": to_microseconds( node["start"] ),
+                            "args": { k: v for k, v in node.items() if k not in NODE_internal_keys } }
+            if node.get("cache")=="hit":
+                trace_event.update( ph="i", s="t" )
+            else:
+                trace_event.update( ph="X", dur=node["wall"]*1e6 )
+            trace_events.append( trace_event )
+
+            child_pid = node.get("child_pid")
+            if child_pid:       # the subprocess on a track of its own
+                command = node.get("command")
+                command = command if type(command)==str else ' '.join( str(c) for c in command or [] )
+                trace_events.append( { "name": "process_name", "ph": "M", "pid": child_pid, "args": { "name": f"{command[:80]} [{child_pid}]" } } )
+                trace_events.append( { "name": command[:200], "cat": "child_process", "ph": "X", "pid": child_pid, "tid": child_pid,
+                                       "ts": trace_event["ts"], "dur": trace_event["dur"], "args": { "parent_pid": pid, "parent_tid": tid } } )
+
+            to_visit.extend( (child, tid) for child in reversed(node["children"]) )
+
+        for tid, thread_name in thread_names.items():
+            trace_events.append( { "name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": { "name": thread_name } } )
+
+        return trace_events
+
+
+    def finish(self):
+        "Stop listening and write the trace file"
+
+        self.stop()
+        with open(self.trace_path, 'w') as trace_file:
+            json.dump( { "traceEvents": self.trace_events(), "displayTimeUnit": "ms" }, trace_file, default=repr )
+        logging.info(f"The Chrome trace has been written into {self.trace_path}")
+
+
+def from_environment():
+    "Start tracing if AXS_CHROME_TRACE names a file. Returns the ChromeTrace (to be finish()ed) or None"
+
+    trace_path = os.getenv('AXS_CHROME_TRACE')
+    if not trace_path:
+        return None
+
+    chrome_trace = ChromeTrace( trace_path )
+    tracing.add_sink( chrome_trace )
+    return chrome_trace
+
+
+if __name__ == '__main__':
+
+    import subprocess
+    import tempfile
+    import time
+
+    chrome_trace = ChromeTrace( os.path.join( tempfile.mkdtemp(), 'trace.json' ) )
+    tracing.add_sink( chrome_trace )
+
+    with tracing.Span("byquery", entry="work_collection", query="shell_tool"):
+        tracing.event("param_cached", entry="shell", param="tool_path")
+        with subprocess.Popen(["sleep", "0.05"]) as child_process:
+            with tracing.Span("subprocess", entry="shell", command=["sleep", "0.05"], child_pid=child_process.pid):
+                child_process.wait()
+
+    def worker():
+        with tracing.Span("rule", entry="tool_detector", rule=["shell_tool"]):
+            time.sleep(0.01)
+
+    worker_thread = threading.Thread( target=worker, name="worker_1" )
+    worker_thread.start()
+    worker_thread.join()
+
+    chrome_trace.finish()
+
+    with open(chrome_trace.trace_path) as trace_file:
+        trace_events = json.load( trace_file )["traceEvents"]
+
+    spans = { e["cat"]: e for e in trace_events if e["ph"] in ("X", "i") }
+    assert spans["subprocess"]["args"]["child_pid"]==child_process.pid, "the child's pid is kept"
+    assert spans["child_process"]["pid"]==child_process.pid and spans["child_process"]["dur"] >= 0.05e6, "the child has a track of its own"
+    assert spans["byquery"]["ts"] <= spans["subprocess"]["ts"] and spans["param"]["ph"]=="i", "nested spans and instant cache hits"
+    assert spans["rule"]["tid"]!=spans["byquery"]["tid"], "threads get separate tracks"
+    assert { "worker_1", "main" } <= { e["args"]["name"] for e in trace_events if e["name"]=="thread_name" }, "named thread tracks"
+    print(f"{len(trace_events)} trace events written into {chrome_trace.trace_path}")
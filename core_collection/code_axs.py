@@ -3,59 +3,123 @@
 """ This entry knows how to make other entries.
 """
 
+import atexit
+import concurrent.futures
 from copy import deepcopy
+import json
 import logging
 import os
+import threading
+import time
+import metrics
+import pipeline_plan
+import tracing
 import ufun
+from param_source import WorkerThreadState
+from producer_lock import ProducerLock
 
-def walk(__entry__, skip_entry_names=None):
+def walk(__entry__, skip_entry_names=None, parsed_query=None, explanation=None):
     """An internal recursive generator not to be called directly
+
+        If a parsed_query is given, the collection's QueryIndex is consulted first,
+        and the entries that are certain not to match are skipped without being loaded.
+
+        If an explanation dictionary is given, it collects per collection the numbers of entries visited, skipped thanks to the QueryIndex,
+        loaded from disk or taken from the entry_cache, and the time spent walking (neither the consumer's nor the nested collections').
+        The consumer may add its own matching_seconds.
     """
     ak = __entry__.get_kernel()
     assert ak != None, "__entry__'s kernel should be defined"
     collection_own_name = __entry__.get_name()
 
+    query_index = QueryIndex.for_collection(__entry__) if parsed_query else None
+
+    if explanation is not None:
+        walk_stats = explanation.setdefault( collection_own_name, { "visited": 0, "skipped_by_index": 0, "index_records_used": 0,
+                                                                    "loaded": 0, "entry_cache_hits": 0, "seconds": 0.0, "matching_seconds": 0.0 } )
+        walk_stats["auto_index"] = bool( __entry__.get("auto_index") )
+    else:
+        walk_stats = None
+
     seen_entry_names = set()
     try:
         logging.debug(f"collection({collection_own_name}): yielding the collection itself")
         yield __entry__
 
         logging.debug(f"collection({collection_own_name}): walking contained_entries:")
-        contained_entries = __entry__.get("effective_contained_entries")
+        step_start = time.perf_counter() if walk_stats else None
+        contained_entries = fresh_contained_entries( __entry__ )
         for entry_name in contained_entries:
+            metrics.counters["walk_steps"] += 1
             if skip_entry_names and (entry_name in skip_entry_names):
                 logging.debug(f"collection({collection_own_name}): skipping {entry_name}")
                 continue
 
             entry_value = contained_entries[entry_name]
+            if walk_stats:
+                walk_stats["visited"] += 1
 
             if type(entry_value)==str:
                 relative_entry_path = entry_value
                 logging.debug(f"collection({collection_own_name}): mapping {entry_name} to relative_entry_path={relative_entry_path}")
 
-                contained_entry = ak.bypath(path=__entry__.get_path(relative_entry_path), name=entry_name, container=__entry__)
+                entry_path = __entry__.get_path(relative_entry_path)
+
+                if query_index:
+                    index_record, index_stamp = query_index.lookup(entry_name, relative_entry_path, entry_path)
+                    if walk_stats and index_record:
+                        walk_stats["index_records_used"] += 1
+                    if index_record and not index_record["collection"] and not parsed_query.matches_record(index_record):
+                        logging.debug(f"collection({collection_own_name}): skipping {entry_name} as its index record does not match the query")
+                        seen_entry_names.add( entry_name )
+                        if walk_stats:
+                            walk_stats["skipped_by_index"] += 1
+                        continue
+
+                if walk_stats:
+                    walk_stats["entry_cache_hits" if os.path.realpath(entry_path) in ak.entry_cache else "loaded"] += 1
+
+                contained_entry = ak.bypath(path=entry_path, name=entry_name, container=__entry__)
+
+                if query_index and not index_record and index_stamp:
+                    query_index.update(entry_name, relative_entry_path, contained_entry, index_stamp)
 
                 # Have to resort to duck typing to avoid triggering dependencies by testing if contained_entry.can('walk'):
                 if 'collection' in contained_entry.own_data().get("tags",[]):
                     logging.debug(f"collection({collection_own_name}): recursively walking collection {entry_name}...")
-                    yield from walk(contained_entry)
+                    if walk_stats:
+                        walk_stats["seconds"] += time.perf_counter() - step_start
+                    yield from walk(contained_entry, parsed_query=parsed_query, explanation=explanation)
                     contained_entry.touch('_BEFORE_CODE_LOADING')
                 else:
                     logging.debug(f"collection({collection_own_name}): yielding non-collection {entry_name}")
+                    if walk_stats:
+                        walk_stats["seconds"] += time.perf_counter() - step_start
                     yield contained_entry
             else:
                 logging.debug(f"collection({collection_own_name}): yielding non-filesystem entry {entry_name}")
+                if walk_stats:
+                    walk_stats["seconds"] += time.perf_counter() - step_start
                 yield entry_value
 
             seen_entry_names.add( entry_name )
+            if walk_stats:
+                step_start = time.perf_counter()
+
+        if walk_stats:
+            walk_stats["seconds"] += time.perf_counter() - step_start
 
     except RuntimeError as e:
         if str(e)=="dictionary changed size during iteration":
             print(f"Collection {__entry__.get_name()} modified under iteration, checking the new ones")
-            yield from walk(__entry__, seen_entry_names)
+            yield from walk(__entry__, seen_entry_names, parsed_query, explanation)
         else:
             raise e
 
+    finally:
+        if query_index:
+            query_index.flush()
+
 def attached_entry(entry_path=None, own_data=None, generated_name_prefix=None, __entry__=None):
     """Create a new entry with the given name and attach it to this collection
 
@@ -67,7 +131,16 @@ Usage examples :
 
 def byname(entry_name, skip_entry_names=None, __entry__=None):
     """Fetch an entry by name
+
+        Unless some names are to be skipped, the collection's NameIndex is consulted instead of walking the whole tree.
     """
+    if not skip_entry_names and type(entry_name)==str:
+        candidate_entry = NameIndex.for_collection(__entry__).lookup(entry_name)
+        if candidate_entry is None or candidate_entry.get_name() == entry_name:
+            return candidate_entry
+        logging.debug(f"collection({__entry__.get_name()}): the NameIndex has mapped {entry_name} to {candidate_entry.get_name()}, walking instead")
+        NameIndex.invalidate( __entry__.get_path() )
+
     for candidate_entry in walk(__entry__, skip_entry_names):
         if candidate_entry.get_name() == entry_name:
             return candidate_entry
@@ -209,28 +282,620 @@ class FilterPile:
             self.filter_list.append( (key_path, op, val, comparison_lambda, key_path.split('.')) )
 
 
+    def normalized(self):
+        "A hashable form of the conditions that depends neither on their order nor on their spelling (e.g. 'a==1' vs ['a', 1])"
+
+        return tuple( sorted( set( (key_path, op, repr(val)) for key_path, op, val, _, _ in self.filter_list ) ) )
+
+
     def matches_entry(self, candidate_entry, parent_recursion):
 
-        candidate_still_ok = True
-        for key_path, op, val, query_comparison_lambda, split_key_path in self.filter_list:
+        return self.rejecting_condition_idx(candidate_entry, parent_recursion) is None
+
+
+    def rejecting_condition_idx(self, candidate_entry, parent_recursion):
+        "The index (within filter_list) of the first condition the candidate fails, or None if it matches"
+
+        for condition_idx, (key_path, op, val, query_comparison_lambda, split_key_path) in enumerate(self.filter_list):
             try:
                 if not query_comparison_lambda( candidate_entry.dig(split_key_path, safe=True, parent_recursion=parent_recursion) ):
-                    candidate_still_ok = False
-                    break
+                    return condition_idx
             except RuntimeError as e:
                 if parent_recursion and ("could not be loaded" in str(e)) :
                     logging.warning( str(e) )
-                    candidate_still_ok = False
-                    break
+                    return condition_idx
                 else:
                     raise(e)
-        return candidate_still_ok
+        return None
+
+
+    def matches_record(self, index_record):
+        """Pre-screen a QueryIndex record without loading the entry.
+            Returns False only when the entry is certain not to match (assuming parent_recursion is off),
+            and True whenever the decision has to be left to matches_entry()
+        """
+        own_keys    = index_record["keys"]
+        plain_attrs = index_record["attrs"]
+
+        for key_path, op, val, query_comparison_lambda, split_key_path in self.filter_list:
+            top_key = split_key_path[0]
+
+            if not top_key:                                         # a path starting from the kernel
+                continue
+            elif top_key not in own_keys:                           # the whole path is missing, so dig() would return None
+                candidate_value = None
+            elif len(split_key_path)==1 and top_key in plain_attrs:
+                candidate_value = plain_attrs[top_key]
+            else:                                                   # either a computed value or a deeper path
+                continue
+
+            try:
+                if not query_comparison_lambda( candidate_value ):
+                    return False
+            except Exception:
+                continue
+
+        return True
+
+
+class QueryIndex:
+    """A persistent per-collection digest of the contained entries' own data:
+        tags, top-level plain attributes (including __completed), the list of own keys, the relative path
+        and a digest of the advertised _producer_rules (used by RuleTable).
+
+        Each record is stamped with the mtime and size of the entry's data file,
+        so a record that went out of sync with the file system is simply rebuilt on the next walk().
+
+        The index is stored by every walk(), and the changes made by attaching and detaching entries are stored once, at exit
+        (rewriting the whole index per attached entry would cost more than the attachment itself).
+        An update lost on the way (e.g. by a daemon's fork) is harmless, as a missing or stale record falls back to loading the entry.
+    """
+
+    FILENAME_query_index    = '.query_index_axs.json'
+    FORMAT_version          = 2
+    MAX_plain_string_length = 256
+
+    _collection_indices     = {}    # shared by all the collections of this process, keyed by collection path
+
+    def __init__(self, collection_path):
+        self.collection_path    = collection_path
+        self.index_path         = os.path.join(collection_path, self.FILENAME_query_index)
+        self.dirty              = False
+        self.lock               = threading.RLock()     # several threads may be walking the same collection
+
+        try:
+            stored_index = ufun.load_json( self.index_path )
+        except OSError:
+            stored_index = {}
+
+        if stored_index.get("format")==self.FORMAT_version:
+            self.records = stored_index.get("records", {})
+        else:
+            self.records = {}
+
+
+    @classmethod
+    def for_collection(cls, collection_entry):
+        collection_path = collection_entry.get_path()
+        query_index     = cls._collection_indices.get(collection_path)
+        if query_index is None:
+            query_index = cls._collection_indices.setdefault( collection_path, cls(collection_path) )
+        return query_index
+
+
+    @classmethod
+    def is_plain(cls, value):
+        "Only the values that nested_calls() would return unchanged are indexable"
+
+        if value is None or type(value) in (bool, int, float):
+            return True
+        elif type(value)==str:
+            return len(value)<=cls.MAX_plain_string_length
+        elif type(value)==list:
+            return (not value or value[0] not in ('^^', '^', 'AS^IS')) and all( v is None or type(v) in (bool, int, float, str) for v in value )
+        else:
+            return False
+
+
+    @staticmethod
+    def file_stamp(entry_path, parameters_filename):
+        try:
+            stat_result = os.stat( os.path.join(entry_path, parameters_filename) )
+            return [ stat_result.st_mtime_ns, stat_result.st_size ]
+        except OSError:
+            return None
+
+
+    def lookup(self, entry_name, relative_entry_path, entry_path):
+        """Returns a pair: the record (if it is still valid, otherwise None) and the current file stamp
+        """
+        from stored_entry import Entry
+
+        current_stamp   = self.file_stamp( entry_path, Entry.FILENAME_parameters )
+        index_record    = self.records.get( entry_name )
+
+        if index_record and current_stamp and index_record["path"]==relative_entry_path and index_record["stamp"]==current_stamp:
+            return index_record, current_stamp
+        else:
+            return None, current_stamp
+
+
+    def update(self, entry_name, relative_entry_path, entry, stamp=None):
+        "(Re)build the record of a loaded entry"
+
+        own_data = entry.own_data()
+        if stamp is None:
+            stamp = self.file_stamp( entry.get_path(), entry.FILENAME_parameters )
+
+        if stamp is None:
+            self.forget( entry_name )
+        else:
+            old_record  = self.records.get( entry_name )
+            new_record  = {
+                "path":         relative_entry_path,
+                "stamp":        stamp,
+                "collection":   'collection' in own_data.get("tags", []),     # the same duck typing as in walk()
+                "keys":         list( own_data.keys() ),
+                "attrs":        { k: v for k, v in own_data.items() if self.is_plain(v) },
+            }
+            producer_rules = own_data.get('_producer_rules')
+            if producer_rules:
+                new_record["rules"] = [ RuleTable.rule_digest(entry, unprocessed_rule) for unprocessed_rule in producer_rules ]
+
+            with self.lock:
+                self.records[entry_name] = new_record
+                self.dirty = True
+
+            if RuleTable.affected_by(old_record) or RuleTable.affected_by(new_record):
+                RuleTable.invalidate()
+
+
+    def forget(self, entry_name):
+        with self.lock:
+            old_record = self.records.pop(entry_name, None)
+            if old_record is not None:
+                self.dirty = True
+
+        if old_record is None or RuleTable.affected_by(old_record):     # an unknown entry may have carried rules
+            RuleTable.invalidate()
+
+
+    def is_collection(self, entry_name, relative_entry_path, collection_entry):
+        "Tell whether a contained entry is itself a collection, only loading it if its record is missing or stale"
+
+        entry_path = collection_entry.get_path( relative_entry_path )
+        index_record, index_stamp = self.lookup( entry_name, relative_entry_path, entry_path )
+
+        if index_record is None:
+            contained_entry = collection_entry.get_kernel().bypath(path=entry_path, name=entry_name, container=collection_entry)
+            if index_stamp:
+                self.update( entry_name, relative_entry_path, contained_entry, index_stamp )
+            return 'collection' in contained_entry.own_data().get("tags", [])   # the same duck typing as in walk()
+        else:
+            return index_record["collection"]
+
+
+    def flush(self):
+        "Atomically store the index if it has changed (quietly giving up on read-only collections)"
+
+        with self.lock:
+            if self.dirty:
+                temp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    ufun.save_json( {"format": self.FORMAT_version, "records": self.records}, temp_path )
+                    os.replace( temp_path, self.index_path )
+                    self.dirty = False
+                except (OSError, TypeError, ValueError) as e:
+                    logging.debug(f"Could not store the query index of {self.collection_path}: {e}")
+                    if os.path.exists( temp_path ):
+                        os.remove( temp_path )
+
+
+    @classmethod
+    def flush_all(cls):
+        "Store the indices of all the collections that have changed since their last walk()"
+
+        for query_index in list( cls._collection_indices.values() ):
+            query_index.flush()
+
+
+atexit.register( QueryIndex.flush_all )
+
+
+class RuleTable:
+    """A session-wide table of all the _producer_rules advertised in a collection tree.
+
+        Each rule is parsed into a FilterPile only once per session and placed into a bucket keyed by one of its
+        required (positive) tags, so matching a query only probes the buckets of the query's own positive tags.
+        The evaluated rule conditions persist across runs inside the QueryIndex records of the advertising entries.
+    """
+
+    _session_tables = {}    # keyed by the path of the top collection
+
+    def __init__(self, collection_entry):
+        self.rules_by_tag   = {}    # tag -> list of rule slots
+        self.untagged_rules = []    # rules that do not require any tag match any query with tags
+        self.rule_count     = 0
+
+        self.scan_collection( collection_entry )
+
+
+    @classmethod
+    def for_collection(cls, collection_entry):
+        collection_path = collection_entry.get_path()
+        rule_table      = cls._session_tables.get(collection_path)
+        if rule_table is None:
+            rule_table = cls._session_tables[collection_path] = cls(collection_entry)
+        return rule_table
+
+
+    @classmethod
+    def invalidate(cls):
+        if cls._session_tables:
+            logging.debug("Invalidating the producer rule tables")
+            cls._session_tables.clear()
+
+
+    @staticmethod
+    def affected_by(index_record):
+        "Only the entries that advertise rules or contain other entries may change the table"
+
+        return bool(index_record) and ( bool(index_record.get("rules")) or index_record["collection"] )
+
+
+    @staticmethod
+    def rule_digest(advertising_entry, unprocessed_rule):
+        """The part of a rule worth persisting: its conditions (if they are static, i.e. evaluate to themselves)
+            and the sorting key used by find_matching_rules()
+        """
+        try:
+            rule_conditions = advertising_entry.nested_calls( unprocessed_rule[0] )
+            if rule_conditions != unprocessed_rule[0]:
+                rule_conditions = None  # may depend on other entries, so has to be evaluated every time the table is built
+            json.dumps( rule_conditions )
+        except Exception:
+            rule_conditions = None
+
+        return { "conditions": rule_conditions, "sort_key": len(unprocessed_rule[0]) }
+
+
+    def add_rule(self, rule_conditions, sort_key, rule_idx, advertiser_locator):
+        parsed_rule = FilterPile( rule_conditions, f"Entry: {advertiser_locator[1]}" )
+        rule_slot   = (self.rule_count, sort_key, rule_idx, parsed_rule, advertiser_locator)
+        self.rule_count += 1
+
+        if parsed_rule.posi_tag_set:
+            self.rules_by_tag.setdefault( min(parsed_rule.posi_tag_set), [] ).append( rule_slot )
+        else:
+            self.untagged_rules.append( rule_slot )
+
+
+    def add_live_rules(self, advertising_entry, advertiser_locator):
+        for rule_idx, unprocessed_rule in enumerate( advertising_entry.own_data().get('_producer_rules', []) ):
+            self.add_rule( advertising_entry.nested_calls( unprocessed_rule[0] ), len(unprocessed_rule[0]), rule_idx, advertiser_locator )
+
+
+    def scan_collection(self, collection_entry, advertiser_locator=None):
+        "Visit the collection tree in walk() order, loading only the collections and the entries with stale index records"
+
+        ak = collection_entry.get_kernel()
+
+        self.add_live_rules( collection_entry, advertiser_locator or (None, collection_entry.get_name(), collection_entry) )
+
+        query_index         = QueryIndex.for_collection( collection_entry )
+        contained_entries   = fresh_contained_entries( collection_entry )
+        try:
+            for entry_name, entry_value in list( contained_entries.items() ):
+                if type(entry_value)!=str:
+                    self.add_live_rules( entry_value, (None, entry_name, entry_value) )
+                    continue
+
+                entry_path          = collection_entry.get_path(entry_value)
+                advertiser_locator  = (collection_entry, entry_name, entry_path)
+                index_record, index_stamp = query_index.lookup( entry_name, entry_value, entry_path )
+
+                if index_record is None:
+                    contained_entry = ak.bypath(path=entry_path, name=entry_name, container=collection_entry)
+                    if index_stamp:
+                        query_index.update( entry_name, entry_value, contained_entry, index_stamp )
+                        index_record = query_index.records.get( entry_name )
+
+                if index_record is None:    # not on the file system in the expected form, but loadable
+                    if 'collection' in contained_entry.own_data().get("tags", []):
+                        self.scan_collection( contained_entry, advertiser_locator )
+                        contained_entry.touch('_BEFORE_CODE_LOADING')
+                    else:
+                        self.add_live_rules( contained_entry, advertiser_locator )
+
+                elif index_record["collection"]:
+                    contained_collection = ak.bypath(path=entry_path, name=entry_name, container=collection_entry)
+                    self.scan_collection( contained_collection, advertiser_locator )
+                    contained_collection.touch('_BEFORE_CODE_LOADING')
+
+                else:
+                    for rule_idx, rule_digest in enumerate( index_record.get("rules", []) ):
+                        rule_conditions = rule_digest["conditions"]
+                        if rule_conditions is None:
+                            advertising_entry   = ak.bypath(path=entry_path, name=entry_name, container=collection_entry)
+                            rule_conditions     = advertising_entry.nested_calls( advertising_entry.own_data()['_producer_rules'][rule_idx][0] )
+                        self.add_rule( rule_conditions, rule_digest["sort_key"], rule_idx, advertiser_locator )
+        finally:
+            query_index.flush()
+
+
+    def candidate_slots(self, parsed_query):
+        "The rules whose required tags may all be present in the query, in the original walk() order"
+
+        candidate_slots = list( self.untagged_rules )
+        for query_tag in parsed_query.posi_tag_set:
+            candidate_slots.extend( self.rules_by_tag.get(query_tag, []) )
+
+        return sorted( candidate_slots, key=lambda rule_slot: rule_slot[0] )
+
+
+    @staticmethod
+    def advertising_entry(advertiser_locator):
+        collection_entry, entry_name, entry_path_or_object = advertiser_locator
+        if collection_entry is None:
+            return entry_path_or_object
+        else:
+            return collection_entry.get_kernel().bypath(path=entry_path_or_object, name=entry_name, container=collection_entry)
+
+
+class AutoIndex:
+    """The contained entries of an auto-indexing collection (one without a contained_entries dictionary of its own),
+        found by scanning the collection's directory: every subdirectory is an entry, as in ufun.generate_index().
+
+        The scan persists in the collection's .auto_index_axs/ together with the directory's mtime,
+        so the directory is only listed again (with os.scandir) once its mtime has changed.
+        Changes within an entry do not concern the index, they are noticed by the Entry itself.
+        The generation counts the changes of the entry set within this process.
+    """
+
+    DIRNAME_auto_index  = '.auto_index_axs'
+    FILENAME_auto_index = 'contained_entries.json'
+    FORMAT_version      = 2
+    RACY_mtime_ns       = 2 * 10**9     # a directory changed so recently may still change within the same mtime tick, so its mtime is not trusted
+
+    _collection_indices = {}    # shared by all the collections of this process, keyed by collection path
+
+    def __init__(self, collection_path):
+        self.collection_path    = collection_path
+        self.index_path         = os.path.join(collection_path, self.DIRNAME_auto_index, self.FILENAME_auto_index)
+        self.generation         = 0
+        self.entries_cache      = {}    # is_work_collection -> contained_entries
+        self.dirty              = False
+        self.lock               = threading.RLock()
+
+        try:
+            stored_index = ufun.load_json( self.index_path )
+        except OSError:
+            stored_index = {}
+
+        if stored_index.get("format")==self.FORMAT_version:
+            self.dir_mtime      = stored_index.get("dir_mtime")
+            self.entry_names    = stored_index.get("entry_names", [])
+        else:
+            self.dir_mtime      = None
+            self.entry_names    = []    # the names of the subdirectories, in the order of listing
+
+
+    @classmethod
+    def for_collection(cls, collection_entry):
+        collection_path = collection_entry.get_path()
+        auto_index      = cls._collection_indices.get(collection_path)
+        if auto_index is None:
+            auto_index = cls._collection_indices.setdefault( collection_path, cls(collection_path) )
+        return auto_index
+
+
+    def refresh(self):
+        "Re-scan the directory if it has changed. Returns the generation"
+
+        with self.lock:
+            try:
+                dir_mtime = os.stat( self.collection_path ).st_mtime_ns
+            except OSError:
+                dir_mtime = None
+
+            if dir_mtime is None or dir_mtime!=self.dir_mtime:
+                try:
+                    entry_names = list( ufun.generate_index( self.collection_path ) )
+                except OSError as e:
+                    logging.warning(f"Could not scan the auto-indexing collection {self.collection_path}: {e}")
+                    entry_names = []
 
+                trusted_mtime       = dir_mtime if (dir_mtime and time.time_ns()-dir_mtime > self.RACY_mtime_ns) else None
+                changed             = set(entry_names)!=set(self.entry_names)
+                self.dirty          = self.dirty or entry_names!=self.entry_names or trusted_mtime!=self.dir_mtime
+                self.entry_names    = entry_names
+                self.dir_mtime      = trusted_mtime
 
-def all_byquery(query, pipeline=None, template=None, parent_recursion=False, skip_entry_names=None, __entry__=None):
+                if changed:
+                    self.generation += 1
+                    self.entries_cache.clear()
+
+                self.flush()
+
+            return self.generation
+
+
+    def contained_entries(self, collection_entry):
+        "An index structure compatible with contained_entries, up to date with the directory"
+
+        self.refresh()
+
+        is_work_collection  = detect_work_collection( collection_entry )
+        contained_entries   = self.entries_cache.get( is_work_collection )
+        if contained_entries is None:
+            contained_entries = { "core_collection": collection_entry.get_kernel().core_collection().get_path() } if is_work_collection else {}
+            contained_entries.update( (entry_name, entry_name) for entry_name in self.entry_names )
+            self.entries_cache[is_work_collection] = contained_entries
+
+        return contained_entries
+
+
+    def flush(self):
+        "Atomically store the index if it has changed (quietly giving up on read-only collections). Its own directory keeps the collection's mtime intact"
+
+        with self.lock:
+            if self.dirty:
+                temp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    os.makedirs( os.path.dirname(self.index_path), exist_ok=True )
+                    ufun.save_json( {"format": self.FORMAT_version, "dir_mtime": self.dir_mtime, "entry_names": self.entry_names}, temp_path )
+                    os.replace( temp_path, self.index_path )
+                    self.dirty = False
+                except OSError as e:
+                    logging.debug(f"Could not store the auto index of {self.collection_path}: {e}")
+                    if os.path.exists( temp_path ):
+                        os.remove( temp_path )
+
+
+class NameIndex:
+    """A session-wide map from entry names to their locations within a collection tree, built lazily on the first byname().
+
+        Each location is either (container_entry, relative_entry_path) or (None, entry_object) for non-filesystem entries.
+        As in walk(), the first occurrence of a name wins. The index of a nested collection is built once and shared
+        by all the indices of the collections that contain it. Attaching and detaching entries updates the indices
+        incrementally, while auto-indexing collections are re-checked via their AutoIndex.
+    """
+
+    _collection_indices = {}    # keyed by collection path
+
+    def __init__(self, collection_entry):
+        self.locations      = {}
+        self.covered_paths  = set()     # the paths of all the collections within this tree
+        self.volatile_dirs  = {}        # auto-indexing collection path -> its AutoIndex and that index's generation at the time of scanning
+
+        self.scan_collection( collection_entry )
+
+
+    @classmethod
+    def for_collection(cls, collection_entry):
+        collection_path = collection_entry.get_path()
+        name_index      = cls._collection_indices.get(collection_path)
+        if name_index is None or not name_index.is_fresh():
+            name_index = cls._collection_indices[collection_path] = cls(collection_entry)
+        return name_index
+
+
+    @classmethod
+    def invalidate(cls, collection_path):
+        "Drop the indices of all the collection trees that contain the given collection"
+
+        for indexed_path in [ p for p, name_index in cls._collection_indices.items() if collection_path in name_index.covered_paths ]:
+            logging.debug(f"Invalidating the name index of {indexed_path}")
+            del cls._collection_indices[indexed_path]
+
+
+    @classmethod
+    def entry_attached(cls, collection_entry, entry_name, relative_entry_path, is_collection):
+        collection_path = collection_entry.get_path()
+
+        if is_collection:                   # its whole subtree becomes reachable
+            cls.invalidate( collection_path )
+            return
+
+        for name_index in cls._collection_indices.values():
+            if collection_path in name_index.covered_paths and entry_name not in name_index.locations:
+                name_index.locations[entry_name] = (collection_entry, relative_entry_path)
+
+
+    @classmethod
+    def entry_detached(cls, collection_entry, entry_name):
+        collection_path = collection_entry.get_path()
+
+        for name_index in cls._collection_indices.values():
+            if collection_path in name_index.covered_paths and entry_name in name_index.locations:
+                cls.invalidate( collection_path )   # another entry with the same name may be uncovered further down the tree
+                return
+
+
+    def is_fresh(self):
+        for auto_index, scanned_generation in self.volatile_dirs.values():
+            if auto_index.refresh() != scanned_generation:
+                return False
+        return True
+
+
+    def scan_collection(self, collection_entry):
+        collection_path = collection_entry.get_path()
+        ak              = collection_entry.get_kernel()
+
+        self.locations.setdefault( collection_entry.get_name(), (None, collection_entry) )
+        self.covered_paths.add( collection_path )
+        if collection_entry.get("auto_index"):
+            auto_index = AutoIndex.for_collection( collection_entry )
+            self.volatile_dirs[collection_path] = (auto_index, auto_index.refresh())
+
+        query_index         = QueryIndex.for_collection( collection_entry )
+        contained_entries   = fresh_contained_entries( collection_entry )
+        try:
+            for entry_name, entry_value in list( contained_entries.items() ):
+                if type(entry_value)!=str:
+                    self.locations.setdefault( entry_value.get_name(), (None, entry_value) )
+
+                elif query_index.is_collection( entry_name, entry_value, collection_entry ):
+                    self.locations.setdefault( entry_name, (collection_entry, entry_value) )
+
+                    contained_collection    = ak.bypath(path=collection_entry.get_path(entry_value), name=entry_name, container=collection_entry)
+                    nested_index            = NameIndex.for_collection( contained_collection )
+                    for nested_name, nested_location in nested_index.locations.items():
+                        self.locations.setdefault( nested_name, nested_location )
+                    self.covered_paths.update( nested_index.covered_paths )
+                    self.volatile_dirs.update( nested_index.volatile_dirs )
+                    contained_collection.touch('_BEFORE_CODE_LOADING')
+
+                else:
+                    self.locations.setdefault( entry_name, (collection_entry, entry_value) )
+        finally:
+            query_index.flush()
+
+
+    def lookup(self, entry_name):
+        location = self.locations.get( entry_name )
+        if location is None:
+            return None
+
+        container_entry, entry_value = location
+        if container_entry is None:
+            return entry_value
+        else:
+            return container_entry.get_kernel().bypath(path=container_entry.get_path(entry_value), name=entry_name, container=container_entry)
+
+
+def run_plan_on_entry(plan, candidate_entry, on_error='fail_fast', in_worker_thread=False):
+    """An internal method for running all_byquery's compiled pipeline on one matching entry, not to be called directly.
+        Returns (result, seconds, error_or_None).
+    """
+    start_time = time.perf_counter()
+    try:
+        if in_worker_thread:
+            with WorkerThreadState():
+                result = candidate_entry.execute_plan( plan )
+        else:
+            result = candidate_entry.execute_plan( plan )
+        error = None
+    except Exception as e:
+        if on_error!='collect':
+            raise
+        logging.error(f"all_byquery: the pipeline failed on entry {candidate_entry.get_name()}: {e!r}")
+        result, error = None, e
+
+    return result, time.perf_counter()-start_time, error
+
+
+def all_byquery(query, pipeline=None, template=None, parent_recursion=False, skip_entry_names=None, parallel=None, on_error='fail_fast', timing=False, __entry__=None):
     """Returns a list of ALL entries matching the query.
         Empty list if nothing matched.
 
+        With a pipeline, the results of running it on each matching entry are returned instead (in the order of the entries):
+            --parallel=N        runs the pipeline on up to N entries at a time in worker threads (--parallel+ for one per CPU),
+            --on_error=collect  carries on after a failure, leaving None in place of the failed entry's result
+                                (the default of fail_fast starts no more entries and re-raises the first failure),
+            --timing+           returns a {"entry_name", "result", "seconds"} dictionary per entry (with an "error" if it failed).
+
 Usage examples :
                 axs all_byquery onnx_model
                 axs all_byquery python_package,package_name=pillow
@@ -238,85 +903,124 @@ Usage examples :
                 axs all_byquery python_package --template="python_#{python_version}# package #{package_name}#"
                 axs all_byquery tags. --template="tags=#{tags}#"
                 axs all_byquery git_repo ---='[["pull"]]'
+                axs all_byquery git_repo ---='[["pull"]]' --parallel=8 --on_error=collect --timing+
                 axs all_byquery deleteme+ ---='[["remove"]]'
                 axs all_byquery __completed.,__completed- ---='[["remove"]]'
     """
     assert __entry__ != None, "__entry__ should be defined"
+    assert on_error in ('fail_fast', 'collect'), f"on_error should be either fail_fast or collect, not {on_error}"
 
     parsed_query        = FilterPile( query, "Query" )
+    plan                = pipeline_plan.compile_pipeline( pipeline ) if pipeline else None     # compiled once, executed per matching entry
+    max_workers         = (os.cpu_count() or 1) if parallel is True else int(parallel or 1)
 
     # trying to match the Query in turn against each existing and walkable entry, gathering them all:
-    result_list = []
-    for candidate_entry in walk(__entry__, skip_entry_names):
-        if parsed_query.matches_entry( candidate_entry, parent_recursion ):
-            if pipeline:
-                single_result = candidate_entry.execute(pipeline)
-            elif template is not None:
-                single_result = str(candidate_entry.substitute(template))
-            else:
-                single_result = candidate_entry
-
-            result_list.append( single_result )
-
-    if template is not None:
-        return "\n".join( result_list )
+    matching_entries    = ( candidate_entry for candidate_entry in walk(__entry__, skip_entry_names, None if parent_recursion else parsed_query)
+                                            if parsed_query.matches_entry( candidate_entry, parent_recursion ) )
+    if plan is None:
+        if template is not None:
+            return "\n".join( str(candidate_entry.substitute(template)) for candidate_entry in matching_entries )
+        else:
+            return list( matching_entries )
+
+    outcomes, entry_names = [], []      # outcomes are (result, seconds, error) triplets
+    if max_workers>1:
+        failure_seen = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor( max_workers=max_workers, thread_name_prefix='all_byquery' ) as executor:
+            futures = []
+            for candidate_entry in matching_entries:
+                if failure_seen.is_set():
+                    break       # fail fast: no more entries are started
+                future = executor.submit( run_plan_on_entry, plan, candidate_entry, on_error, True )
+                future.add_done_callback( lambda f: not f.cancelled() and f.exception() and failure_seen.set() )
+                futures.append( future )
+                entry_names.append( candidate_entry.get_name() )
+
+            concurrent.futures.wait( futures, return_when=concurrent.futures.FIRST_EXCEPTION )
+            failed_futures = [ f for f in futures if f.done() and not f.cancelled() and f.exception() ]
+            if failed_futures:      # only possible when failing fast
+                for f in futures:
+                    f.cancel()
+                raise failed_futures[0].exception()
+
+            outcomes = [ f.result() for f in futures ]
     else:
-        return result_list
+        for candidate_entry in matching_entries:
+            outcomes.append( run_plan_on_entry( plan, candidate_entry, on_error ) )
+            entry_names.append( candidate_entry.get_name() )
+
+    if timing:
+        return [ { "entry_name": entry_name, "result": result, "seconds": round(seconds, 6), **({ "error": repr(error) } if error else {}) }
+                    for entry_name, (result, seconds, error) in zip(entry_names, outcomes) ]
+    elif template is not None:
+        return "\n".join( result for result, _, _ in outcomes )
+    else:
+        return [ result for result, _, _ in outcomes ]
 
 
-def find_matching_rules(parsed_query, __entry__):
-    """An internal method for finding matching rules given a query, not to be called directly
+def rule_matches_query(parsed_rule, parsed_query):
+    """An internal method for matching a parsed rule against a parsed query in both directions, not to be called directly
     """
-    matching_rules = []
-    for advertising_entry in walk(__entry__):
-        for unprocessed_rule in advertising_entry.own_data().get('_producer_rules', []):        # block processing some params until they are really needed
-            parsed_rule     = FilterPile( advertising_entry.nested_calls( unprocessed_rule[0] ), f"Entry: {advertising_entry.get_name()}" )
+    if not parsed_rule.posi_tag_set.issubset(parsed_query.posi_tag_set):    # FIXME:  parsed_rule.posi_tag_set should include it
+        return False
 
-            if parsed_rule.posi_tag_set.issubset(parsed_query.posi_tag_set):  # FIXME:  parsed_rule.posi_tag_set should include it
-                qr_conditions_ok  = True
+    qr_conditions_ok  = True
 
-                # first - matching rule's conditions against query's values:
-                for key_path, op, rule_val, rule_comparison_lambda, _ in parsed_rule.filter_list:
+    # first - matching rule's conditions against query's values:
+    for key_path, op, rule_val, rule_comparison_lambda, _ in parsed_rule.filter_list:
 
-                    if op=='tag+':  # we have matched them directly above
-                        continue
+        if op=='tag+':  # we have matched them directly above
+            continue
 
-                    elif op=='tag-':  # rule doesn't want the query to contain a certain tag
-                        qr_conditions_ok = rule_val not in parsed_query.posi_tag_set
+        elif op=='tag-':  # rule doesn't want the query to contain a certain tag
+            qr_conditions_ok = rule_val not in parsed_query.posi_tag_set
 
-                    elif op=='-:':
-                        qr_conditions_ok = rule_comparison_lambda( list(parsed_query.posi_tag_set) )
+        elif op=='-:':
+            qr_conditions_ok = rule_comparison_lambda( list(parsed_query.posi_tag_set) )
 
-                    # we allow (only) equalities on the rule side not to have a match on the query side
-                    elif (key_path in parsed_query.posi_val_dict):    # does the query contain a specific value for this rule condition's key_path?
-                        qr_conditions_ok = rule_comparison_lambda( parsed_query.posi_val_dict[key_path] )       # if so, use this value in evaluating this rule condition
-                    else:
-                        qr_conditions_ok = (((op=='?=') and (key_path not in parsed_query.mentioned_set)) or    # ignore optional(selective) matches
-                                            ((op=='!.') and (key_path not in parsed_query.mentioned_set)) or
-                                            ((op=='=') and (key_path in parsed_query.mentioned_set)))           # otherwise if this rule condition sets a value, the query should have a corresponding condition to check (later)
+        # we allow (only) equalities on the rule side not to have a match on the query side
+        elif (key_path in parsed_query.posi_val_dict):    # does the query contain a specific value for this rule condition's key_path?
+            qr_conditions_ok = rule_comparison_lambda( parsed_query.posi_val_dict[key_path] )       # if so, use this value in evaluating this rule condition
+        else:
+            qr_conditions_ok = (((op=='?=') and (key_path not in parsed_query.mentioned_set)) or    # ignore optional(selective) matches
+                                ((op=='!.') and (key_path not in parsed_query.mentioned_set)) or
+                                ((op=='=') and (key_path in parsed_query.mentioned_set)))           # otherwise if this rule condition sets a value, the query should have a corresponding condition to check (later)
 
-                    if not qr_conditions_ok: break
+        if not qr_conditions_ok: break
 
-                if qr_conditions_ok:
-                    # then - matching query's conditions against rule's values:
-                    for key_path, op, query_val, query_comparison_lambda, _ in parsed_query.filter_list:
+    if qr_conditions_ok:
+        # then - matching query's conditions against rule's values:
+        for key_path, op, query_val, query_comparison_lambda, _ in parsed_query.filter_list:
 
-                        if op=='tag+' or op=='-:': continue     # we have matched them above
+            if op=='tag+' or op=='-:': continue     # we have matched them above
 
-                        if op=='tag-':  # query doesn't want the rule to contain a certain tag
-                            qr_conditions_ok = query_val not in parsed_rule.posi_tag_set
-                            break
+            if op=='tag-':  # query doesn't want the rule to contain a certain tag
+                qr_conditions_ok = query_val not in parsed_rule.posi_tag_set
+                break
 
-                        # we allow (only) equalities on the query side not to have a match on the rule side
-                        elif (key_path in parsed_rule.posi_val_dict): # does the rule contain a specific value for this query condition's key_path?
-                            qr_conditions_ok = query_comparison_lambda( parsed_rule.posi_val_dict[key_path] )   # if so, use this value in evaluating this query condition
-                        else:
-                            qr_conditions_ok = (op=='=')                                                        # otherwise this query condition must set a value
+            # we allow (only) equalities on the query side not to have a match on the rule side
+            elif (key_path in parsed_rule.posi_val_dict): # does the rule contain a specific value for this query condition's key_path?
+                qr_conditions_ok = query_comparison_lambda( parsed_rule.posi_val_dict[key_path] )   # if so, use this value in evaluating this query condition
+            else:
+                qr_conditions_ok = (op=='=')                                                        # otherwise this query condition must set a value
+
+            if not qr_conditions_ok: break
 
-                        if not qr_conditions_ok: break
+    return qr_conditions_ok
+
+
+def find_matching_rules(parsed_query, __entry__):
+    """An internal method for finding matching rules given a query, not to be called directly
+    """
+    with tracing.Span("find_matching_rules", entry=__entry__.get_name(), query=parsed_query.conditions):
+        rule_table = RuleTable.for_collection(__entry__)
 
-                if qr_conditions_ok:
-                    matching_rules.append( (advertising_entry, unprocessed_rule, parsed_rule) )
+        matching_rules = []
+        for _, sort_key, rule_idx, parsed_rule, advertiser_locator in rule_table.candidate_slots(parsed_query):
+            if rule_matches_query(parsed_rule, parsed_query):
+                advertising_entry   = rule_table.advertising_entry( advertiser_locator )
+                unprocessed_rule    = advertising_entry.own_data()['_producer_rules'][rule_idx]
+                matching_rules.append( (advertising_entry, unprocessed_rule, parsed_rule) )
 
     return sorted( matching_rules, key = lambda x: len(x[1][0]), reverse=True)
 
@@ -337,6 +1041,102 @@ Usage examples :
     return len(matching_rules)
 
 
+def explain_query(query, parent_recursion=False, skip_entry_names=None, __entry__=None):
+    """Explain how byquery() would resolve the query, without producing anything:
+            which entry it would pick (and which other ones match, or match but are incomplete),
+            how many entries were visited, skipped thanks to the QueryIndex, loaded from disk or taken from the entry_cache,
+            which condition rejected each candidate (and how many candidates each condition rejected),
+            the time spent walking and matching per nested collection, whether the collections are auto-indexed,
+            and which producer rules were considered (would a producer be run, which rule would be tried first).
+
+Usage examples :
+                axs explain_query shell_tool,can_download_url
+                axs work_collection , explain_query python_package,package_name=numpy --parent_recursion+
+    """
+    def describe_condition(key_path, op, val):
+        if op in ('tag+', 'tag-'):
+            return val if op=='tag+' else '!'+val
+        else:
+            return f"{key_path}{op}{'' if val is None else val}"
+
+    parsed_query    = FilterPile( query, "Query" )
+    conditions      = [ describe_condition( key_path, op, val ) for key_path, op, val, _, _ in parsed_query.filter_list ]
+    rejections      = dict.fromkeys( conditions, 0 )
+    rejected        = {}    # entry_name -> the condition that rejected it
+    matching        = []
+    incomplete      = []
+    chosen_entry    = None
+    explanation     = {}    # collection_name -> its walk() stats
+    start_time      = time.perf_counter()
+
+    for candidate_entry in walk(__entry__, skip_entry_names, None if parent_recursion else parsed_query, explanation):
+        match_start     = time.perf_counter()
+        condition_idx   = parsed_query.rejecting_condition_idx( candidate_entry, parent_recursion )
+        candidate_name  = candidate_entry.get_name()
+        if condition_idx is not None:
+            rejections[ conditions[condition_idx] ] += 1
+            rejected[ candidate_name ] = conditions[condition_idx]
+        elif ('__completed' in parsed_query.mentioned_set) or candidate_entry.get('__completed', True):
+            matching.append( candidate_name )
+            chosen_entry = chosen_entry or candidate_entry
+        else:
+            incomplete.append( candidate_name )
+
+        container = getattr( candidate_entry, 'get_container', lambda: None )() or candidate_entry
+        walk_stats = explanation.get( container.get_name() )
+        if walk_stats is not None:
+            walk_stats["matching_seconds"] += time.perf_counter() - match_start
+
+    walking_seconds = time.perf_counter() - start_time
+
+    rules = []
+    if len(parsed_query.posi_tag_set):
+        rule_table_cached   = __entry__.get_path() in RuleTable._session_tables
+        rule_table          = RuleTable.for_collection(__entry__)
+        for _, sort_key, rule_idx, parsed_rule, advertiser_locator in rule_table.candidate_slots(parsed_query):
+            rules.append( { "advertiser": advertiser_locator[1], "rule_idx": rule_idx, "conditions": parsed_rule.conditions,
+                            "sort_key": sort_key, "matches": rule_matches_query(parsed_rule, parsed_query) } )
+        for trial_order, rule in enumerate( sorted( [ rule for rule in rules if rule["matches"] ], key=lambda rule: rule["sort_key"], reverse=True ) ):
+            rule["trial_order"] = trial_order + 1   # the same order as find_matching_rules()
+        rule_table_stats = { "cached": rule_table_cached, "rules_total": rule_table.rule_count, "rules_probed": len(rules) }
+    else:
+        rule_table_stats = None
+
+    if chosen_entry:
+        outcome = f"found {chosen_entry.get_name()}"
+    elif incomplete:
+        outcome = f"found the incomplete {incomplete[0]} (waits for its producer if it is still running, otherwise None)"
+    elif any( rule["matches"] for rule in rules ):
+        first_rule = next( rule for rule in rules if rule.get("trial_order")==1 )
+        outcome = f"would run the producer rule #{first_rule['rule_idx']} of {first_rule['advertiser']}"
+    else:
+        outcome = "nothing found, no matching producer rules"
+
+    return {
+        "query":                    query,
+        "outcome":                  outcome,
+        "chosen_path":              chosen_entry and chosen_entry.get_path(),
+        "matching_entries":         matching,
+        "incomplete_entries":       incomplete,
+        "conditions":               conditions,
+        "rejections_by_condition":  rejections,
+        "rejected_entries":         rejected,
+        "visited":                  sum( walk_stats["visited"] for walk_stats in explanation.values() ),
+        "skipped_by_index":         sum( walk_stats["skipped_by_index"] for walk_stats in explanation.values() ),
+        "loaded":                   sum( walk_stats["loaded"] for walk_stats in explanation.values() ),
+        "entry_cache_hits":         sum( walk_stats["entry_cache_hits"] for walk_stats in explanation.values() ),
+        "query_index_used":         not parent_recursion,
+        "collections":              explanation,
+        "rule_table":               rule_table_stats,
+        "rules_considered":         rules,
+        "seconds":                  walking_seconds,
+    }
+
+
+in_flight_queries   = {}    # query_key -> (owner_thread_ident, Future), the byquery() resolutions currently under way in this process
+in_flight_lock      = threading.Lock()
+
+
 def byquery(query, produce_if_not_found=True, parent_recursion=False, skip_entry_names=None, __entry__=None):
     """Fetch an entry by query over its tags and attributes.
         If the query returns nothing on the first pass, but matching _producer_rules are defined,
@@ -364,60 +1164,132 @@ Usage examples :
         logging.debug(f"[{__entry__.get_name()}] the query was empty => returning None")
         return None
 
+    # queries with the same conditions resolved at the same time by other threads share the result (and the producer run):
+    query_key = ( __entry__, parsed_query.normalized(), parent_recursion, repr(produce_if_not_found), repr(skip_entry_names) )
+    with in_flight_lock:
+        owner_ident, in_flight = in_flight_queries.get( query_key, (None, None) )
+        if in_flight is None:
+            in_flight = concurrent.futures.Future()
+            in_flight_queries[query_key] = ( threading.get_ident(), in_flight )
+
+    if owner_ident==threading.get_ident():  # re-entered by the thread resolving it
+        with tracing.Span("byquery", entry=__entry__.get_name(), query=query):
+            return unshared_byquery( query, parsed_query, produce_if_not_found, parent_recursion, skip_entry_names, __entry__ )
+    elif owner_ident is not None:
+        logging.info(f"[{__entry__.get_name()}] byquery({query}) is already being resolved by another thread, waiting for its result...")
+        metrics.counters["byquery_shared"] += 1
+        with tracing.Span("byquery_wait", entry=__entry__.get_name(), query=query):
+            return in_flight.result()
+
+    try:
+        with tracing.Span("byquery", entry=__entry__.get_name(), query=query):
+            result = unshared_byquery( query, parsed_query, produce_if_not_found, parent_recursion, skip_entry_names, __entry__ )
+        in_flight.set_result( result )
+        return result
+    except BaseException as e:
+        in_flight.set_exception( e )
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight_queries[query_key]
+
+
+def unshared_byquery(query, parsed_query, produce_if_not_found, parent_recursion, skip_entry_names, __entry__=None):
+    """An internal method for resolving a (parsed) query on behalf of byquery(), not to be called directly
+    """
     # trying to match the Query in turn against each existing and walkable entry, first match returns:
-    for candidate_entry in walk(__entry__, skip_entry_names):
+    for candidate_entry in walk(__entry__, skip_entry_names, None if parent_recursion else parsed_query):
         if parsed_query.matches_entry( candidate_entry, parent_recursion ):
             if ( ('__completed' in parsed_query.mentioned_set)  # if __completed is part of the query and it matched, honour that match.
                 or candidate_entry.get('__completed', True) ):  # either explicitly completed, or not carrying this attribute at all, probably a static Entry
+                    metrics.counters["byquery_hits"] += 1
                     return candidate_entry
             else:
-                logging.info(f"[{__entry__.get_name()}] byquery({query}) found incomplete Entry {candidate_entry.get_name()} in {candidate_entry.get_path()} , which may either be in progress or dead - PLEASE INVESTIGATE")
-                return None     # FIXME: we cannot yet distinguish between a botched installation and a still-running one
+                producer_lock   = ProducerLock( __entry__.get_path(), parsed_query.normalized(), query )
+                producer_owner  = producer_lock.live_owner()
+                if producer_owner is not None:
+                    logging.info(f"[{__entry__.get_name()}] byquery({query}) found incomplete Entry {candidate_entry.get_name()} in {candidate_entry.get_path()} , which is still being produced by {producer_owner} , waiting for it...")
+                    producer_lock.wait_for_release()
+                    reload_if_changed( __entry__ )
+                    return unshared_byquery( query, parsed_query, produce_if_not_found, parent_recursion, skip_entry_names, __entry__ )
+                else:
+                    logging.info(f"[{__entry__.get_name()}] byquery({query}) found incomplete Entry {candidate_entry.get_name()} in {candidate_entry.get_path()} , which nobody is producing, so it must be dead - PLEASE INVESTIGATE")
+                    return None
 
     # if a matching entry does not exist, see if we can produce it with a matching Rule
     if produce_if_not_found and len(parsed_query.posi_tag_set):
         logging.info(f"[{__entry__.get_name()}] byquery({query}) did not find anything, but there are tags: {parsed_query.posi_tag_set} , trying to find a producer...")
 
-        matching_rules = find_matching_rules(parsed_query, __entry__)
-        logging.info(f"[{__entry__.get_name()}] A total of {len(matching_rules)} matched rules found.\n")
-
-        match_idx = 0
-        for advertising_entry, unprocessed_rule, parsed_rule in matching_rules:
-            match_idx += 1  # matches are 1-based
-            logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)}: {unprocessed_rule[0]} from Entry '{advertising_entry.get_name()}'...")
+        with ProducerLock( __entry__.get_path(), parsed_query.normalized(), query ) as producer_lock:
+            if producer_lock.waited:    # somebody else has been producing it meanwhile, so it may be there already
+                reload_if_changed( __entry__ )
+                found_entry = unshared_byquery( query, parsed_query, False, parent_recursion, skip_entry_names, __entry__ )
+                if found_entry:
+                    logging.info(f"[{__entry__.get_name()}] byquery({query}) reuses {found_entry.get_name()} produced by another process")
+                    return found_entry
 
-            rule_vector         = advertising_entry.nested_calls(unprocessed_rule)
-            producer_pipeline   = rule_vector[1]
-            extra_params        = rule_vector[2] if len(rule_vector)>2 else {}
-            export_params       = rule_vector[3] if len(rule_vector)>3 else []
+            return produce_by_rules( query, parsed_query, produce_if_not_found, parent_recursion, __entry__ )
 
-            cumulative_params = advertising_entry.slice( *export_params )   # default slice
-            cumulative_params["__query"] = query                            # NB: unparsed query in its original format, DANGER!
-
-            if parsed_rule.masking_tag_map or parsed_query.masking_tag_map:     # either kind of query masking
-                modified_query = query
+    else:
+        logging.debug(f"[{__entry__.get_name()}] byquery({query}) did not find anything, and no matching _producer_rules => returning None")
+        metrics.counters["byquery_misses"] += 1
+        return None
 
-                for masking_tag, masked in sorted((parsed_rule.masking_tag_map | parsed_query.masking_tag_map).items(), key=lambda kv: len(kv[0]), reverse=True):
-                    replace_from    = masking_tag + ( '-:'+masked if masking_tag in parsed_query.masking_tag_map else '' )
-                    replace_to      = masking_tag + ',' + masked
-                    modified_query = modified_query.replace(replace_from, replace_to)
 
-                cumulative_params["__modified_query"] = modified_query
+def reload_if_changed(collection_entry):
+    """An internal method for picking up the entries that other processes have added to the collection meanwhile, not to be called directly
+    """
+    if collection_entry.is_stale():
+        logging.info(f"[{collection_entry.get_name()}] has been changed by another process, reloading it")
+        collection_entry.reload()
+        NameIndex.invalidate( collection_entry.get_path() )
 
-                parsed_modified_query = FilterPile( modified_query, "ModQuery" )
-                # FIXME: make sure this is not too strong an assumption - that the advertising entry is usually the execution one...
-                cumulative_params["__modq_advertising_entry"] = find_matching_rules(parsed_modified_query, __entry__)[0][0]
 
-            cumulative_params.update( parsed_rule.opti_val_dict )           # optional matches on top (may override some defaults)
-            cumulative_params.update( deepcopy( extra_params ) )            # extra_params on top (may override some defaults)
-            cumulative_params.update( parsed_rule.posi_val_dict )           # rules on top (may override some defaults)
-            cumulative_params.update( parsed_query.posi_val_dict )          # query on top (may override some defaults)
-            cumulative_params["tags"] = list(parsed_query.posi_tag_set)     # FIXME:  parsed_rule.posi_tag_set should include it
-            if type(produce_if_not_found)==dict:
-                cumulative_params.update( produce_if_not_found )            # highest priority override only in case there was no match and we are generating
-            cumulative_params["__cumulative_param_names"] = list( cumulative_params.keys() )
-            logging.info(f"Pipeline: {producer_pipeline}, Cumulative params: {cumulative_params}")
+def produce_by_rules(query, parsed_query, produce_if_not_found, parent_recursion, __entry__=None):
+    """An internal method for trying the matching producer rules in turn on behalf of byquery(), not to be called directly
+    """
+    matching_rules = find_matching_rules(parsed_query, __entry__)
+    logging.info(f"[{__entry__.get_name()}] A total of {len(matching_rules)} matched rules found.\n")
 
+    match_idx = 0
+    for advertising_entry, unprocessed_rule, parsed_rule in matching_rules:
+        match_idx += 1  # matches are 1-based
+        logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)}: {unprocessed_rule[0]} from Entry '{advertising_entry.get_name()}'...")
+
+        rule_vector         = advertising_entry.nested_calls(unprocessed_rule)
+        producer_pipeline   = rule_vector[1]
+        extra_params        = rule_vector[2] if len(rule_vector)>2 else {}
+        export_params       = rule_vector[3] if len(rule_vector)>3 else []
+
+        cumulative_params = advertising_entry.slice( *export_params )   # default slice
+        cumulative_params["__query"] = query                            # NB: unparsed query in its original format, DANGER!
+
+        if parsed_rule.masking_tag_map or parsed_query.masking_tag_map:     # either kind of query masking
+            modified_query = query
+
+            for masking_tag, masked in sorted((parsed_rule.masking_tag_map | parsed_query.masking_tag_map).items(), key=lambda kv: len(kv[0]), reverse=True):
+                replace_from    = masking_tag + ( '-:'+masked if masking_tag in parsed_query.masking_tag_map else '' )
+                replace_to      = masking_tag + ',' + masked
+                modified_query = modified_query.replace(replace_from, replace_to)
+
+            cumulative_params["__modified_query"] = modified_query
+
+            parsed_modified_query = FilterPile( modified_query, "ModQuery" )
+            # FIXME: make sure this is not too strong an assumption - that the advertising entry is usually the execution one...
+            cumulative_params["__modq_advertising_entry"] = find_matching_rules(parsed_modified_query, __entry__)[0][0]
+
+        cumulative_params.update( parsed_rule.opti_val_dict )           # optional matches on top (may override some defaults)
+        cumulative_params.update( deepcopy( extra_params ) )            # extra_params on top (may override some defaults)
+        cumulative_params.update( parsed_rule.posi_val_dict )           # rules on top (may override some defaults)
+        cumulative_params.update( parsed_query.posi_val_dict )          # query on top (may override some defaults)
+        cumulative_params["tags"] = list(parsed_query.posi_tag_set)     # FIXME:  parsed_rule.posi_tag_set should include it
+        if type(produce_if_not_found)==dict:
+            cumulative_params.update( produce_if_not_found )            # highest priority override only in case there was no match and we are generating
+        cumulative_params["__cumulative_param_names"] = list( cumulative_params.keys() )
+        logging.info(f"Pipeline: {producer_pipeline}, Cumulative params: {cumulative_params}")
+
+        metrics.counters["producer_runs"] += 1
+        with tracing.Span("rule", entry=advertising_entry.get_name(), rule=unprocessed_rule[0], match=match_idx):
             if type(producer_pipeline[0])==list:
                 new_entry = advertising_entry.execute(producer_pipeline, cumulative_params)
             elif len(producer_pipeline)<3:
@@ -428,30 +1300,32 @@ Usage examples :
             else:
                 raise SyntaxError(f"Rule parsing error: a single-call action with its own named parameters is ambiguous: {producer_pipeline}")
 
-            if new_entry:
-                if not isinstance(new_entry, type(__entry__)):
-                    raise RuntimeError( f"Matched Rule #{match_idx}/{len(matching_rules)} produced something ( {repr(new_entry)} ), which is not an Entry - PLEASE INVESTIGATE" )
-                elif parsed_query.matches_entry( new_entry, parent_recursion ):
-                    logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)} produced an entry, which matches the original query, finalizing...\n")
-                    if not new_entry.get("__completed", True):
-                        new_entry.save( on_collision="force", completed=ufun.generate_current_timestamp() )   # we expect a collision
-                    return new_entry
-                else:
-                    raise RuntimeError( f"Matched Rule #{match_idx}/{len(matching_rules)} produced an entry, but it failed to match the original query {query} - PLEASE INVESTIGATE" )
+        if new_entry:
+            if not isinstance(new_entry, type(__entry__)):
+                raise RuntimeError( f"Matched Rule #{match_idx}/{len(matching_rules)} produced something ( {repr(new_entry)} ), which is not an Entry - PLEASE INVESTIGATE" )
+            elif parsed_query.matches_entry( new_entry, parent_recursion ):
+                logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)} produced an entry, which matches the original query, finalizing...\n")
+                if not new_entry.get("__completed", True):
+                    new_entry.save( on_collision="force", completed=ufun.generate_current_timestamp() )   # we expect a collision
+                return new_entry
             else:
-                logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)} didn't produce a result, {len(matching_rules)-match_idx} more matched rules to try...\n")
+                raise RuntimeError( f"Matched Rule #{match_idx}/{len(matching_rules)} produced an entry, but it failed to match the original query {query} - PLEASE INVESTIGATE" )
+        else:
+            logging.info(f"Matched Rule #{match_idx}/{len(matching_rules)} didn't produce a result, {len(matching_rules)-match_idx} more matched rules to try...\n")
 
-    else:
-        logging.debug(f"[{__entry__.get_name()}] byquery({query}) did not find anything, and no matching _producer_rules => returning None")
-        return None
+    metrics.counters["byquery_misses"] += 1     # no rule has produced anything
 
 
-def byqueries(*queries, produce_if_not_found=True, parent_recursion=False, skip_entry_names=None, __entry__=None):
-    """Fetch an array of entries, each by a query over its tags and attributes.
+def byqueries(*queries, produce_if_not_found=True, parent_recursion=False, skip_entry_names=None, parallel=False, __entry__=None):
+    """Fetch an array of entries, each by a query over its tags and attributes (in the order of the queries).
         Each query is either resolved against the collection (and its descendents), or an attempt to manufacture is made, see buquery()
 
+        The distinct queries are resolved in turn, or concurrently in worker threads with --parallel (all at once) or --parallel=N (up to N at a time),
+        while the queries that normalize to the same conditions are only resolved once.
+
 Usage examples :
             axs work_collection , byqueries python_package,package_name=six python_package,package_name=shortuuid
+            axs work_collection , byqueries python_package,package_name=six python_package,package_name=shortuuid --parallel
 
         # or directly via kernel (assumes work_collection as the starting collection) :
             axs byqueries python_package,package_name=six python_package,package_name=shortuuid
@@ -461,11 +1335,29 @@ Usage examples :
     if type(queries[0])==tuple: # this ugly type substitution is needed for inferfacing with the kernel. Should hopefully be gone in 0.3.x
         queries = queries[0]
 
-    results = []
+    unique_queries, unique_positions, query_positions = [], {}, []  # the first query per normalized conditions is the one resolved
     for query in queries:
-        results.append( byquery(query, produce_if_not_found=produce_if_not_found, parent_recursion=parent_recursion, skip_entry_names=skip_entry_names, __entry__=__entry__) )
+        position = unique_positions.setdefault( FilterPile( query, "Query" ).normalized(), len(unique_queries) )
+        if position==len(unique_queries):
+            unique_queries.append( query )
+        query_positions.append( position )
+
+    def resolve(query, in_worker_thread=False):
+        if in_worker_thread:
+            with WorkerThreadState():
+                return byquery(query, produce_if_not_found=produce_if_not_found, parent_recursion=parent_recursion, skip_entry_names=skip_entry_names, __entry__=__entry__)
+        else:
+            return byquery(query, produce_if_not_found=produce_if_not_found, parent_recursion=parent_recursion, skip_entry_names=skip_entry_names, __entry__=__entry__)
+
+    max_workers = len(unique_queries) if parallel is True else min( len(unique_queries), int(parallel or 1) )
+    if max_workers>1:
+        with concurrent.futures.ThreadPoolExecutor( max_workers=max_workers, thread_name_prefix='byqueries' ) as executor:
+            futures         = [ executor.submit( resolve, query, True ) for query in unique_queries ]
+            unique_results  = [ f.result() for f in futures ]   # NB: the first failure (in the order of the queries) is re-raised once all are done
+    else:
+        unique_results  = [ resolve(query) for query in unique_queries ]
 
-    return results
+    return [ unique_results[position] for position in query_positions ]
 
 
 def add_entry_path(new_entry_path, new_entry_name=None, auto_index=False, __entry__=None):
@@ -486,9 +1378,13 @@ def add_entry_path(new_entry_path, new_entry_name=None, auto_index=False, __entr
                 logging.warning(f"The entry {existing_rel_path} has already been attached to the {__entry__.get_name()} collection, skipping")
             else:
                 raise(KeyError(f"There was already another entry named {new_entry_name} with path {existing_rel_path}, remove it first"))
+            saved_collection = None
         else:
-            __entry__.plant(["contained_entries", new_entry_name], trimmed_new_entry_path)
-            return __entry__.save( on_collision="force", completed=ufun.generate_current_timestamp() )   # we expect a collision
+            saved_collection = __entry__.journal_contained_entry( new_entry_name, trimmed_new_entry_path )
+
+        is_collection = refresh_index_record(new_entry_path, new_entry_name, trimmed_new_entry_path, __entry__)
+        NameIndex.entry_attached(__entry__, new_entry_name, trimmed_new_entry_path, is_collection)
+        return saved_collection
 
 
 def remove_entry_name(old_entry_name, auto_index, __entry__):
@@ -498,8 +1394,60 @@ def remove_entry_name(old_entry_name, auto_index, __entry__):
     if auto_index:
         logging.warning(f"The collection {__entry__.get_name()} is auto-indexing, so the request to remove {old_entry_name} was skipped")
     else:
-        contained_entries       = __entry__.pluck(["contained_entries", old_entry_name])
-        return __entry__.save( on_collision="force", completed=ufun.generate_current_timestamp() )   # we expect a collision
+        saved_collection        = __entry__.journal_contained_entry( old_entry_name )
+        QueryIndex.for_collection(__entry__).forget( old_entry_name )
+        NameIndex.entry_detached(__entry__, old_entry_name)
+        return saved_collection
+
+
+def refresh_index_record(entry_path, entry_name, relative_entry_path, __entry__):
+    """Keep the QueryIndex in sync with a (re)saved entry, if it is still in memory (the change is stored by the next walk() or at exit).
+        Returns whether the entry is known to be a collection.
+    """
+    query_index     = QueryIndex.for_collection(__entry__)
+    cached_entry    = __entry__.get_kernel().entry_cache.get( os.path.realpath(entry_path) )
+
+    if cached_entry and cached_entry.own_data_cache is not None:
+        query_index.update(entry_name, relative_entry_path, cached_entry)
+        return 'collection' in cached_entry.own_data().get("tags", [])
+    else:
+        query_index.forget(entry_name)
+        return True     # not sure, so better assume the worst
+
+
+def auto_indexed_entries(__entry__):
+    """The contained_entries of an auto-indexing collection, as found in its directory (see AutoIndex)
+
+Usage examples :
+                axs byname vehicle_collection , auto_indexed_entries
+    """
+    return AutoIndex.for_collection(__entry__).contained_entries(__entry__)
+
+
+def fresh_contained_entries(__entry__):
+    """Unlike the effective_contained_entries parameter (whose value may come from a cache),
+        re-checks the directory of an auto-indexing collection, so that the entries added there by other processes show up.
+
+Usage examples :
+                axs work_collection , fresh_contained_entries
+    """
+    if __entry__.get("auto_index"):
+        return auto_indexed_entries(__entry__)
+    else:
+        return __entry__.get("effective_contained_entries")
+
+
+def forget_session_indices():
+    """Drop the session-wide name indices, rule tables, query indices and auto indices of all the collections,
+        so that they are rebuilt from the file system (used by the daemon once the collections have changed on disk).
+
+Usage examples :
+                axs core_collection , forget_session_indices
+    """
+    NameIndex._collection_indices.clear()
+    RuleTable._session_tables.clear()
+    QueryIndex._collection_indices.clear()
+    AutoIndex._collection_indices.clear()
 
 
 def detect_work_collection(__entry__):
@@ -5,10 +5,11 @@
 """
 
 import logging
-import os
 import subprocess
 import sys
 
+import tracing
+
 
 def subst_run(template, __entry__=None, **rest):
     """Substitute data into a given template and run the resulting shell command in the given environment
@@ -42,10 +43,6 @@ Usage examples:
         shell_cmd = [str(x) for x in shell_cmd]
 
 
-    if in_dir:
-        prev_dir = os.getcwd()
-        os.chdir( in_dir )
-
     if capture_output:
         stdout_target = subprocess.PIPE
     elif errorize_output:
@@ -66,16 +63,20 @@ Usage examples:
     while n_attempts:
         logging.warning(f"shell.run() about to execute (with in_dir={in_dir}, env={env}, capture_output={capture_output}, errorize_output={errorize_output}, capture_stderr={capture_stderr}, split_to_lines={split_to_lines}):\n\t{shell_cmd}\n" + (' '*8 + '^'*len(shell_cmd)) )
 
-        completed_process = subprocess.run(shell_cmd, shell = (type(shell_cmd)!=list), env=env, stdout=stdout_target, stderr=stderr_target)
+        with subprocess.Popen(shell_cmd, shell = (type(shell_cmd)!=list), cwd=in_dir or None, env=env, stdout=stdout_target, stderr=stderr_target) as child_process:
+            with tracing.Span("subprocess", entry=__entry__ and __entry__.get_name(), command=shell_cmd, child_pid=child_process.pid):    # the child's pid, to correlate with system profilers
+                try:
+                    stdout_data, stderr_data = child_process.communicate()
+                except BaseException:           # the same clean-up as subprocess.run()
+                    child_process.kill()
+                    raise
+        completed_process = subprocess.CompletedProcess(shell_cmd, child_process.returncode, stdout_data, stderr_data)
         if completed_process.returncode==0:
             break
         else:
             n_attempts-=1
             logging.warning(f"shell.run() failed with return code {completed_process.returncode}, {n_attempts} remaining")
 
-    if in_dir:
-        os.chdir( prev_dir )
-
     if capture_output or capture_stderr:    # FIXME: assuming XOR at the moment
         output  = (completed_process.stderr if capture_stderr else completed_process.stdout).decode('utf-8').rstrip()
 
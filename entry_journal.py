@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""An append-only journal of the changes to a collection's contained_entries, kept next to its data_axs.json,
+    so that attaching or detaching an entry costs one appended line instead of rewriting the whole collection.
+
+    Every line is a JSON record, either {"add": entry_name, "path": relative_entry_path} or {"remove": entry_name}.
+    Readers merge the journal into the loaded contained_entries; saving the collection compacts the journal into data_axs.json.
+
+    Appending and compacting hold an exclusive advisory lock of the journal file, reading holds a shared one,
+    so concurrent processes never lose each other's lines, and nobody reads data_axs.json halfway through compaction.
+
+    The behaviour can be tuned via the environment:
+        AXS_JOURNAL_COMPACT_LINES       (compact the journal once it grows to this many lines, default 1000, 0 for never)
+
+Usage examples :
+                python3 entry_journal.py
+"""
+
+import contextlib
+import json
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:     # no advisory locks on this platform (e.g. Windows), appends still stay atomic
+    fcntl = None
+
+from call_cache import env_limit
+
+
+class EntryJournal:
+    "The journal file of one collection"
+
+    FILENAME_journal    = 'contained_entries_axs.jsonl'
+    compact_lines       = env_limit('AXS_JOURNAL_COMPACT_LINES', 1000)
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+
+
+    @contextlib.contextmanager
+    def locked(self, exclusive=False, create=False):
+        "Open the journal and hold its lock; yields the file descriptor, or None if there is no journal (and create is off)"
+
+        try:
+            journal_fd = os.open( self.journal_path, (os.O_RDWR | os.O_APPEND | os.O_CREAT) if create else (os.O_RDWR if exclusive else os.O_RDONLY), 0o644 )
+        except FileNotFoundError:
+            yield None
+            return
+
+        try:
+            if fcntl:
+                fcntl.flock( journal_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH )
+            yield journal_fd
+        finally:
+            os.close( journal_fd )      # also releases the lock
+
+
+    @staticmethod
+    def read_records(journal_fd, offset=0):
+        """Parse the complete lines from the given offset on.
+            Returns the records and the offset just past the last complete line (an unterminated tail is left for later).
+        """
+        os.lseek( journal_fd, offset, os.SEEK_SET )
+        chunks = []
+        while True:
+            chunk = os.read( journal_fd, 1<<16 )
+            if not chunk:
+                break
+            chunks.append( chunk )
+
+        contents        = b''.join( chunks )
+        complete_length = contents.rfind( b'\n' ) + 1
+        records         = []
+        for line in contents[:complete_length].splitlines():
+            try:
+                records.append( json.loads( line ) )
+            except ValueError as e:
+                logging.warning(f"Skipping a damaged line {line!r} of a journal: {e}")
+
+        return records, offset + complete_length
+
+
+    @staticmethod
+    def append(journal_fd, record):
+        "Append one record as a single write (the fd is opened with O_APPEND). Returns the number of bytes written"
+
+        line = ( json.dumps( record ) + '\n' ).encode()
+        os.write( journal_fd, line )
+        return len(line)
+
+
+    @staticmethod
+    def seal(journal_fd, offset):
+        """Terminate an unfinished line left after the given offset by an interrupted writer,
+            so that the next record starts on a line of its own. Returns the new end offset.
+        """
+        journal_size = os.fstat( journal_fd ).st_size
+        if journal_size > offset:
+            os.write( journal_fd, b'\n' )
+            journal_size += 1
+        return journal_size
+
+
+    @staticmethod
+    def truncate(journal_fd):
+        os.ftruncate( journal_fd, 0 )
+
+
+    @staticmethod
+    def apply_records(contained_entries, records):
+        "Replay the records onto a contained_entries dictionary in place (removing a missing entry is a no-op)"
+
+        for record in records:
+            if "add" in record:
+                contained_entries[ record["add"] ] = record["path"]
+            else:
+                contained_entries.pop( record.get("remove"), None )
+
+        return contained_entries
+
+
+if __name__ == '__main__':
+
+    import multiprocessing
+    import tempfile
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(funcName)s %(message)s")
+
+    journal = EntryJournal( os.path.join( tempfile.mkdtemp(), EntryJournal.FILENAME_journal ) )
+
+    print('-'*20 + ' Appending and replaying: ' + '-'*20)
+
+    with journal.locked() as journal_fd:
+        assert journal_fd is None, "no journal until the first append"
+
+    with journal.locked(exclusive=True, create=True) as journal_fd:
+        EntryJournal.append( journal_fd, {"add": "apple", "path": "apple"} )
+        EntryJournal.append( journal_fd, {"add": "pear", "path": "fruit/pear"} )
+        EntryJournal.append( journal_fd, {"remove": "apple"} )
+        EntryJournal.append( journal_fd, {"remove": "cherry"} )
+
+    with journal.locked() as journal_fd:
+        records, offset = EntryJournal.read_records( journal_fd )
+    assert EntryJournal.apply_records( {"plum": "plum"}, records )=={"plum": "plum", "pear": "fruit/pear"}, "replayed in order"
+    assert offset==os.path.getsize( journal.journal_path ), "all of it consumed"
+
+    with open( journal.journal_path, 'ab' ) as journal_file:
+        journal_file.write( b'{"add": "half' )     # an interrupted writer
+    with journal.locked() as journal_fd:
+        records, new_offset = EntryJournal.read_records( journal_fd, offset )
+    assert records==[] and new_offset==offset, "an unterminated tail is not consumed"
+
+    print('-'*20 + ' Concurrent appends: ' + '-'*20)
+
+    def append_many(process_idx):
+        for i in range(200):
+            with journal.locked(exclusive=True, create=True) as journal_fd:
+                EntryJournal.append( journal_fd, {"add": f"entry_{process_idx}_{i}", "path": f"entry_{process_idx}_{i}"} )
+
+    with journal.locked(exclusive=True) as journal_fd:
+        EntryJournal.truncate( journal_fd )
+
+    writers = [ multiprocessing.Process( target=append_many, args=(process_idx,) ) for process_idx in range(4) ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    with journal.locked() as journal_fd:
+        records, offset = EntryJournal.read_records( journal_fd )
+    assert len( EntryJournal.apply_records( {}, records ) )==800, "no line lost or torn"
@@ -10,12 +10,15 @@ import inspect      # to obtain a random function's signature
 import logging      # for non-obtrusive logging
 import sys          # to obtain Python's version
 
+import tracing      # to skip formatting the debug messages nobody would see
+
 
 def list_function_names(module_like_object):
     """Return the list of functions of a given Module/Class/Namespace
     """
     function_names = [name for name, function_object in inspect.getmembers(module_like_object, inspect.isfunction)]
-    logging.debug(f"Module/Class/Namespace {module_like_object.__name__ if hasattr(module_like_object, '__name__') else ''} contains the following functions: {function_names}")
+    if tracing.debug_enabled:
+        logging.debug(f"Module/Class/Namespace {module_like_object.__name__ if hasattr(module_like_object, '__name__') else ''} contains the following functions: {function_names}")
     return function_names
 
 
@@ -42,78 +45,124 @@ def expected_call_structure(action_object):
     required_arg_names  = supported_arg_names[:num_required]
     optional_arg_names  = supported_arg_names[num_required:]
 
-    logging.debug(f"{action_object.__name__}() required={required_arg_names}, optional={optional_arg_names}, defaults={defaults}, varargs={varargs}, varkw={varkw}")
+    if tracing.debug_enabled:
+        logging.debug(f"{action_object.__name__}() required={required_arg_names}, optional={optional_arg_names}, defaults={defaults}, varargs={varargs}, varkw={varkw}")
     return required_arg_names, optional_arg_names, defaults, varargs, varkw
 
 
-def prep(action_object, given_arg_list, dict_like_object, mapping_used=None):
-    """Prepare to call a given action_object and feed it with arguments from given list and dictionary-like object (must support []).
-
-        The function can be declared as having named args and defaults.
-        *varargs are supported while **kwargs are not.
+class CallBinder:
+    """The pre-split signature of a function, able to map a list and a dictionary-like object onto its call arguments.
+        Built once per function (see binder_for()), since signature introspection is much slower than the binding itself.
     """
 
-    required_arg_names, optional_arg_names, defaults, varargs, varkw = expected_call_structure(action_object)
+    __slots__ = ('action_name', 'required_arg_names', 'optional_arg_names', 'arg_names', 'defaults', 'varargs', 'num_required', 'num_optional')
 
-    # Topping up the list of required positional arguments, or detecting missing ones:
-    num_given                       = len(given_arg_list)
-    num_required                    = len(required_arg_names)
-    listed_optional_names           = []
-    if num_given<num_required:  # some that are required have not been given
-        non_listed_required_arg_names   = required_arg_names[num_given:]
-        if varargs:
-            listed_vararg_values        = tuple()   # just not enough
-    else:
-        non_listed_required_arg_names   = []        # all required have been given
-        if varargs:
-            listed_vararg_values        = given_arg_list[num_required:]
-        else:
-            encroached_number           = num_given-num_required
-            listed_optional_names       = optional_arg_names[:encroached_number]    # these are encroaching into optionals
-            defaults                    = defaults[encroached_number:]
-            optional_arg_names          = optional_arg_names[encroached_number:]    # the rest, still to be taken from the dict-like
-
-    missing_arg_names = []
-    non_listed_required_arg_values  = []
-    for arg_name in non_listed_required_arg_names:  # topping up from the "dictionary"
-        try:
-            non_listed_required_arg_values.append( dict_like_object[arg_name] )
-        except KeyError as e:
-            missing_arg_names.append( arg_name )
+    def __init__(self, action_object):
+        required_arg_names, optional_arg_names, defaults, varargs, varkw = expected_call_structure(action_object)
 
-    if missing_arg_names:
-        raise TypeError( 'The "{}" function is missing required positional arguments: {}'
-                        .format(action_object.__name__, missing_arg_names)
-        )
+        self.action_name        = action_object.__name__
+        self.required_arg_names = tuple(required_arg_names)
+        self.optional_arg_names = tuple(optional_arg_names)
+        self.arg_names          = frozenset(required_arg_names + optional_arg_names)
+        self.defaults           = tuple(defaults)
+        self.varargs            = varargs
+        self.num_required       = len(required_arg_names)
+        self.num_optional       = len(optional_arg_names)
+
+
+    def bind(self, given_arg_list, dict_like_object, mapping_used=None):
+        "Returns the (joint_arg_tuple, optional_arg_dict) pair to call the function with"
+
+        num_given       = len(given_arg_list)
+        num_required    = self.num_required
+        first_optional  = 0                 # the optionals before it have been given positionally
+        joint_arg_tuple = tuple(given_arg_list)
+
+        if num_given<num_required:  # some that are required have not been given, topping up from the "dictionary"
+            missing_arg_names = []
+            non_listed_required_arg_values = []
+            for arg_name in self.required_arg_names[num_given:]:
+                try:
+                    non_listed_required_arg_values.append( dict_like_object[arg_name] )
+                except KeyError:
+                    missing_arg_names.append( arg_name )
+
+            if missing_arg_names:
+                raise TypeError( 'The "{}" function is missing required positional arguments: {}'
+                                .format(self.action_name, missing_arg_names)
+                )
+            joint_arg_tuple += tuple(non_listed_required_arg_values)
+
+        elif not self.varargs:
+            first_optional  = min(num_given-num_required, self.num_optional)   # these are encroaching into optionals
 
-    else:
         # Forming the dictionary of values of optional arguments (taking either a provided value or a default in each case) :
         optional_arg_dict   = {}
-        for opt_idx, arg_name in enumerate(optional_arg_names):
+        defaults            = self.defaults
+        optional_arg_names  = self.optional_arg_names
+        for opt_idx in range(first_optional, self.num_optional):
+            arg_name = optional_arg_names[opt_idx]
             try:
                 optional_arg_dict[arg_name] = dict_like_object[arg_name]
             except KeyError:
                 optional_arg_dict[arg_name] = defaults[opt_idx]
 
-        joint_arg_tuple = (*given_arg_list, *non_listed_required_arg_values)
-
         if mapping_used is not None:
+            self.capture_mapping(given_arg_list, joint_arg_tuple, optional_arg_dict, mapping_used)
+
+        return joint_arg_tuple, optional_arg_dict
+
+
+    def capture_mapping(self, given_arg_list, joint_arg_tuple, optional_arg_dict, mapping_used):
+        "Record the argument name -> value mapping of a call previously bound with bind() into mapping_used"
+
+        num_given       = len(given_arg_list)
+        num_required    = self.num_required
+        first_optional  = 0 if (num_given<num_required or self.varargs) else min(num_given-num_required, self.num_optional)
+
+        mapping_used.update( zip( self.required_arg_names + self.optional_arg_names[:first_optional], joint_arg_tuple) )
+        mapping_used.update( optional_arg_dict )
+        if self.varargs:
+            mapping_used[self.varargs] = given_arg_list[num_required:] if num_given>=num_required else tuple()
+
+        return mapping_used
+
+
+signature_cache = {}    # (function, is_bound_method) -> CallBinder
+
+
+def binder_for(action_object):
+    "Get the CallBinder of a function or a method, cached on the underlying function"
+
+    cache_key = ( getattr(action_object, '__func__', action_object), inspect.ismethod(action_object) )
+    binder = signature_cache.get(cache_key)
+    if binder is None:
+        binder = signature_cache[cache_key] = CallBinder(action_object)
+    return binder
+
+
+def prep(action_object, given_arg_list, dict_like_object, mapping_used=None):
+    """Prepare to call a given action_object and feed it with arguments from given list and dictionary-like object (must support []).
+
+        The function can be declared as having named args and defaults.
+        *varargs are supported while **kwargs are not.
+    """
 
-            mapping_used.update( dict(zip( (*required_arg_names, *listed_optional_names), joint_arg_tuple)) )
-            mapping_used.update( optional_arg_dict )
-            if varargs:
-                mapping_used[varargs] = listed_vararg_values
+    joint_arg_tuple, optional_arg_dict = binder_for(action_object).bind(given_arg_list, dict_like_object, mapping_used)
 
+    if tracing.debug_enabled:
         logging.debug(f"Prepared to call `{action_object.__name__}` with tuple={joint_arg_tuple}, dict={optional_arg_dict}")
 
-        return action_object, joint_arg_tuple, optional_arg_dict
+    return action_object, joint_arg_tuple, optional_arg_dict
 
 
 def feed(action_object, joint_arg_tuple, optional_arg_dict):
 
-    logging.debug(f"Feeding {getattr(action_object, '__name__', 'Unknown')} with {joint_arg_tuple} and {optional_arg_dict} ...")
+    if tracing.debug_enabled:
+        logging.debug(f"Feeding {getattr(action_object, '__name__', 'Unknown')} with {joint_arg_tuple} and {optional_arg_dict} ...")
     ret_values = action_object(*joint_arg_tuple, **optional_arg_dict)
-    logging.debug(f"Just fed {getattr(action_object, '__name__', 'Unknown')} , ret_values = {ret_values}")
+    if tracing.debug_enabled:
+        logging.debug(f"Just fed {getattr(action_object, '__name__', 'Unknown')} , ret_values = {ret_values}")
 
     return ret_values
 
@@ -121,14 +170,16 @@ def feed(action_object, joint_arg_tuple, optional_arg_dict):
 def four_param_example_func(alpha, beta, gamma=333, delta=4444):
     "Just an example function for testing purposes"
 
-    logging.debug(f'alpha = {alpha}, beta = {beta}, gamma = {gamma}, delta = {delta}')
+    if tracing.debug_enabled:
+        logging.debug(f'alpha = {alpha}, beta = {beta}, gamma = {gamma}, delta = {delta}')
     return alpha, beta, gamma, delta
 
 
 def vararg_supporting_example_func(alpha, beta, *others, gamma=333, delta=4444):
     "Another example function for testing purposes"
 
-    logging.debug(f'alpha = {alpha}, beta = {beta}, others = {others}, gamma = {gamma}, delta = {delta}')
+    if tracing.debug_enabled:
+        logging.debug(f'alpha = {alpha}, beta = {beta}, others = {others}, gamma = {gamma}, delta = {delta}')
     return alpha, beta, others, gamma, delta
 
 
@@ -142,16 +193,19 @@ def to_num_or_not_to_num(x):
     try:
         x_int = int(x)
         if type(x_int)==int:
-            logging.debug(f"converting {repr(x)} to int")
+            if tracing.debug_enabled:
+                logging.debug(f"converting {repr(x)} to int")
             return x_int
     except:
         try:
             x_float = float(x)
             if type(x_float)==float:
-                logging.debug(f"converting {repr(x)} to float")
+                if tracing.debug_enabled:
+                    logging.debug(f"converting {repr(x)} to float")
                 return x_float
         except:
-            logging.debug(f"keeping {repr(x)} as it was")
+            if tracing.debug_enabled:
+                logging.debug(f"keeping {repr(x)} as it was")
             pass
 
     return x
@@ -160,6 +214,7 @@ def to_num_or_not_to_num(x):
 if __name__ == '__main__':
 
     logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s: %(message)s")
+    tracing.refresh()
 
     print('-'*40 + ' four_param_example_func() calls: ' + '-'*40)
 
@@ -226,4 +281,4 @@ if __name__ == '__main__':
 
     print('-'*40 + ' list_function_names() calls: ' + '-'*40)
 
-    assert sorted(list_function_names(sys.modules[__name__]))==['expected_call_structure', 'feed', 'four_param_example_func', 'list_function_names', 'prep', 'to_num_or_not_to_num', 'vararg_supporting_example_func'], "Functions defined in this module"
+    assert sorted(list_function_names(sys.modules[__name__]))==['binder_for', 'expected_call_structure', 'feed', 'four_param_example_func', 'list_function_names', 'prep', 'to_num_or_not_to_num', 'vararg_supporting_example_func'], "Functions defined in this module"
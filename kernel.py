@@ -16,8 +16,11 @@ import logging
 import os
 import sys
 
+import metrics
+import tracing
 import ufun
 
+from call_cache import CallCache
 from runnable import Runnable
 from stored_entry import Entry
 
@@ -35,7 +38,10 @@ Usage examples :
         self.entry_cache            = entry_cache or {}
         self.record_container_value = None
         super().__init__(kernel=self, **kwargs)
-        logging.debug(f"[{self.get_name()}] Initializing the MicroKernel with entry_cache={self.entry_cache}")
+        metrics.add_gauge( "entry_cache_size", lambda: len(self.entry_cache) )
+        metrics.add_gauge( "call_cache", CallCache.global_stats )
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Initializing the MicroKernel with entry_cache={self.entry_cache}")
 
 
     def version(self):
@@ -104,17 +110,107 @@ Usage examples :
     def uncache(self, old_path):
         if old_path and old_path in self.entry_cache:
             del self.entry_cache[ old_path ]
-            logging.debug(f"[{self.get_name()}] Uncaching from under {old_path}")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] Uncaching from under {old_path}")
 
 
     def encache(self, new_path, entry):
         new_path = os.path.realpath( new_path )
         self.entry_cache[ new_path ] = entry
-        logging.debug(f"[{self.get_name()}] Caching under {new_path}")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Caching under {new_path}")
 
         return entry
 
 
+    def call_cache_limits(self, max_entries=None, max_bytes=None, ttl=None):
+        """Get or set the limits shared by the call caches of all the entries (0 meaning "no limit").
+            The initial values come from AXS_CALL_CACHE_SIZE, AXS_CALL_CACHE_BYTES and AXS_CALL_CACHE_TTL environment variables.
+
+Usage examples :
+                axs call_cache_limits
+                axs call_cache_limits --max_entries=256 --ttl=600
+                axs call_cache_limits --max_bytes=1000000 , byname shell , run 'echo hello'
+        """
+        return CallCache.set_limits(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+
+    def global_call_cache_stats(self):
+        """Hits, misses, evictions and expirations summed over the call caches of all the entries of this process
+
+Usage examples :
+                axs byname shell , run 'echo hello' , , global_call_cache_stats
+        """
+        return CallCache.global_stats()
+
+
+    def stats(self):
+        """Runtime counters of this process: entries and code loaded, bytes of JSON parsed, cache hits and misses,
+            byquery hits, misses and producer runs, collection walking steps. See metrics.py
+
+Usage examples :
+                axs stats
+                axs byquery shell_tool,can_download_url , , stats
+                AXS_STATS_AT_EXIT=on axs byquery shell_tool,can_download_url
+        """
+        return metrics.snapshot()
+
+
+    def refresh_stale_entries(self):
+        """Reload the cached entries that have changed on disk since they were loaded and forget the removed ones.
+            If there were any, also drop all the call caches and the session-wide collection indices.
+
+Usage examples :
+                axs refresh_stale_entries
+        """
+        refreshed_names = []
+        removed_entries = []
+        for entry_path, entry in list( self.entry_cache.items() ):
+            if entry.is_stale():
+                if os.path.exists( entry_path ):
+                    entry.reload()
+                    entry.loaded_disk_stamp = entry.disk_stamp()    # keep watching it even if its data is not needed again
+                else:
+                    self.uncache( entry_path )
+                    removed_entries.append( entry )
+                refreshed_names.append( entry.get_name() )
+
+        if removed_entries:
+            for entry in self.entry_cache.values():
+                if entry.parent_objects and any( parent_object in removed_entries for parent_object in entry.parent_objects ):
+                    entry.parent_objects = None     # to be looked up again
+
+        if refreshed_names:
+            for call_cache in list( CallCache.live_caches ):
+                call_cache.clear()
+            self.core_collection().reach_action('forget_session_indices')()
+
+        return refreshed_names
+
+
+    def daemon(self, socket_path=None):
+        """Keep this kernel warm and serve the pipelines forwarded by axs script over a Unix socket (see axs_daemon.py)
+
+Usage examples :
+                axs daemon &
+                AXS_DAEMON_SOCKET=/tmp/experiment_axs.sock axs daemon
+        """
+        import axs_daemon
+
+        return axs_daemon.serve(self, socket_path)
+
+
+    def stop_daemon(self):
+        """Terminate the daemon (when running under one), returning its pid
+
+Usage examples :
+                axs stop_daemon
+        """
+        import axs_daemon
+
+        return axs_daemon.stop()
+
+
     def bypath(self, path, name=None, container=None, own_data=None, parent_objects=None):
         """Fetch an entry by its path, cached by the path
             Ad-hoc entries built either form a data file (.json) or functions' file (.py) can also be created, and even manually stacked
@@ -131,9 +227,13 @@ Usage examples :
         cache_hit = self.entry_cache.get(path)
 
         if cache_hit:
-            logging.debug(f"[{self.get_name()}] bypath: cache HIT for path={path}")
+            metrics.counters["entry_cache_hits"] += 1
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] bypath: cache HIT for path={path}")
         else:
-            logging.debug(f"[{self.get_name()}] bypath: cache MISS for path={path}")
+            metrics.counters["entry_cache_misses"] += 1
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] bypath: cache MISS for path={path}")
 
             if path.endswith('.json'):      # ad-hoc data entry from a .json file
                 entry_object = Entry(name=name, parameters_path=path, own_functions=False, parent_objects=parent_objects or [], is_stored=True, kernel=self)
@@ -143,8 +243,9 @@ Usage examples :
             else:
                 entry_object = Entry(name=name, entry_path=path, own_data=own_data, container=container, parent_objects=parent_objects or None, kernel=self)
 
-            cache_hit = self.encache( path, entry_object )
-            logging.debug(f"[{self.get_name()}] bypath: successfully CACHED {cache_hit.get_name()} under path={path}")
+            cache_hit = self.entry_cache.setdefault( path, entry_object )  # NB: if another thread has just loaded the same path, its entry wins
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] bypath: successfully CACHED {cache_hit.get_name()} under path={path}")
 
         return cache_hit
 
@@ -207,12 +308,13 @@ Usage examples :
 Usage examples :
                 axs byname pip , help
         """
-        logging.debug(f"[{self.get_name()}] byname({entry_name, skip_entry_names})")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] byname({entry_name, skip_entry_names})")
         return self.work_collection().call('byname', [entry_name, skip_entry_names])
 
 
-    def all_byquery(self, query, pipeline=None, template=None, parent_recursion=False, skip_entry_names=None):
-        """Returns a list of ALL entries matching the query.
+    def all_byquery(self, query, pipeline=None, template=None, parent_recursion=False, skip_entry_names=None, parallel=None, on_error='fail_fast', timing=False):
+        """Returns a list of ALL entries matching the query (or the results of running a pipeline on each of them).
             Empty list if nothing matched.
 
 Usage examples :
@@ -222,11 +324,13 @@ Usage examples :
                 axs all_byquery python_package --template="python_#{python_version}# package #{package_name}#"
                 axs all_byquery tags. --template="tags=#{tags}#"
                 axs all_byquery git_repo ---='[["pull"]]'
+                axs all_byquery git_repo ---='[["pull"]]' --parallel=8 --on_error=collect --timing+
                 axs all_byquery deleteme+ ---='[["remove"]]'
                 axs all_byquery __completed.,__completed- ---='[["remove"]]'
         """
-        logging.debug(f"[{self.get_name()}] all_byquery({query}, {pipeline}, {template}, {parent_recursion}, {skip_entry_names})")
-        return self.work_collection().call('all_byquery', [query, pipeline, template, parent_recursion, skip_entry_names])
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] all_byquery({query}, {pipeline}, {template}, {parent_recursion}, {skip_entry_names}, {parallel}, {on_error}, {timing})")
+        return self.work_collection().call('all_byquery', [query, pipeline, template, parent_recursion, skip_entry_names, parallel, on_error, timing])
 
 
     def show_matching_rules(self, query):
@@ -235,10 +339,25 @@ Usage examples :
 Usage examples :
                 axs show_matching_rules shell_tool,can_download_url_from_zenodo
         """
-        logging.debug(f"[{self.get_name()}] show_matching_rules({query})")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] show_matching_rules({query})")
         return self.work_collection().call('show_matching_rules', [query])
 
 
+    def explain_query(self, query, parent_recursion=False, skip_entry_names=None):
+        """(Delegated to work_collection)
+            Explain how byquery() would resolve the query: the entries visited, loaded and rejected (by which condition),
+            the time per nested collection, the indices and caches used and the producer rules considered.
+
+Usage examples :
+                axs explain_query shell_tool,can_download_url
+                axs explain_query python_package,package_name=numpy --parent_recursion+
+        """
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] explain_query({query}, {parent_recursion}, {skip_entry_names})")
+        return self.work_collection().call('explain_query', [query, parent_recursion, skip_entry_names], deterministic=False)    # the numbers change from run to run
+
+
     def byquery(self, query, produce_if_not_found=True, parent_recursion=False, skip_entry_names=None):
         """(Delegated to work_collection)
             Fetch an entry by query over its tags and attributes.
@@ -260,17 +379,18 @@ Usage examples :
                 axs byquery --:=count:romance:^french
                 axs byquery "--,=count,romance,language!=French"
         """
-        logging.debug(f"[{self.get_name()}] byquery({query}, {produce_if_not_found}, {parent_recursion}, {skip_entry_names})")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] byquery({query}, {produce_if_not_found}, {parent_recursion}, {skip_entry_names})")
         return self.work_collection().call('byquery', [query, produce_if_not_found, parent_recursion, skip_entry_names])
 
 
-    def byqueries(self, *queries):
+    def byqueries(self, *queries, parallel=False):
         """(Delegated to work_collection)
             Fetch an array of entries, each by a query over its tags and attributes.
             Each query is either resolved against the collection (and its descendents), or an attempt to manufacture is made, see buquery()
 
         NOTE incomplete delegation [this is not an accidental omission, but a limitation of the current kernel 0.2.x ] -
-            only "queries" are delegated ; if you need more control, go via the collection (longer syntax, see below).
+            only "queries" and "parallel" are delegated ; if you need more control, go via the collection (longer syntax, see below).
 
 Usage examples :
             # via the collection (potentially more control) :
@@ -278,9 +398,11 @@ Usage examples :
 
             # or directly via kernel (assumes work_collection as the starting collection) :
                 axs byqueries python_package,package_name=six python_package,package_name=shortuuid
+                axs byqueries python_package,package_name=six python_package,package_name=shortuuid --parallel
         """
-        logging.debug(f"[{self.get_name()}] byquery({queries})")
-        return self.work_collection().call('byqueries', [ queries ])
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] byquery({queries})")
+        return self.work_collection().call('byqueries', [ queries ], { "parallel": parallel })
 
 
 #logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s %(message)s")
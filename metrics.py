@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""Cheap always-on counters of the kernel's work, for production runs where a profiler would be too much.
+
+    The hot paths bump named counters in place (a dictionary increment without locking, as every thread counts into its own dictionary,
+    the dictionaries being summed up when a snapshot is taken):
+
+        metrics.counters["data_files_loaded"] += 1
+
+    and the values that already live elsewhere (the size of the entry_cache, the call caches' own counters) are registered as gauges,
+    callables evaluated only when a snapshot is taken.
+
+    The snapshot is available as an action of the kernel, and can also be dumped when the process exits:
+        AXS_STATS_AT_EXIT=on            (print the counters to stderr)
+        AXS_STATS_AT_EXIT=stats.json    (write them into a JSON file)
+
+Usage examples :
+                axs stats
+                axs byquery shell_tool,can_download_url , , stats
+                AXS_STATS_AT_EXIT=on axs byquery shell_tool,can_download_url
+"""
+
+import atexit
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+
+
+class ThreadCounters:
+    "Named counts kept per thread, so that the increments need no locking ; indexing gives the current thread's count"
+
+    def __init__(self):
+        self.local          = threading.local()
+        self.per_thread     = []                # the Counters of all the threads that have counted anything, including the finished ones
+        self.lock           = threading.Lock()  # only guards per_thread
+
+
+    def own(self):
+        "The current thread's Counter"
+
+        try:
+            return self.local.counter
+        except AttributeError:
+            counter = self.local.counter = collections.Counter()
+            with self.lock:
+                self.per_thread.append( counter )
+            return counter
+
+
+    def __getitem__(self, counter_name):
+        return self.own()[counter_name]
+
+
+    def __setitem__(self, counter_name, count):
+        self.own()[counter_name] = count
+
+
+    def total(self):
+        "The counts of all the threads summed up"
+
+        with self.lock:
+            per_thread = list( self.per_thread )
+
+        total = collections.Counter()
+        for counter in per_thread:
+            total.update( dict( list( counter.items() ) ) )     # taking the items at once, as the owner thread may be counting meanwhile
+        return dict( total )
+
+
+    def clear(self):
+        with self.lock:
+            for counter in self.per_thread:
+                counter.clear()
+
+
+counters    = ThreadCounters()          # counter_name -> count, missing names count as 0
+gauges      = {}                        # gauge_name -> callable returning its current value (a number or a dictionary of numbers)
+
+
+def add_gauge(gauge_name, gauge_callable):
+    gauges[gauge_name] = gauge_callable
+
+
+def snapshot():
+    "The current values of all the counters and gauges (a dictionary returned by a gauge is flattened into gauge_name_key entries)"
+
+    values = counters.total()
+    for gauge_name, gauge_callable in gauges.items():
+        gauge_value = gauge_callable()
+        if type(gauge_value)==dict:
+            values.update( (f"{gauge_name}_{k}", v) for k, v in gauge_value.items() if type(v) in (int, float) )
+        else:
+            values[gauge_name] = gauge_value
+
+    return dict( sorted( values.items() ) )
+
+
+def reset():
+    counters.clear()
+
+
+def dump_on_exit():
+    "Print or save the snapshot if AXS_STATS_AT_EXIT asks for it (checked at the time of the call, as a daemon's fork gets its client's environment)"
+
+    setting = os.getenv('AXS_STATS_AT_EXIT', '')
+    if setting.lower() in ('', '0', 'off', 'no', 'false'):
+        return
+
+    stats = snapshot()
+    if setting.lower() in ('1', 'on', 'yes', 'true'):
+        width = max( map(len, stats), default=0 )
+        print( '\n'.join( [ f"{'-'*20} axs stats {'-'*20}" ] + [ f"{k:<{width}} {v}" for k, v in stats.items() ] ), file=sys.stderr )
+    else:
+        with open(setting, 'w') as stats_file:
+            json.dump( stats, stats_file, indent=4 )
+        logging.info(f"The stats have been written into {setting}")
+
+
+atexit.register( dump_on_exit )
+
+
+if __name__ == '__main__':
+
+    counters["walk_steps"] += 3
+    counters["walk_steps"] += 2
+    add_gauge( "entry_cache_size", lambda: 7 )
+    add_gauge( "call_cache", lambda: { "hits": 4, "misses": 1, "limits": {} } )
+
+    stats = snapshot()
+    assert stats=={ "call_cache_hits": 4, "call_cache_misses": 1, "entry_cache_size": 7, "walk_steps": 5 }, "counters, gauges and flattened gauges"
+    assert counters["never_counted"]==0, "a counter does not need to be declared"
+
+    def count_in_thread():
+        for _ in range(10000):
+            counters["walk_steps"] += 1
+
+    threads = [ threading.Thread( target=count_in_thread ) for _ in range(4) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert snapshot()["walk_steps"]==40005 and counters["walk_steps"]==5, "no counts lost across threads, indexing gives the current thread's count"
+
+    reset()
+    assert "walk_steps" not in snapshot(), "reset"
+    print(stats)
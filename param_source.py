@@ -1,12 +1,210 @@
 #!/usr/bin/env python3
 
+import functools
+import itertools
 import logging
 import re
-from copy import deepcopy
+import sys
+import threading
 
 
+import tracing
 import ufun
 
+
+dependency_tracking = threading.local()     # per-thread stack of active DependencyRecorders
+worker_tracking     = threading.local()     # the WorkerThreadState of the current worker thread (if any)
+
+TEMPLATE_anchor_pattern = '{}([\\w\\.]+){}'.format(re.escape('#{'), re.escape('}#'))
+TEMPLATE_whole_regex    = re.compile(     TEMPLATE_anchor_pattern+'$' )
+TEMPLATE_split_regex    = re.compile(     TEMPLATE_anchor_pattern )
+
+
+class DependencyRecorder:
+    """Collects the ParamSource objects consulted during a computation, together with the parameter names looked up in them
+        and their data_version at the time of the first lookup, to be able to tell later whether the result is still valid.
+        The computation's own side effects (like planting into an entry it has read, or saving it) move the recorded versions along,
+        so they do not invalidate its result, while the changes made meanwhile by other threads still do.
+
+        The result is not cacheable if it depended on the runtime stack frames created before the computation started,
+        on parameter blocking or on a non-deterministic call.
+    """
+
+    def __init__(self):
+        self.start_serial   = next(ParamSource.serial_counter)  # the frames created after this point are internal to the computation
+        self.deps           = {}    # ParamSource -> [data_version, set_of_param_names]
+        self.cacheable      = True
+
+
+    def note(self, param_source, param_name):
+        dep = self.deps.get(param_source)
+        if dep is None:
+            self.deps[param_source] = [param_source.data_version, { param_name }]
+        else:
+            dep[1].add( param_name )
+
+
+    def absorb(self, deps):
+        for param_source, (data_version, param_names) in deps.items():
+            dep = self.deps.get(param_source)
+            if dep is None:
+                self.deps[param_source] = [data_version, set(param_names)]
+            else:
+                dep[1].update( param_names )
+
+
+    @staticmethod
+    def stack():
+        recorder_stack = getattr(dependency_tracking, 'recorder_stack', None)
+        if recorder_stack is None:
+            recorder_stack = dependency_tracking.recorder_stack = []
+        return recorder_stack
+
+
+    @classmethod
+    def start(cls):
+        recorder = cls()
+        cls.stack().append( recorder )
+        return recorder
+
+
+    @staticmethod
+    def own_change(param_source, old_data_version):
+        "A computation of this thread has changed the param_source: the recorders that saw it at old_data_version may keep trusting it"
+
+        for recorder in getattr(dependency_tracking, 'recorder_stack', None) or ():
+            dep = recorder.deps.get(param_source)
+            if dep is not None and dep[0]==old_data_version:     # otherwise it has been changed by someone else since it was read
+                dep[0] = param_source.data_version
+
+
+    def stop(self):
+        "Deactivate this recorder and pass its dependencies on to the enclosing one"
+
+        recorder_stack = self.stack()
+        recorder_stack.pop()
+        if recorder_stack:
+            recorder_stack[-1].absorb( self.deps )
+
+
+    @classmethod
+    def replay(cls, deps):
+        "Pass on the dependencies of a value that was taken from a cache"
+
+        recorder_stack = getattr(dependency_tracking, 'recorder_stack', None)
+        if recorder_stack:
+            recorder_stack[-1].absorb( deps )
+
+
+    @classmethod
+    def mark_uncacheable(cls, frame_serial=None):
+        """Without frame_serial - mark all the active computations as not cacheable,
+            otherwise only those that started after the given runtime frame was created.
+        """
+        for recorder in reversed( getattr(dependency_tracking, 'recorder_stack', None) or [] ):
+            if frame_serial is not None and frame_serial >= recorder.start_serial:
+                break
+            recorder.cacheable = False
+
+
+    @staticmethod
+    def deps_still_valid(deps):
+        "Nothing has been edited since, no runtime frame would shadow the values used and none of them is currently blocked"
+
+        for param_source, (data_version, param_names) in deps.items():
+            if param_source.data_version != data_version and param_source.changed_since( data_version, param_names ):
+                return False
+            if param_source.runtime_stack() and param_source.stack_provides_any( param_names ):
+                return False
+            blocked_param_set = param_source.blocked_params()
+            if blocked_param_set and any( blocked_param_set.get(param_name) for param_name in param_names ):
+                return False
+
+        return True
+
+
+class WorkerThreadState:
+    """The runtime stacks and the parameter blocking of shared ParamSource objects, as seen by one worker thread,
+        so that pipelines running in parallel (e.g. all_byquery --parallel=N) on the same entries or their common parents
+        do not see each other's runtime frames or blocked parameters.
+
+        Entered as a context manager around the work of the thread; the main thread keeps using the objects' own attributes.
+    """
+
+    count_lock  = threading.Lock()
+
+    def __init__(self):
+        self.runtime_stacks     = {}    # ParamSource -> its runtime stack in this thread
+        self.blocked_param_sets = {}    # ParamSource -> its blocked_param_set in this thread
+
+
+    def __enter__(self):
+        worker_tracking.state = self
+        with WorkerThreadState.count_lock:
+            ParamSource.active_workers += 1
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        worker_tracking.state = None
+        with WorkerThreadState.count_lock:
+            ParamSource.active_workers -= 1
+        self.runtime_stacks.clear()
+        self.blocked_param_sets.clear()
+
+
+    def runtime_stack(self, param_source, new_stack_value=None):
+        if new_stack_value is not None:
+            self.runtime_stacks[param_source] = new_stack_value
+            return new_stack_value
+
+        runtime_stack = self.runtime_stacks.get(param_source)
+        if runtime_stack is None:
+            runtime_stack = self.runtime_stacks[param_source] = []
+        return runtime_stack
+
+
+    def blocked_params(self, param_source):
+        blocked_param_set = self.blocked_param_sets.get(param_source)
+        if blocked_param_set is None:
+            blocked_param_set = self.blocked_param_sets[param_source] = {}
+        return blocked_param_set
+
+
+def structural_fingerprint(input_structure, owner=None, nested_sources=None):
+    """An interned string that identifies the contents of a data structure, to be used in cache keys.
+        The ParamSource objects met inside contribute their own (memoized) fingerprints and are collected into nested_sources.
+    """
+    def fingerprint_rec(x):
+        if type(x)==dict:
+            return '{' + ','.join( repr(k)+':'+fingerprint_rec(x[k]) for k in sorted(x.keys(), key=str) ) + '}'
+        elif type(x)==list:
+            return '[' + ','.join( fingerprint_rec(e) for e in x ) + ']'
+        elif x is owner:
+            return 'self'
+        elif isinstance(x, ParamSource):
+            nested_fingerprint = x.fingerprint()
+            if nested_sources is not None:
+                nested_sources.append( (x, nested_fingerprint) )
+            return nested_fingerprint
+        else:
+            return repr(x)
+
+    return sys.intern( fingerprint_rec(input_structure) )
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(input_template):
+    """Parse a template string once into the key_path of its only anchor (a str),
+        or a tuple of segments: literal strings at even positions and anchors' key_paths at odd positions.
+    """
+    whole_match = TEMPLATE_whole_regex.match(input_template)
+    if whole_match:                         # input_template is made of exactly one anchor
+        return whole_match.group(1)
+    else:
+        return tuple( TEMPLATE_split_regex.split(input_template) )
+
+
 class ParamSource:
     """ An object of ParamSource class is a non-persistent container of parameters
         that may optionally also have a parent object of the same class.
@@ -16,36 +214,109 @@ class ParamSource:
 
     PARAMNAME_parent_entries        = '_parent_entries'
 
+    serial_counter                  = itertools.count()     # tells the runtime frames created during a computation from the ones that existed before
+    lineage_version                 = 0     # bumped whenever any object's parents (or code) change, invalidating all flattened ancestries
+    active_workers                  = 0     # the number of worker threads with their own WorkerThreadState
+    ancestry_lock                   = threading.RLock()     # serializes extending the shared flattened ancestries
+
     def __init__(self, name=None, own_data=None, parent_objects=None):
         "A trivial constructor"
 
+        self.serial                 = next(ParamSource.serial_counter)
+        self.data_version           = 0     # bumped on every change of own data or parents
+        self.whole_data_version     = 0     # the data_version of the last change that was not limited to one known top-level key
+        self.key_versions           = {}    # top-level key -> the data_version of its last change
+        self.shared_keys            = set() # top-level keys of own data whose values may be shared with other structures (so plant() copies before editing them)
+        self.fingerprint_cache      = None
+        self.ancestry_cache         = None  # [lineage_version, flattened_ancestry_so_far, generator_to_continue_it_or_None]
         self.name                   = name
         self.parent_objects         = parent_objects    # sic! The order of initializations is important; data-defined parents have a higher priority than code-assigned ones
-        self.runtime_stack_cache    = []
+        self.runtime_stack_cache    = []    # NB: worker threads keep their own runtime stacks and blocked params, see WorkerThreadState
 
         self.set_own_data( own_data )
 
         self.blocked_param_set      = {}
 
-        logging.debug(f"[{self.get_name()}] Initializing the ParamSource with own_data={self.own_data_cache}, inheriting from {'some parents' or 'no parents'}")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Initializing the ParamSource with own_data={self.own_data_cache}, inheriting from {'some parents' or 'no parents'}")
 # FIXME: The following would cause infinite recursion (expecting cached entries before they actually end up in cache)
 #        logging.debug(f"[{self.get_name()}] Initializing the ParamSource with own_data={self.own_data_cache}, inheriting from {self.get_parents_names() or 'no parents'}")
 
 
     def __repr__(self):
-        "Method for stringifying params mainly used as cache key"
+        "Method for stringifying params mainly used for logging"
 
         return (self.get_name() or 'Anonymous') + ':' + self.__class__.__name__ + ':'+ ufun.repr_dict(self.own_data(), [(self, "self")] )
 
 
+    def fingerprint(self):
+        """A cheap structural replacement for repr() in cache keys:
+            recomputed only when own data or the data of a ParamSource it contains has changed.
+        """
+        memo = self.fingerprint_cache
+        if memo and memo[0]==self.data_version and all( nested_source.fingerprint() is nested_fingerprint for nested_source, nested_fingerprint in memo[1] ):
+            return memo[2]
+
+        nested_sources  = []
+        new_fingerprint = sys.intern( (self.get_name() or 'Anonymous') + ':' + self.__class__.__name__ + ':' + structural_fingerprint(self.own_data(), self, nested_sources) )
+        self.fingerprint_cache = (self.data_version, nested_sources, new_fingerprint)
+
+        return new_fingerprint
+
+
     def get_name(self):
         "Read-only access to the name"
 
         return self.name
 
 
+    def data_changed(self, changed_key=None):
+        "Invalidate the cached values that depended on this object's data (only those that have read the changed_key, if it is known)"
+
+        old_data_version  = getattr(self, 'data_version', 0)     # may be called by subclasses' constructors before ours
+        self.data_version = old_data_version + 1
+        if changed_key is None:
+            self.whole_data_version = self.data_version
+        elif getattr(self, 'key_versions', None) is None:
+            self.key_versions = { changed_key: self.data_version }
+        else:
+            self.key_versions[changed_key] = self.data_version
+
+        DependencyRecorder.own_change( self, old_data_version )
+
+
+    def changed_since(self, data_version, param_names):
+        "Has the data as a whole, or any of the given top-level keys, changed after the given data_version?"
+
+        if getattr(self, 'whole_data_version', self.data_version) > data_version:
+            return True
+        key_versions = self.key_versions
+        return any( key_versions.get(param_name, 0) > data_version for param_name in param_names )
+
+
+    @property
+    def parent_objects(self):
+        return self.parent_objects_cache
+
+    @parent_objects.setter
+    def parent_objects(self, new_parent_objects):
+        if getattr(self, "parent_objects_cache", None) is not None:     # lazy-loading the parents for the first time does not change anything
+            self.data_changed()
+            ParamSource.lineage_changed()
+        self.parent_objects_cache = new_parent_objects
+
+
+    @staticmethod
+    def lineage_changed():
+        "Invalidate the flattened ancestries of all the objects"
+
+        ParamSource.lineage_version += 1
+
+
     def set_own_data(self, mix_dict, topup=False):
 
+        self.data_changed()
+
         if type(mix_dict)==dict:
             if (not topup or
                 not hasattr(self, "own_data_cache") or
@@ -103,7 +374,8 @@ Usage examples :
 
     def parents_loaded(self):
         if self.parent_objects==None:     # lazy-loading condition
-            logging.debug(f"[{self.get_name()}] Lazy-loading the parents...")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] Lazy-loading the parents...")
             self.parent_objects = self.get(self.PARAMNAME_parent_entries, [])
 
             if type(self.parent_objects)!=list:
@@ -113,9 +385,11 @@ Usage examples :
             if None in self.parent_objects:
                 raise RuntimeError( f"Some of entry {self.get_name()}'s parents could not be loaded." ) # NB: part of the message should stay verbatim!
 
-            logging.debug(f"[{self.get_name()}] Parents loaded and cached.")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] Parents loaded and cached.")
         else:
-            logging.debug(f"[{self.get_name()}] Parents have already been cached")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] Parents have already been cached")
 
         return self.parent_objects
 
@@ -130,12 +404,69 @@ Usage examples :
     def parent_generator(self, _ancestry_path=None):
         "Yields the entry and its' parents in order"
 
-        new_ancestry_path = (_ancestry_path or []) + [ self.get_name() ]
+        for ancestor, ancestry_path in self.ancestry_generator():
+            yield ancestor, list(_ancestry_path or []) + list(ancestry_path)
+
+
+    def ancestry_generator(self):
+        """Yields (ancestor, ancestry_path) pairs for the entry and its parents (depth-first, repeating shared ancestors),
+            from a flattened list that is cached until any object's parents change.
+
+            The list is extended lazily, so the parents are only loaded when the walk actually needs them.
+        """
+        memo = self.ancestry_cache
+        if memo is None or memo[0]!=ParamSource.lineage_version:
+            memo = self.ancestry_cache = [ ParamSource.lineage_version, [], self.unflattened_ancestry_generator() ]
+
+        flat_ancestry = memo[1]
+        i = 0
+        while True:
+            if i<len(flat_ancestry):
+                yield flat_ancestry[i]
+                i += 1
+            elif memo[2] is None:
+                return
+            elif memo[2].gi_running:    # re-entered while loading the parents (e.g. lazy-loading data that edits inherited values)
+                yield from itertools.islice( self.unflattened_ancestry_generator(), i, None )
+                return
+            else:
+                with ParamSource.ancestry_lock:     # another thread may be extending the same list
+                    if i<len(flat_ancestry) or memo[2] is None:
+                        continue
+                    try:
+                        flat_ancestry.append( next(memo[2]) )
+                    except StopIteration:
+                        memo[2] = None
+                    except:
+                        self.ancestry_cache = None  # do not keep a half-built list around a failure
+                        raise
+
 
-        yield self, new_ancestry_path
+    def unflattened_ancestry_generator(self):
+        "Builds the flattened ancestry from the (flattened) ancestries of the parents"
+
+        own_path = ( self.get_name(), )
+
+        yield self, own_path
 
         for parent_object in self.parents_loaded():
-            yield from parent_object.parent_generator( new_ancestry_path )
+            if parent_object:
+                for ancestor, ancestry_path in parent_object.ancestry_generator():
+                    yield ancestor, own_path + ancestry_path
+            else:
+                raise RuntimeError( f"Some of entry {self.get_name()}'s parents could not be loaded, so their values cannot be inherited." ) # NB: part of the message should stay verbatim!
+
+
+    def direct_lineage_generator(self):
+        "Yields the entry and its immediate parents only"
+
+        yield self
+
+        for parent_object in self.parents_loaded():
+            if parent_object:
+                yield parent_object
+            else:
+                raise RuntimeError( f"Some of entry {self.get_name()}'s parents could not be loaded, so their values cannot be inherited." ) # NB: part of the message should stay verbatim!
 
 
     def noop(self, arg):
@@ -185,7 +516,11 @@ Usage examples :
 
 
     def runtime_stack(self, new_stack_value=None):
-        "A list of entries to query for parameters before own_data during [] parameter access"
+        "A list of entries to query for parameters before own_data during [] parameter access (every worker thread has its own)"
+
+        worker_state = ParamSource.active_workers and getattr(worker_tracking, 'state', None)
+        if worker_state:
+            return worker_state.runtime_stack(self, new_stack_value)
 
         if new_stack_value is not None:
             self.runtime_stack_cache = new_stack_value
@@ -193,53 +528,80 @@ Usage examples :
         return self.runtime_stack_cache
 
 
+    def blocked_params(self):
+        "Maps the names of parameters being computed to the names of the entries computing them (every worker thread has its own)"
+
+        worker_state = ParamSource.active_workers and getattr(worker_tracking, 'state', None)
+        if worker_state:
+            return worker_state.blocked_params(self)
+
+        return self.blocked_param_set
+
+
     def get_own_value_generator(self, param_name, asking_entry):
         "Common part of accessing a parameter"
 
         own_data = self.own_data()
         if param_name in own_data:
-            if asking_entry.get_name() in self.blocked_param_set.get(param_name, set()):
-                logging.warning(f"[{asking_entry.get_name()} -> {self.get_name()}] parameter '{param_name}' is contained here, but BLOCKED by this entry -- all blockers: {self.blocked_param_set[param_name]}")
+            blocked_param_set = self.blocked_params()
+            if asking_entry.get_name() in blocked_param_set.get(param_name, set()):
+                DependencyRecorder.mark_uncacheable()
+                logging.warning(f"[{asking_entry.get_name()} -> {self.get_name()}] parameter '{param_name}' is contained here, but BLOCKED by this entry -- all blockers: {blocked_param_set[param_name]}")
             else:
                 param_value = own_data[param_name]
-                logging.debug(f"[{asking_entry.get_name()} -> {self.get_name()}]  parameter '{param_name}' is contained here, returning '{param_value}'")
+                if tracing.debug_enabled:
+                    logging.debug(f"[{asking_entry.get_name()} -> {self.get_name()}]  parameter '{param_name}' is contained here, returning '{param_value}'")
                 yield (self, param_value)
         else:
-            logging.debug(f"[{asking_entry.get_name()} -> {self.get_name()}]  parameter '{param_name}' is not contained here, skipping further")
+            if tracing.debug_enabled:
+                logging.debug(f"[{asking_entry.get_name()} -> {self.get_name()}]  parameter '{param_name}' is not contained here, skipping further")
 
 
     def get_stack_value_generator(self, param_name, asking_entry):
 
         for runtime_entry in self.runtime_stack():
-            yield from runtime_entry.get_stack_value_generator( param_name, asking_entry )
+            for stack_value in runtime_entry.get_stack_value_generator( param_name, asking_entry ):
+                DependencyRecorder.mark_uncacheable( runtime_entry.serial )   # only matters to computations started after this frame had been created
+                yield stack_value
 
         yield from self.get_own_value_generator( param_name, asking_entry )
 
 
+    def stack_provides_any(self, param_names):
+        "Would any of the runtime frames (recursively) provide a value for any of the given names?"
+
+        for runtime_entry in self.runtime_stack():
+            runtime_data = runtime_entry.own_data()
+            if any( param_name in runtime_data for param_name in param_names ) or (runtime_entry.runtime_stack() and runtime_entry.stack_provides_any( param_names )):
+                return True
+        return False
+
+
     def getitem_generator(self, param_name, parent_recursion=None, asking_entry=None):
         "Walk the potential sources of the parameter (runtime, own_data and the parents recursively)"
 
         asking_entry = asking_entry or self
-        logging.debug(f"[{self.get_name()}] Attempt to access parameter '{param_name}'...")
-
-        yield from self.get_stack_value_generator( param_name, asking_entry )
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Attempt to access parameter '{param_name}'...")
 
         # trust the boolean value if it was defined,
         # otherwise the parameter's inheritability is encoded in its name:
-        if parent_recursion if parent_recursion is not None else param_name[0]!='_':
-            for parent_object in self.parents_loaded():
-                if parent_object:
-                    logging.debug(f"[{self.get_name()}]  I don't have parameter '{param_name}', fallback to the parent '{parent_object.get_name()}'")
-                    try:
-                        yield from parent_object.getitem_generator(param_name, asking_entry=asking_entry)
-                    except StopIteration:
-                        logging.debug(f"[{self.get_name()}]  My parent '{parent_object.get_name()}'' did not know about '{param_name}'")
-                        pass
-                else:
-                    raise RuntimeError( f"Some of entry {self.get_name()}'s parents could not be loaded, so their values cannot be inherited." ) # NB: part of the message should stay verbatim!
-
+        if param_name[0]!='_':
+            sources = ( source for source, _ in self.ancestry_generator() ) if parent_recursion is not False else (self,)
+        elif parent_recursion:      # the parents themselves do not recurse further for non-inheritable parameters
+            sources = self.direct_lineage_generator()
         else:
-            logging.debug(f"[{self.get_name()}]  No parent recursion for '{param_name}', skipping further")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}]  No parent recursion for '{param_name}', skipping further")
+            sources = (self,)
+
+        for source in sources:
+            recorder_stack = getattr(dependency_tracking, 'recorder_stack', None)
+            if recorder_stack:
+                source.own_data()   # make sure lazy-loading does not change the data_version after it has been recorded
+                recorder_stack[-1].note( source, param_name )
+
+            yield from source.get_stack_value_generator( param_name, asking_entry )
 
 
     def get_data_pile(self, param_name):
@@ -272,7 +634,8 @@ Usage examples :
         try:
             return next( self.getitem_generator( str(param_name), parent_recursion ) )[1]
         except StopIteration:
-            logging.debug(f"[{self.get_name()}]  I don't have parameter '{param_name}', and neither do the parents - raising KeyError")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}]  I don't have parameter '{param_name}', and neither do the parents - raising KeyError")
             raise KeyError(param_name)
 
 
@@ -327,25 +690,24 @@ Usage examples :
                 axs byname derived_map , substitute '#{first}#, #{third}# und #{fifth}#' --first=Erste
                 axs byname counting_collection , byname castellano , substitute '#{number_mapping.3}# + #{number_mapping.5}# = #{number_mapping.8}#'
         """
-        pre_pattern     = '{}([\\w\\.]+){}'.format(re.escape('#{'), re.escape('}#'))
-        full_pattern    = re.compile(     pre_pattern+'$' )
-        sub_pattern     = re.compile( '('+pre_pattern+')' )
-
         def scalar_substitute(input_template):
 
-            full_match = re.match(full_pattern, input_template)
-            if full_match:                          # input_template is made of exactly one anchor
-                key_path = full_match.group(1)
-                return self.dig( key_path, safe=True )         # output type is determined by the value
-            else:
-                output_string = input_template
+            if '#{' not in input_template:          # no anchors, nothing to compile
+                return input_template
 
-                for sub_match in re.finditer(sub_pattern, input_template):  # input_template may contain 0 or more anchors
-                    expression, key_path = sub_match.group(1), sub_match.group(2)
-                    param_value  = self.dig( key_path, safe=True )
-                    output_string = output_string.replace(expression, str(param_value) )    # fit the output into a string
+            compiled_template = compile_template(input_template)
+            if type(compiled_template)==str:        # input_template is made of exactly one anchor
+                return self.dig( compiled_template, safe=True )         # output type is determined by the value
+            else:
+                segments    = list(compiled_template)
+                rendered    = {}                        # an anchor repeated in the template is only looked up once
+                for i in range(1, len(segments), 2):    # input_template may contain 0 or more anchors
+                    key_path = segments[i]
+                    if key_path not in rendered:
+                        rendered[key_path] = str( self.dig( key_path, safe=True ) )     # fit the output into a string
+                    segments[i] = rendered[key_path]
 
-                return output_string
+                return ''.join(segments)
 
         def substitute_once(input_structure):
             # Structural recursion:
@@ -379,7 +741,8 @@ Usage examples :
         try:
             return self.__getitem__(param_name)
         except KeyError:
-            logging.debug(f"[{self.get_name()}] caught KeyError: parameter '{param_name}' is missing, returning the default value '{default_value}'")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] caught KeyError: parameter '{param_name}' is missing, returning the default value '{default_value}'")
             return default_value
 
 
@@ -397,6 +760,12 @@ Usage examples :
 
         param_name = str(param_name)
         self.own_data()[param_name] = param_value
+        self.data_changed( param_name )
+
+        if type(param_value) in (list, dict):       # may come from a parent or from an AS^IS-escaped structure
+            self.shared_keys.add( param_name )
+        else:
+            self.shared_keys.discard( param_name )
 
         if param_name==self.PARAMNAME_parent_entries:   # magic request to reload the parents
             self.parent_objects = None
@@ -439,16 +808,25 @@ Usage examples :
             else:
                 edit_mode = 'ASSIGN'
 
-            # pre-clone if necessary:
-            if (len(key_path)>1 or edit_mode == 'AUGMENT') and (key_path[0] not in self.own_data()):
-                top_key = key_path[0]
-#                self.__setitem__( top_key, deepcopy( self.__getitem__(top_key, perform_nested_calls=False) ) )
-                self.__setitem__( top_key, deepcopy( self.__getitem__(top_key, perform_nested_calls=True) ) )
+            top_key = key_path[0]
+
+            # bring the inherited value over if necessary (it is shared until edited: only the containers along key_path get copied):
+            if (len(key_path)>1 or edit_mode == 'AUGMENT') and (top_key not in self.own_data()):
+                self.__setitem__( top_key, self[top_key] )
 
             if (edit_mode == 'AUGMENT') and hasattr(self, "nested_calls"):
                 value = self.nested_calls( value )
 
-            ufun.edit_structure(self.own_data(), key_path, value, edit_mode)
+            shared_keys = self.shared_keys
+            ufun.edit_structure(self.own_data(), key_path, value, edit_mode, copy_on_write=(top_key in shared_keys))     # own unshared data is edited in place
+            self.data_changed( top_key )
+
+            if edit_mode == 'PLUCK' and len(key_path)==1:
+                shared_keys.discard( top_key )
+            elif edit_mode != 'PLUCK' and type(value) in (list, dict):
+                shared_keys.add( top_key )
+            elif edit_mode == 'ASSIGN' and len(key_path)==1:
+                shared_keys.discard( top_key )
 
             if key_path == [ self.PARAMNAME_parent_entries ]:   # magic request to reload the parents
                 self.parent_objects = None
@@ -490,6 +868,7 @@ Usage examples :
 if __name__ == '__main__':
 
     logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s %(message)s")
+    tracing.refresh()
 
     print('-'*20 + ' Dictionary-like data access: ' + '-'*20)
 
@@ -531,6 +910,54 @@ if __name__ == '__main__':
     assert dad.own_data()=={"third":"KOLMAS", "fifth":"viies", "seventh":"SEITSMES"}, "Modified dad's data"
     assert child.own_data()=={'first': 'esimene', 'second': 'teine'}, "Unmodified child's data"
 
+    print('-'*20 + ' Copy-on-write planting: ' + '-'*20)
+
+    granddad['nested']  = { "shallow": [1, 2, 3], "deep": { "er": [4, 5, 6] } }
+    child.plant('nested.deep.er.1', 50)
+
+    assert child['nested']=={ "shallow": [1, 2, 3], "deep": { "er": [4, 50, 6] } }, "Planting into an inherited value"
+    assert granddad['nested']=={ "shallow": [1, 2, 3], "deep": { "er": [4, 5, 6] } }, "The inherited value stays intact"
+    assert child['nested']['shallow'] is granddad['nested']['shallow'], "Only the containers along the edited path have been copied"
+
+    registry    = { "alpha": "a" }
+    collection  = ParamSource(name='collection', own_data={ "contained_entries": registry })
+    collection.plant('contained_entries.beta', "b")
+    assert collection['contained_entries'] is registry and registry=={ "alpha": "a", "beta": "b" }, "Own unshared data is edited in place"
+
+    planted_value = { "path": "g" }
+    collection.plant('contained_entries.gamma', planted_value)
+    collection.plant('contained_entries.gamma.path', "G")
+    assert planted_value=={ "path": "g" } and collection['contained_entries']['gamma']=={ "path": "G" }, "but a value planted from outside is copied before being edited"
+
+    print('-'*20 + ' Worker threads: ' + '-'*20)
+
+    def lookup_via_own_frame(value):
+        with WorkerThreadState():
+            child.runtime_stack().append( ParamSource(name='frame', own_data={"first": value}) )
+            return child['first'], len(child.runtime_stack())
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        assert list( executor.map(lookup_via_own_frame, range(8)) )==[ (n, 1) for n in range(8) ], "Every worker thread only sees its own runtime frames"
+
+    assert child['first']=='esimene' and child.runtime_stack()==[], "The main thread's runtime stack is unaffected"
+
+    print('-'*20 + ' Dependency versions: ' + '-'*20)
+
+    recorder = DependencyRecorder.start()
+    dad['fifth'] = dad['fifth'].upper()
+    recorder.stop()
+    assert DependencyRecorder.deps_still_valid( recorder.deps ), "The computation's own side effects do not invalidate it"
+
+    recorder = DependencyRecorder.start()
+    fifth = dad['fifth']
+    other_thread = threading.Thread( target=dad.__setitem__, args=('fifth', 'viies') )
+    other_thread.start()
+    other_thread.join()
+    dad['third'] = 'kolmas'
+    recorder.stop()
+    assert not DependencyRecorder.deps_still_valid( recorder.deps ), "A change made by another thread during the computation does"
+
     from function_access import feed, prep, four_param_example_func
 
     print('-'*40 + ' feed() calls: ' + '-'*40)
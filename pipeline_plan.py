@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""Compiling a parsed pipeline (a list of steps, as produced by the axs script's cli_parse()) into a reusable PipelinePlan,
+    so that a pipeline run many times (once per entry in all_byquery, a sweep, a producer rule) is only interpreted once.
+
+    Every step of the pipeline maps onto one PlanStep:
+        [ action_name, pos_params, edit_dict, <label>, <label> ]    a call, with the labels split off
+        [ ]                                                         a restart from the pipeline's own entry
+        <int> or <str>                                              a restart that also passes the current result into the next call
+                                                                    (its position or name is folded into that call's step)
+
+Usage examples :
+                python3 -c 'import pipeline_plan; print(pipeline_plan.compile_pipeline([["byname", "shell"], ["get", "tool_path"], 0, ["func", "len"]]))'
+"""
+
+STEP_call       = 'call'
+STEP_restart    = 'restart'
+
+NESTED_CALL_heads   = ('^^', '^', 'AS^IS')
+
+
+def is_constant(structure):
+    "Does the structure contain no nested calls (or escapes) that would have to be evaluated?"
+
+    if type(structure)==list:
+        if structure and structure[0] in NESTED_CALL_heads:
+            return False
+        return all( is_constant(elem) for elem in structure )
+    elif type(structure)==dict:
+        return 'AS^IS' not in structure and all( is_constant(v) for v in structure.values() )
+    else:
+        return True
+
+
+class PlanStep:
+    """One compiled step of a pipeline.
+        Call steps hold the split-off labels, the pos_params already wrapped into a list,
+        and where (if at all) the previous step's result has to be passed in.
+    """
+
+    __slots__ = ('kind', 'action_name', 'pos_params', 'edit_dict', 'export_params', 'input_label', 'output_label',
+                 'pass_position', 'pass_name', 'qualified', 'constant_pos_params')
+
+    def __init__(self, kind):
+        self.kind           = kind
+        self.pass_position  = None
+        self.pass_name      = None
+
+
+    def __repr__(self):
+        if self.kind==STEP_call:
+            labels  = f"{self.output_label or ''}:{self.input_label or ''}: " if (self.input_label or self.output_label) else ''
+            passing = f" <- result at {self.pass_position}" if self.pass_position is not None else ( f" <- result as {self.pass_name}" if self.pass_name is not None else '' )
+            return f"{labels}{self.action_name} {self.pos_params} {self.edit_dict}{passing}"
+        else:
+            return self.kind
+
+
+class PipelinePlan:
+    """A compiled pipeline: a list of PlanSteps (one per original step), ready to be run by Runnable.execute_plan()
+        any number of times. The original pipeline is left intact.
+    """
+
+    __slots__ = ('steps', 'display_steps')
+
+    def __init__(self, steps, display_steps):
+        self.steps          = steps
+        self.display_steps  = display_steps     # the original steps without labels, for error messages
+
+
+    def __len__(self):
+        return len(self.steps)
+
+
+    def __repr__(self):
+        return "PipelinePlan[\n\t" + "\n\t".join( repr(step) for step in self.steps ) + "\n]"
+
+
+def compile_pipeline(pipeline, max_call_params=3):
+    "Turn a parsed pipeline into a PipelinePlan (max_call_params being action, pos_params and edit_dict)"
+
+    steps, display_steps    = [], []
+    pending_pass            = None      # the last int/str step, waiting for the next call to consume it
+
+    for call_params in pipeline:
+
+        if type(call_params) in (int, str):     # a number is a signal to insert the previous result into the pos_params of the next call,
+                                                # a string param name is a signal to add the previous result into edit_dict of the next call
+            steps.append( PlanStep(STEP_restart) )
+            display_steps.append( call_params )
+            pending_pass = call_params
+
+        elif call_params == []:                 # an empty list is a signal to start again from the pipeline's own entry
+            steps.append( PlanStep(STEP_restart) )
+            display_steps.append( call_params )
+
+        else:
+            call_params     = list(call_params)     # the labels are split off a copy
+            output_label    = call_params.pop(max_call_params) if len(call_params)>max_call_params else None    # NB: the order is important!
+            input_label     = call_params.pop(max_call_params) if len(call_params)>max_call_params else None
+
+            call_params_iter    = iter(call_params)
+            step                = PlanStep(STEP_call)
+            step.action_name    = next(call_params_iter)
+            step.pos_params     = next(call_params_iter, [])
+            step.edit_dict      = next(call_params_iter, {})
+            step.export_params  = next(call_params_iter, None)
+            step.input_label    = input_label
+            step.output_label   = output_label
+            step.qualified      = step.action_name[:1]=='.'
+
+            if type(step.pos_params)!=list:     # first ensure pos_params is a list
+                step.pos_params = [ step.pos_params ]   # simplified syntax for single positional parameter actions
+
+            if type(pending_pass) == int:       # insert the previous call's result into pos_params of the current call
+                step.pass_position = pending_pass + (1 if step.action_name=='func' else 0)
+            elif type(pending_pass) == str:     # add the previous call's result to the edit_dict of the current call
+                step.pass_name = pending_pass
+            pending_pass = None                 # empty it after use
+
+            step.constant_pos_params = step.pass_position is None and is_constant( step.pos_params )
+
+            steps.append( step )
+            display_steps.append( call_params )
+
+    return PipelinePlan( steps, display_steps )
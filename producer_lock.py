@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+"""Advisory cross-process locks around producer runs, so that several processes (CI jobs, SLURM tasks, possibly on different hosts
+    sharing the file system) asking byquery() for the same thing at the same time only run its producer once.
+
+    A lock is a file created with O_EXCL in the collection's .producer_locks_axs directory, named after the normalized query.
+    It holds the owner's pid, host, the query and the heartbeat interval; the owner touches the file every heartbeat while it runs.
+    A lock is stale (and is taken over automatically) if its owner process is gone (when on the same host)
+    or its heartbeat is older than AXS_PRODUCER_LOCK_STALE seconds.
+
+    The behaviour can be tuned via the environment:
+        AXS_PRODUCER_LOCKS              (0 to switch the locking off)
+        AXS_PRODUCER_LOCK_HEARTBEAT     (seconds between the heartbeats of the owner, default 10)
+        AXS_PRODUCER_LOCK_STALE         (seconds without a heartbeat before the lock counts as stale, default 60)
+        AXS_PRODUCER_LOCK_TIMEOUT       (max seconds to wait for a lock, 0 for no limit)
+
+Usage examples :
+                python3 producer_lock.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+import tracing
+from call_cache import env_limit
+
+
+class ProducerLock:
+    """The lock of one normalized query within one collection. Used as a context manager around the producer run;
+        after entering, .waited tells whether somebody else had been holding it (and so may have produced the entry meanwhile).
+    """
+
+    DIRNAME_locks       = '.producer_locks_axs'
+    enabled             = bool( env_limit('AXS_PRODUCER_LOCKS', 1) )
+    heartbeat_interval  = env_limit('AXS_PRODUCER_LOCK_HEARTBEAT', 10, float)
+    stale_after         = env_limit('AXS_PRODUCER_LOCK_STALE', 60, float)
+    timeout             = env_limit('AXS_PRODUCER_LOCK_TIMEOUT', 0, float)
+    poll_interval       = 0.5
+
+    held_here           = {}    # lock_path -> ident of the thread of this process holding it
+    held_here_lock      = threading.Lock()
+
+    def __init__(self, collection_path, lock_key, description=None):
+        self.lock_dir       = os.path.join( collection_path, self.DIRNAME_locks )
+        self.lock_path      = os.path.join( self.lock_dir, hashlib.sha1( repr(lock_key).encode() ).hexdigest() + '.lock' )
+        self.description    = description or repr(lock_key)
+        self.acquired       = False
+        self.waited         = False
+        self.token          = None
+        self.heartbeat_stop = None
+
+
+    @staticmethod
+    def read_owner(lock_path):
+        "The owner record of a lock file, None if there is no lock or it is still being written"
+
+        try:
+            with open(lock_path) as lock_file:
+                return json.load( lock_file )
+        except (OSError, ValueError):
+            return None
+
+
+    @staticmethod
+    def process_alive(pid):
+        try:
+            os.kill( pid, 0 )
+        except ProcessLookupError:
+            return False
+        except PermissionError:     # somebody else's process
+            pass
+        return True
+
+
+    def is_stale(self, owner):
+        "Has the owner of the lock died or stopped its heartbeat?"
+
+        try:
+            heartbeat_age = time.time() - os.stat( self.lock_path ).st_mtime
+        except FileNotFoundError:
+            return False    # already gone
+
+        if owner and owner.get("host")==socket.gethostname() and not self.process_alive( owner.get("pid") ):
+            return True
+
+        return heartbeat_age > max( self.stale_after, 2*(owner or {}).get("heartbeat_interval", 0) )
+
+
+    def live_owner(self):
+        "The owner record if the lock is held by another live owner (not by the current thread), otherwise None"
+
+        if not self.enabled or ProducerLock.held_here.get( self.lock_path )==threading.get_ident():
+            return None
+
+        owner = self.read_owner( self.lock_path )
+        if owner is None and not os.path.exists( self.lock_path ):
+            return None
+        elif self.is_stale( owner ):
+            return None
+        else:
+            return owner or {}
+
+
+    def try_acquire(self):
+        try:
+            lock_fd = os.open( self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644 )
+        except FileExistsError:
+            return False
+
+        self.token = uuid.uuid4().hex
+        with os.fdopen( lock_fd, 'w' ) as lock_file:
+            json.dump( { "pid": os.getpid(), "host": socket.gethostname(), "thread": threading.get_ident(), "token": self.token,
+                         "query": self.description, "started": time.time(), "heartbeat_interval": self.heartbeat_interval }, lock_file )
+        return True
+
+
+    def take_over_if_stale(self):
+        "Move a stale lock out of the way (only one of the competing processes succeeds), and check it was the stale one"
+
+        owner = self.read_owner( self.lock_path )
+        if not self.is_stale( owner ):
+            return
+
+        stale_path = f"{self.lock_path}.stale.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.rename( self.lock_path, stale_path )
+        except FileNotFoundError:
+            return      # somebody else has taken it over (or it has been released)
+
+        moved_owner = self.read_owner( stale_path )
+        if owner and moved_owner and moved_owner.get("token")!=owner.get("token"):     # a fresh lock appeared in between, put it back
+            try:
+                os.link( stale_path, self.lock_path )
+            except OSError:
+                pass
+        else:
+            logging.warning(f"Taking over the stale producer lock for {self.description} from {owner}")
+        os.remove( stale_path )
+
+
+    def heartbeat(self, stop_event):
+        while not stop_event.wait( self.heartbeat_interval ):
+            try:
+                os.utime( self.lock_path )
+            except OSError as e:
+                logging.warning(f"Could not refresh the producer lock {self.lock_path}: {e}")
+
+
+    def acquire(self):
+        if not self.enabled:
+            return self
+
+        if ProducerLock.held_here.get( self.lock_path )==threading.get_ident():     # re-entered by the owner
+            return self
+
+        try:
+            os.makedirs( self.lock_dir, exist_ok=True )
+        except OSError as e:
+            logging.debug(f"Could not create {self.lock_dir}, producing {self.description} without a lock: {e}")
+            return self
+
+        start_time = time.monotonic()
+        while not self.try_acquire():
+            if not self.waited:
+                owner = self.read_owner( self.lock_path )
+                logging.warning(f"Waiting for {owner or 'another process'} to finish producing {self.description} ...")
+                if tracing.events_enabled:
+                    tracing.event("lock_wait_begin", query=self.description, owner_pid=(owner or {}).get("pid"))
+                self.waited = True
+
+            self.take_over_if_stale()
+
+            if self.timeout and time.monotonic()-start_time > self.timeout:
+                raise TimeoutError(f"Gave up waiting for the producer lock {self.lock_path} of {self.description} after {self.timeout} seconds")
+            time.sleep( self.poll_interval )
+
+        if self.waited and tracing.events_enabled:
+            tracing.event("lock_wait_end", query=self.description)
+
+        self.acquired = True
+        with ProducerLock.held_here_lock:
+            ProducerLock.held_here[self.lock_path] = threading.get_ident()
+
+        self.heartbeat_stop = threading.Event()
+        threading.Thread( target=self.heartbeat, args=(self.heartbeat_stop,), daemon=True ).start()
+        return self
+
+
+    def release(self):
+        if not self.acquired:
+            return
+
+        self.heartbeat_stop.set()
+        with ProducerLock.held_here_lock:
+            ProducerLock.held_here.pop( self.lock_path, None )
+
+        if (self.read_owner( self.lock_path ) or {}).get("token")==self.token:  # it may have been taken over while we were stuck
+            try:
+                os.remove( self.lock_path )
+            except FileNotFoundError:
+                pass
+        self.acquired = False
+
+
+    def wait_for_release(self):
+        "Wait until nobody else holds the lock (without taking it)"
+
+        with tracing.Span("lock_wait", query=self.description):
+            while self.live_owner() is not None:
+                time.sleep( self.poll_interval )
+
+
+    def __enter__(self):
+        return self.acquire()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+if __name__ == '__main__':
+
+    import subprocess
+    import sys
+    import tempfile
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(funcName)s %(message)s")
+
+    collection_path = tempfile.mkdtemp()
+
+    print('-'*20 + ' Exclusive ownership: ' + '-'*20)
+
+    with ProducerLock( collection_path, ('tags', 'tag+', "'downloaded'") ) as first_lock:
+        assert first_lock.acquired and not first_lock.waited, "the first requester gets the lock straight away"
+        owner = ProducerLock.read_owner( first_lock.lock_path )
+        assert owner["pid"]==os.getpid() and owner["host"]==socket.gethostname(), "the owner is recorded"
+        assert first_lock.live_owner() is None, "the owner does not wait for itself"
+        reentered_lock = ProducerLock( collection_path, ('tags', 'tag+', "'downloaded'") ).acquire()
+        assert not reentered_lock.waited and not reentered_lock.acquired, "re-entered by the owner thread without waiting, the outer lock stays in charge"
+
+        other_thread_saw = []
+        checker = threading.Thread( target=lambda: other_thread_saw.append( ProducerLock( collection_path, ('tags', 'tag+', "'downloaded'") ).live_owner() ) )
+        checker.start()
+        checker.join()
+        assert other_thread_saw[0]["pid"]==os.getpid(), "other threads see the live owner"
+
+    assert not os.path.exists( first_lock.lock_path ), "released"
+
+    print('-'*20 + ' Waiting for another process: ' + '-'*20)
+
+    holder = subprocess.Popen( [ sys.executable, '-c', f"""
+import sys, time
+sys.path.insert(0, {os.path.dirname(os.path.realpath(__file__))!r})
+from producer_lock import ProducerLock
+with ProducerLock({collection_path!r}, 'shared'):
+    print('locked', flush=True)
+    time.sleep(1)
+""" ], stdout=subprocess.PIPE, text=True )
+    assert holder.stdout.readline().strip()=='locked'
+
+    start_time = time.monotonic()
+    with ProducerLock( collection_path, 'shared' ) as second_lock:
+        assert second_lock.waited and time.monotonic()-start_time > 0.3, "the second requester had to wait"
+    holder.wait()
+
+    print('-'*20 + ' Taking over a stale lock: ' + '-'*20)
+
+    dead_process = subprocess.Popen( [ sys.executable, '-c', 'pass' ] )
+    dead_process.wait()
+    stale_lock = ProducerLock( collection_path, 'abandoned' )
+    os.makedirs( stale_lock.lock_dir, exist_ok=True )
+    with open( stale_lock.lock_path, 'w' ) as lock_file:
+        json.dump( { "pid": dead_process.pid, "host": socket.gethostname(), "token": "dead", "heartbeat_interval": 10 }, lock_file )
+
+    assert stale_lock.live_owner() is None, "a lock of a dead process is not live"
+    with ProducerLock( collection_path, 'abandoned' ) as new_lock:
+        assert new_lock.acquired and ProducerLock.read_owner( new_lock.lock_path )["pid"]==os.getpid(), "the stale lock has been taken over"
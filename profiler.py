@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""Profiling the kernel's work: a tracing sink that builds a hierarchical timing tree out of the spans the kernel emits,
+    and a ranked summary of where the time went.
+
+    Every span (a pipeline being executed, an action call, a parameter being computed, a nested ^^ or ^ call,
+    a byquery or a producer rule being run) becomes a node with the entry's name, what was being done,
+    whether it came from a cache, its wall and CPU time and its children.
+
+    Switched on by `axs --profile ...` (or AXS_PROFILE=on), which prints the summary to stderr when the pipeline is done;
+    `axs --profile=tree.json ...` (or AXS_PROFILE=tree.json) also dumps the whole tree as JSON for offline analysis.
+    AXS_PROFILE_TOP sets the number of lines of the summary (default 30).
+
+Usage examples :
+                axs --profile byquery shell_tool,can_download_url
+                axs --profile=/tmp/tree.json byquery shell_tool,can_download_url
+                python3 profiler.py /tmp/tree.json
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import tracing
+from call_cache import env_limit
+
+DETAIL_fields   = ('action', 'param', 'query', 'rule')     # what the span was about, by kind of span
+
+
+class Profiler:
+    "A tracing sink that builds a timing tree per thread (all the trees end up in the same list of roots)"
+
+    def __init__(self, dump_path=None):
+        self.dump_path      = dump_path
+        self.roots          = []
+        self.roots_lock     = threading.Lock()
+        self.thread_state   = threading.local()
+        self.open_stacks    = []    # the stacks of all the threads seen, to close the spans still open at finish()
+        self.started        = time.perf_counter()
+
+
+    def stack(self):
+        stack = getattr(self.thread_state, 'stack', None)
+        if stack is None:
+            stack = self.thread_state.stack = []
+            with self.roots_lock:
+                self.open_stacks.append( stack )
+        return stack
+
+
+    def attach(self, stack, node):
+        if stack:
+            stack[-1]["children"].append( node )
+        else:
+            node["tid"] = threading.get_native_id()
+            if threading.current_thread() is not threading.main_thread():
+                node["thread"] = threading.current_thread().name
+            with self.roots_lock:
+                self.roots.append( node )
+
+
+    @staticmethod
+    def close(node, timestamp):
+        node["wall"]    = timestamp - node.pop("begin")
+        node["cpu"]     = time.thread_time() - node.pop("cpu_begin")
+
+
+    def __call__(self, event_kind, timestamp, fields):
+        span_kind, _, phase = event_kind.rpartition('_')
+        stack               = self.stack()
+
+        if phase=='begin':
+            node = { "kind": span_kind, **fields, "start": timestamp-self.started, "begin": timestamp, "cpu_begin": time.thread_time(), "children": [] }
+            if span_kind in ('call', 'param'):
+                node["cache"] = "miss"
+            self.attach( stack, node )
+            stack.append( node )
+
+        elif phase=='end':
+            for depth in range(len(stack)-1, -1, -1):
+                if stack[depth]["kind"]==span_kind:
+                    while len(stack)>depth:     # also closing the spans left open by an exception
+                        self.close( stack.pop(), timestamp )
+                    break
+
+        elif phase=='cached':
+            self.attach( stack, { "kind": span_kind, **fields, "cache": "hit", "start": timestamp-self.started, "wall": 0.0, "cpu": 0.0, "children": [] } )
+
+
+    def stop(self):
+        "Stop listening and close the spans that are still open. Returns the time of stopping"
+
+        tracing.remove_sink( self )
+        timestamp = time.perf_counter()
+        for stack in self.open_stacks:
+            while stack:
+                node = stack.pop()
+                node["wall"] = timestamp - node.pop("begin")
+                node["cpu"]  = None     # another thread's CPU time is not known here
+                node.pop("cpu_begin")
+
+        return timestamp
+
+
+    def finish(self):
+        "Stop listening, print the summary and dump the tree if asked to"
+
+        timestamp = self.stop()
+
+        print( self.summary( env_limit('AXS_PROFILE_TOP', 30) ), file=sys.stderr )
+
+        if self.dump_path:
+            with open(self.dump_path, 'w') as dump_file:
+                json.dump( { "wall": timestamp-self.started, "roots": self.roots }, dump_file, indent=1, default=repr )
+            logging.info(f"The profile tree has been dumped into {self.dump_path}")
+
+
+    def summary(self, top=30):
+        return format_summary( self.roots, time.perf_counter()-self.started, top )
+
+
+def span_label(node):
+    detail = next( (node[f] for f in DETAIL_fields if node.get(f) is not None), '' )
+    return f"{node['kind']} {node.get('entry', '')} {detail}".rstrip()
+
+
+def format_summary(roots, total_wall, top=30):
+    """Rank the kinds of spans by their inclusive wall time (the time of a recursive span is counted at its outermost occurrence).
+        Also shows their self time (without the children), CPU time, the number of occurrences and of cache hits.
+    """
+    rows            = {}    # label -> [ count, hits, inclusive_wall, self_wall, cpu ]
+    active_labels   = {}    # label -> how many times it is on the current path
+    to_visit        = [ (node, False) for node in reversed(roots) ]
+
+    while to_visit:
+        node, leaving = to_visit.pop()
+        label = span_label( node )
+
+        if leaving:
+            active_labels[label] -= 1
+            continue
+
+        row = rows.get( label )
+        if row is None:
+            row = rows[label] = [ 0, 0, 0.0, 0.0, 0.0 ]
+        row[0] += 1
+        if node.get("cache")=="hit":
+            row[1] += 1
+        row[3] += node["wall"] - sum( child["wall"] for child in node["children"] )
+        if not active_labels.get( label ):
+            row[2] += node["wall"]
+            row[4] += node["cpu"] or 0.0
+
+        active_labels[label] = active_labels.get( label, 0 ) + 1
+        to_visit.append( (node, True) )
+        to_visit.extend( (child, False) for child in reversed(node["children"]) )
+
+    ranked  = sorted( rows.items(), key=lambda label_row: label_row[1][2], reverse=True )
+    lines   = [ f"{'-'*40} axs profile: {total_wall:.3f}s wall, top {min(top, len(ranked)) if top else len(ranked)} of {len(ranked)} {'-'*40}",
+                f"{'wall_s':>10} {'self_s':>10} {'cpu_s':>10} {'count':>8} {'hits':>8}  span" ]
+    for label, (count, hits, inclusive_wall, self_wall, cpu) in ranked[:top or None]:
+        lines.append( f"{inclusive_wall:10.4f} {self_wall:10.4f} {cpu:10.4f} {count:8d} {hits:8d}  {label}" )
+
+    return "\n".join( lines )
+
+
+def from_environment():
+    "Start profiling if AXS_PROFILE asks for it. Returns the Profiler (to be finish()ed) or None"
+
+    setting = os.getenv('AXS_PROFILE', '')
+    if setting.lower() in ('', '0', 'off', 'no', 'false'):
+        return None
+
+    profiler = Profiler( dump_path=None if setting.lower() in ('1', 'on', 'yes', 'true') else setting )
+    tracing.add_sink( profiler )
+    return profiler
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv)>1:     # summarize a dumped tree
+        with open(sys.argv[1]) as dump_file:
+            dumped_profile = json.load( dump_file )
+        print( format_summary( dumped_profile["roots"], dumped_profile["wall"], int(sys.argv[2]) if len(sys.argv)>2 else 30 ) )
+
+    else:
+        profiler = Profiler()
+        tracing.add_sink( profiler )
+
+        with tracing.Span("byquery", entry="work_collection", query="outer"):
+            tracing.event("call_begin", entry="work_collection", action="byquery")
+            tracing.event("param_cached", entry="shell", param="tool_path")
+            with tracing.Span("byquery", entry="work_collection", query="outer"):   # recursion is only counted once
+                time.sleep(0.02)
+            tracing.event("call_end", entry="work_collection", action="byquery")
+        tracing.event("execute_begin", entry="kernel", steps=1)                     # left open by an exception
+
+        profiler.finish()
+
+        outer_node = profiler.roots[0]
+        assert outer_node["wall"] >= 0.02 and outer_node["children"][0]["cache"]=="miss", "a call computed"
+        assert outer_node["children"][0]["children"][0]["cache"]=="hit", "a parameter taken from the cache"
+        assert "begin" not in profiler.roots[1] and profiler.roots[1]["wall"] is not None, "closed at finish()"
+
+        summary_lines = profiler.summary().split("\n")
+        assert summary_lines[2].endswith("byquery work_collection outer") and summary_lines[2].split()[3]=="2", "both occurrences counted"
+        assert abs( float(summary_lines[2].split()[0]) - outer_node["wall"] ) < 1e-3, "but the recursive time only once"
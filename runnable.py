@@ -2,13 +2,183 @@
 
 import inspect
 import logging
+import os
 import re
 import sys
-from copy import deepcopy
 
 import function_access
+import metrics
+import pipeline_plan
+import tracing
 import ufun
-from param_source import ParamSource
+from call_cache import CallCache
+from param_source import ParamSource, DependencyRecorder, structural_fingerprint
+
+
+class LazyCallRecord:
+    """A placeholder for the __record_entry__ of a call, turned into the actual call_record_entry
+        only if something looks it up during the call.
+    """
+
+    def __init__(self, caller, action_name, rt_call_specific):
+        self.caller             = caller
+        self.action_name        = action_name
+        self.rt_call_specific   = rt_call_specific
+        self.bound_args         = None  # (action_object, given_arg_list, joint_arg_tuple, optional_arg_dict) once the arguments are known
+        self.call_record_entry  = None
+
+
+    def materialize(self):
+        if self.call_record_entry is None:
+            self.call_record_entry = self.caller.new_call_record_entry( self.action_name )
+            self.rt_call_specific['__record_entry__'] = self.call_record_entry
+
+            captured_mapping = self.call_record_entry.own_data()
+            if self.bound_args:
+                action_object, given_arg_list, joint_arg_tuple, optional_arg_dict = self.bound_args
+                function_access.binder_for(action_object).capture_mapping( given_arg_list, joint_arg_tuple, optional_arg_dict, captured_mapping )
+            self.caller.fill_call_record_entry( self.call_record_entry, self.action_name, self.rt_call_specific )
+
+        return self.call_record_entry
+
+
+class CallFrame:
+    """A compact runtime stack frame holding the parameters of one call (or one pipeline),
+        answering the same lookup protocol as a ParamSource on the runtime_stack, but without any caches of its own.
+
+        Frames are pooled: acquire() one for a call and release() it once it has been popped off the runtime_stack.
+        The rare operations that need parents, nested calls or planting go through a temporary Runnable view (as_runnable()).
+    """
+
+    __slots__ = ('name', 'own_data_cache', 'runtime_stack_cache', 'serial', 'data_version', 'whole_data_version', 'key_versions', 'fingerprint_cache', 'blocked_param_set', 'parent', 'kernel')
+
+    pool        = []    # released frames ready for reuse
+    POOL_size   = 256
+
+    # the parts of the ParamSource lookup protocol that a frame shares verbatim:
+    __repr__                    = ParamSource.__repr__
+    fingerprint                 = ParamSource.fingerprint
+    data_changed                = ParamSource.data_changed
+    changed_since               = ParamSource.changed_since
+    get_own_value_generator     = ParamSource.get_own_value_generator
+    get_stack_value_generator   = ParamSource.get_stack_value_generator
+    stack_provides_any          = ParamSource.stack_provides_any
+
+
+    def __init__(self):
+        self.data_version       = 0
+        self.whole_data_version = 0
+        self.key_versions       = {}
+        self.blocked_param_set  = {}
+
+
+    @classmethod
+    def acquire(cls, name, own_data, parent=None, kernel=None, adopt_data=False):
+        """Take a frame from the pool (or make a new one) and fill it with own_data,
+            which is adopted without copying if adopt_data is set.
+        """
+        try:
+            frame = cls.pool.pop()
+        except IndexError:
+            frame = cls()
+
+        frame.name                  = name
+        frame.serial                = next(ParamSource.serial_counter)
+        frame.data_version         += 1
+        frame.whole_data_version    = frame.data_version
+        frame.fingerprint_cache     = None
+        frame.runtime_stack_cache   = ()
+        frame.parent                = parent
+        frame.kernel                = kernel
+        frame.own_data_cache        = own_data if adopt_data else {}
+
+        if own_data:
+            frame.set_own_data( own_data, topup=True )
+
+        return frame
+
+
+    def release(self):
+        "Return the frame to the pool, dropping all its references"
+
+        self.own_data_cache         = None
+        self.runtime_stack_cache    = ()
+        self.fingerprint_cache      = None
+        self.parent                 = None
+        self.kernel                 = None
+        if self.blocked_param_set:
+            self.blocked_param_set.clear()
+
+        if len(CallFrame.pool) < CallFrame.POOL_size:
+            CallFrame.pool.append( self )
+
+
+    def get_name(self):
+        return self.name
+
+
+    def runtime_stack(self, new_stack_value=None):
+        "A frame belongs to one thread, so it keeps its runtime stack to itself"
+
+        if new_stack_value is not None:
+            self.runtime_stack_cache = new_stack_value
+
+        return self.runtime_stack_cache
+
+
+    def blocked_params(self):
+        return self.blocked_param_set
+
+
+    def own_data(self, data_dict=None):
+        "Read own data or replace it with a dictionary that nobody else holds"
+
+        if data_dict is not None:
+            self.own_data_cache = data_dict
+            self.data_changed()
+        return self.own_data_cache
+
+
+    def set_own_data(self, mix_dict, topup=False):
+        "Add the plain key-value pairs directly, planting the pure edits (dotted or augmenting keys) via the Runnable view"
+
+        if not topup:
+            self.own_data_cache = {}
+
+        own_data_cache  = self.own_data_cache
+        pure_edits      = []
+        for key_path in list(mix_dict) if own_data_cache is mix_dict else mix_dict:
+            if key_path.find('.')>-1 or key_path.endswith('+'):
+                pure_edits.extend( (key_path, mix_dict[key_path]) )
+                if own_data_cache is mix_dict:  # an adopted dictionary
+                    del own_data_cache[key_path]
+            elif own_data_cache is not mix_dict:
+                own_data_cache[key_path] = mix_dict[key_path]
+
+        self.data_changed()
+
+        if pure_edits:
+            self.as_runnable().plant( *pure_edits )
+            self.data_changed()
+
+
+    def __setitem__(self, param_name, param_value):
+        param_name = str(param_name)
+        self.own_data_cache[param_name] = param_value
+        self.data_changed( param_name )
+
+
+    def as_runnable(self):
+        "A temporary Runnable sharing this frame's data and runtime stack, with the frame's parent (if any) as its only parent"
+
+        if type(self.runtime_stack_cache)!=list:
+            self.runtime_stack_cache = []
+
+        has_data_parents = ParamSource.PARAMNAME_parent_entries in self.own_data_cache
+        view = Runnable(name=self.name, parent_objects=(None if has_data_parents or not self.parent else [ self.parent ]), kernel=self.kernel)
+        view.own_data_cache         = self.own_data_cache
+        view.runtime_stack( self.runtime_stack_cache )
+        return view
 
 
 class Runnable(ParamSource):
@@ -20,22 +190,44 @@ class Runnable(ParamSource):
 
     pipeline_counter                = 0
     ESCAPE_do_not_process           = 'AS^IS'
+    PARAM_CACHE_enabled             = os.getenv('AXS_PARAM_CACHE', 'on').lower() not in ('0', 'off', 'no', 'false')
+    RECORD_all_calls                = os.getenv('AXS_RECORD_CALLS', 'off').lower() not in ('0', 'off', 'no', 'false')
 
     def __init__(self, own_functions=None, kernel=None, **kwargs):
         "Accept setting own_functions and kernel in addition to parent's parameters"
 
         self.own_functions_cache    = own_functions
         self.kernel                 = kernel
-        self.call_cache             = {}
+        self.call_cache             = None  # a CallCache, created on the first call to store
+        self.function_cache         = {}    # function_name -> (lineage_version, function_object, ancestry_path)
+        self.param_value_cache      = {}    # (param_name, parent_recursion) -> (param_value, deps)
 
         super().__init__(**kwargs)
-        logging.debug(f"[{self.get_name()}] Initializing the Runnable with {self.list_own_functions() if self.own_functions_cache else 'no'} pre-loaded functions and kernel={self.kernel}")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Initializing the Runnable with {self.list_own_functions() if self.own_functions_cache else 'no'} pre-loaded functions and kernel={self.kernel}")
 
 
     def get_kernel(self):
         return self.kernel
 
 
+    def get_call_cache(self):
+        "Lazily create the bounded cache of this object's call results"
+
+        if self.call_cache is None:
+            self.call_cache = CallCache( self.get_name() )
+        return self.call_cache
+
+
+    def call_cache_stats(self):
+        """Hits, misses and evictions of this object's call cache
+
+Usage examples :
+                axs byname shell , run 'echo hello' , , byname shell , run 'echo hello' , , byname shell , call_cache_stats
+        """
+        return self.get_call_cache().stats()
+
+
     def own_functions(self):
         """Placeholder for lazy-loading code in subclasses that support it.
 
@@ -59,38 +251,52 @@ Usage examples :
 
 
     def reach_function(self, function_name):
-        "Find a Runnable's function through the inheritance hierarchy"
+        "Find a Runnable's function through the inheritance hierarchy, cached until any object's parents or code change"
+
+        memo = self.function_cache.get(function_name)
+        if memo and memo[0]==ParamSource.lineage_version:
+            return memo[1], list(memo[2])
 
+        found_function, found_path = None, None
         ancestor_name_order = []
-        for parent_obj, ancestry_path in self.parent_generator():
+        for parent_obj, ancestry_path in self.ancestry_generator():
             own_functions   = parent_obj.own_functions()
 
             if hasattr(own_functions, function_name):
-                found_function = getattr(own_functions, function_name)
-                if inspect.isfunction(found_function):
-                    return found_function, ancestry_path
+                candidate_function = getattr(own_functions, function_name)
+                if inspect.isfunction(candidate_function):
+                    found_function, found_path = candidate_function, ancestry_path
+                    break
             else:
                 ancestor_name_order += [ parent_obj.get_name() ]
 
-        return None, ancestor_name_order
+        if found_function is None:
+            found_path = ancestor_name_order
+
+        self.function_cache[function_name] = (ParamSource.lineage_version, found_function, tuple(found_path))
+
+        return found_function, list(found_path)
 
 
     def reach_action(self, action_name, _ancestry_path=None):
         "First try to reach for a Runnable's function (externally loaded code), if unavailable - try Runnable's method instead."
 
-        logging.debug(f"[{self.get_name()}] reach_action({action_name}) ...")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] reach_action({action_name}) ...")
         if _ancestry_path == None:  # if we have to initialize it internally, the value will be lost to the caller
             _ancestry_path = []
 
         function_object, ancestry_path = self.reach_function( action_name )
         if function_object:
-            logging.debug(f"[{self.get_name()}] reach_action({action_name}) was found as a function")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] reach_action({action_name}) was found as a function")
 
             _ancestry_path.extend( ancestry_path )
             return function_object
 
         elif hasattr(self, action_name):
-            logging.debug(f"[{self.get_name()}] reach_action({action_name}) was found as a class method")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] reach_action({action_name}) was found as a class method")
 
             return getattr(self, action_name)
         else:
@@ -205,40 +411,91 @@ Usage examples :
     def __getitem__(self, param_name, parent_recursion=None, perform_nested_calls=True):
         """Lazy parameter access: returns the parameter value from self or the closest parent,
             automatically executing nested_calls on the result.
+
+            The computed values are cached together with the entries and parameters they have read,
+            and only recomputed when any of those has been planted, edited or reloaded since.
+            Set AXS_PARAM_CACHE=off to disable this cache.
         """
-        logging.debug(f"[{self.get_name()}]  Looking for [{param_name}]...")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}]  Looking for [{param_name}]...")
 
         if param_name=='__entry__':
             return self
 
+        cache_key = (str(param_name), parent_recursion)
+        if perform_nested_calls and self.PARAM_CACHE_enabled:
+            cached_value_and_deps = self.param_value_cache.get(cache_key)
+            if cached_value_and_deps and DependencyRecorder.deps_still_valid( cached_value_and_deps[1] ):
+                metrics.counters["param_cache_hits"] += 1
+                param_value, deps = cached_value_and_deps
+                DependencyRecorder.replay( deps )
+                if tracing.debug_enabled:
+                    logging.debug(f"[{self.get_name()}]  Got {param_name}={param_value} from the parameter cache")
+                if tracing.events_enabled:
+                    tracing.event("param_cached", entry=self.get_name(), param=cache_key[0])
+                return param_value
+
+            metrics.counters["param_cache_misses"] += 1
+            recorder = DependencyRecorder.start()
+        else:
+            recorder = None
+
+        if tracing.events_enabled:
+            tracing.event("param_begin", entry=self.get_name(), param=cache_key[0])
+        try:
+            param_value = self.compute_item(param_name, parent_recursion, perform_nested_calls)
+        finally:
+            if recorder:
+                recorder.stop()
+            if tracing.events_enabled:
+                tracing.event("param_end", entry=self.get_name(), param=cache_key[0])
+
+        if recorder and recorder.cacheable:
+            self.param_value_cache[cache_key] = (param_value, recorder.deps)
+
+        return param_value
+
+
+    def compute_item(self, param_name, parent_recursion, perform_nested_calls):
+        "The uncached part of __getitem__()"
+
         try:
             getitem_gen                             = self.getitem_generator( str(param_name), parent_recursion )
             value_source_entry, unprocessed_value   = next(getitem_gen)
 
         except StopIteration:
-            logging.debug(f"[{self.get_name()}]  I don't have parameter '{param_name}', and neither do the parents - raising KeyError")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}]  I don't have parameter '{param_name}', and neither do the parents - raising KeyError")
             raise KeyError(param_name)
 
+        if type(unprocessed_value)==LazyCallRecord:
+            unprocessed_value = unprocessed_value.materialize()
+
         if perform_nested_calls:
-            if param_name not in value_source_entry.blocked_param_set:
-                value_source_entry.blocked_param_set[param_name] = set()
+            blocked_param_set = value_source_entry.blocked_params()
+            if param_name not in blocked_param_set:
+                blocked_param_set[param_name] = set()
 
-            value_source_entry.blocked_param_set[param_name].add(self.get_name())
+            blocked_param_set[param_name].add(self.get_name())
 
-            logging.debug(f"[{self.get_name()}]  BLOCKING '{param_name}' in order to compute nested_calls on {unprocessed_value} ...")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}]  BLOCKING '{param_name}' in order to compute nested_calls on {unprocessed_value} ...")
             try:
                 param_value = self.nested_calls(unprocessed_value)
             except Exception as e:
-                logging.debug(f"[{self.get_name()}]  unBLOCKING '{param_name}' after attempt to compute nested_calls on {unprocessed_value} ...")
-                del value_source_entry.blocked_param_set[param_name]
+                if tracing.debug_enabled:
+                    logging.debug(f"[{self.get_name()}]  unBLOCKING '{param_name}' after attempt to compute nested_calls on {unprocessed_value} ...")
+                del blocked_param_set[param_name]
                 raise e
-            logging.debug(f"[{self.get_name()}]  unBLOCKING '{param_name}' after computing nested_calls on {unprocessed_value} ...")
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}]  unBLOCKING '{param_name}' after computing nested_calls on {unprocessed_value} ...")
 
-            value_source_entry.blocked_param_set[param_name].remove(self.get_name())
+            blocked_param_set[param_name].remove(self.get_name())
         else:
             param_value = unprocessed_value
 
-        logging.debug(f"[{self.get_name()}]  Got {param_name}={param_value}")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}]  Got {param_name}={param_value}")
 
         return param_value
 
@@ -270,30 +527,72 @@ Usage examples :
 
             The action can have a mix of positional args and named args with optional defaults.
 
-            Currently all calls are assumed to be deterministic, and their results are cached (subject to context):
+            By default calls are assumed to be deterministic, and their results are cached (subject to context):
                 axs mi: fresh_entry , plant alpha 10  beta 20  formula --:='AS^IS:^^:substitute:#{alpha}#-#{beta}#' , get formula
                 axs mi: fresh_entry , plant alpha 10  beta 20  formula --:='AS^IS:^^:substitute:#{alpha}#-#{beta}#' , get formula , get mi , get formula
                 axs mi: fresh_entry , plant alpha 10  beta 20  formula --:='AS^IS:^^:substitute:#{alpha}#-#{beta}#' , get formula , get mi , get formula --alpha=100
+
+            A non-deterministic call is neither taken from the cache, nor allows the parameter values that use it to be cached:
+                "timestamp": [ "^^", "func", [ "time.time" ], {}, null, false ]
+
+            A call is recorded into a call_record_entry only when asked for (by the action's __record_entry__ argument,
+            by an input label, by a parameter that gets __record_entry__ during the call, or by AXS_RECORD_CALLS=on for all calls):
+                axs byname base_for_editing , :rec: get dic , , get rec , own_data
         """
 
-        logging.debug(f'[{self.get_name()}]  calling action "{action_name}" with pos_params={pos_params} and edit_dict={edit_dict} ...')
+        if tracing.debug_enabled:
+            logging.debug(f'[{self.get_name()}]  calling action "{action_name}" with pos_params={pos_params} and edit_dict={edit_dict} ...')
 
-        cache_tail = '\n\t+'.join([repr(s) for s in self.runtime_stack()])
-        cache_key = f"{action_name}.{pos_params}/{ufun.repr_dict(edit_dict)}\n\t+{cache_tail}"
+        cache_key = ( action_name, structural_fingerprint(pos_params), structural_fingerprint(edit_dict), tuple( s.fingerprint() for s in self.runtime_stack() ) )
 
-        if deterministic and (cache_key in self.call_cache):
-            cached_value = self.call_cache[cache_key]
-            logging.debug(f"[{self.get_name()}]  Call '{cache_key}' is FOUND IN CACHE, returning {cached_value}")
-            return cached_value
+        if not deterministic:
+            DependencyRecorder.mark_uncacheable()
         else:
+            cached_record = self.get_call_cache().lookup( cache_key )
+            if cached_record and (cached_record[1] is None or DependencyRecorder.deps_still_valid( cached_record[1] )):    # the call's inputs may have been edited since
+                cached_value, deps, cacheable = cached_record[:3]
+                if tracing.debug_enabled:
+                    logging.debug(f"[{self.get_name()}]  Call '{cache_key}' is FOUND IN CACHE, returning {cached_value}")
+                if tracing.events_enabled:
+                    tracing.event("call_cached", entry=self.get_name(), action=action_name)
+                DependencyRecorder.replay( deps or {} )
+                if not cacheable:
+                    DependencyRecorder.mark_uncacheable()
+                return cached_value
+
+        if tracing.debug_enabled:
             logging.debug(f"[{self.get_name()}]  Call '{cache_key}' NOT TAKEN from cache, have to run...")
 
+        metrics.counters["actions_run"] += 1
+        if tracing.events_enabled:
+            tracing.event("call_begin", entry=self.get_name(), action=action_name)
+
+        recorder = DependencyRecorder.start() if self.PARAM_CACHE_enabled else None
+        try:
+            result = self.uncached_local_call(action_name, pos_params, edit_dict, export_params, call_record_entry_ptr, nested_context, slice_relative_to)
+        finally:
+            if recorder:
+                recorder.stop()
+            if tracing.events_enabled:
+                tracing.event("call_end", entry=self.get_name(), action=action_name)
+
+        if recorder:
+            self.get_call_cache().store( cache_key, result, recorder.deps, recorder.cacheable )
+        else:
+            self.get_call_cache().store( cache_key, result, None, False )
+
+        return result
+
+
+    def uncached_local_call(self, action_name, pos_params, edit_dict, export_params, call_record_entry_ptr, nested_context, slice_relative_to):
+        "The uncached part of local_call()"
+
 
         ak = self.get_kernel()
 
         imported_slice = slice_relative_to.slice( *export_params ) if (export_params and slice_relative_to) else {}
 
-        rt_call_specific = Runnable(name='rt_call_specific_'+action_name+'/'+str(pos_params), own_data=imported_slice, parent_objects = [ self ], kernel=ak)     # FIXME: overlapping entry names are not unique
+        rt_call_specific = CallFrame.acquire('rt_call_specific_'+action_name+'/'+str(pos_params), imported_slice, self, ak, adopt_data=True)     # FIXME: overlapping entry names are not unique
 
         local_edits  = {}
         for one_edit in edit_dict or {}:
@@ -315,14 +614,9 @@ Usage examples :
             rt_call_specific.runtime_stack( nested_context )
 
         # FIXME: this is a candidate for deletion. Be sure to seriously test the hell out of it
-        rt_call_specific.own_data( self.nested_calls( rt_call_specific.own_data() ) )   # perform the delayed interpretation of expressions
-
-        if ak:
-            call_record_entry   = ak.fresh_entry(container=ak.record_container(), generated_name_prefix=f"generated_by_{self.get_name()}_on_{action_name}_")
-            captured_mapping    = call_record_entry.own_data()  # retain the pointer to perform modifications later
-        else:
-            captured_mapping    = None  # request not to capture the mapping
-            call_record_entry   = None  # to please a testing edge case
+        processed_call_specific = self.nested_calls( rt_call_specific.own_data() )      # perform the delayed interpretation of expressions
+        if processed_call_specific is not rt_call_specific.own_data():
+            rt_call_specific.own_data( dict(processed_call_specific) if type(processed_call_specific)==dict else processed_call_specific )    # the frame edits its data, which may have been escaped from elsewhere
 
         if pos_params is None:
             pos_params = []                                 # allow pos_params to be missing
@@ -335,29 +629,29 @@ Usage examples :
 
         action_object       = self.reach_action(action_name)
 
+        # The call is recorded into a call_record_entry only if the action itself, an input label or AXS_RECORD_CALLS asks for it,
+        # otherwise only a placeholder is made available as __record_entry__, in case the parameters computed during the call need it:
+        record_eagerly      = ak and ( call_record_entry_ptr is not None or self.RECORD_all_calls or
+                                (action_name!='func' and '__record_entry__' in function_access.binder_for(action_object).arg_names) )
+        call_record_entry   = self.new_call_record_entry( action_name ) if record_eagerly else None
+        captured_mapping    = call_record_entry.own_data() if record_eagerly else None  # retain the pointer to perform modifications later
+        lazy_call_record    = None
+
         if action_name=='func':         # at least propagate edit_dict.  FIXME: maybe rely on func's signature if available?
             joint_arg_tuple     = pos_params
             optional_arg_dict   = rt_call_specific.own_data()
-        else:
+        elif record_eagerly:
             rt_call_specific['__record_entry__'] = call_record_entry    # the order is important: first nested_calls() (potentially blocked by {"AS^IS": {}}  then add __record_entry__
             action_object, joint_arg_tuple, optional_arg_dict   = function_access.prep(action_object, pos_params, self, captured_mapping)
+        else:
+            lazy_call_record = LazyCallRecord( self, action_name, rt_call_specific ) if ak else None
+            rt_call_specific['__record_entry__'] = lazy_call_record
+            action_object, joint_arg_tuple, optional_arg_dict   = function_access.prep(action_object, pos_params, self)
+            if lazy_call_record:
+                lazy_call_record.bound_args = (action_object, pos_params, joint_arg_tuple, optional_arg_dict)
 
-
-        if ak:
-            # adding all key-value pairs that were mentioned in the edit_dict, but not needed by the call(), to make sure they also get recorded
-            missing_filter_keys = set(rt_call_specific.own_data()) - set(captured_mapping.keys())
-            for mfk in missing_filter_keys:
-                call_record_entry[mfk] = rt_call_specific[mfk]
-
-            for a in ('__entry__', '__record_entry__'):
-                if a in captured_mapping:
-                    del captured_mapping[a]
-
-            call_record_entry["_replay"] = [ "^^", "execute", [
-                [ [ "get_kernel" ] ] +
-                ( [ self.pickle_one()[1:] ] if hasattr(self, 'pickle_one') else [] ) +
-                [ [ action_name ] ]     # assuming all parameters have been properly recorded (scattered around) call_record_entry and are thus available
-            ] ]
+        if record_eagerly:
+            self.fill_call_record_entry( call_record_entry, action_name, rt_call_specific )
 
             if call_record_entry_ptr is not None:           # making it available to the pipeline
                 call_record_entry_ptr.append( call_record_entry )
@@ -366,66 +660,116 @@ Usage examples :
         result          = function_access.feed(action_object, joint_arg_tuple, optional_arg_dict)
 
         self.runtime_stack().pop()
+        rt_call_specific.release()
+
+        if lazy_call_record:
+            call_record_entry = lazy_call_record.call_record_entry
 
-        if ak and result!=call_record_entry :
+        if call_record_entry is not None and result!=call_record_entry :
             call_record_entry['__result__'] = result    # only visible if save()d after execution (not all application cases)
 
-        logging.debug(f'[{self.get_name()}]  called action "{action_name}" with {pos_params}, got {result}')
-        self.call_cache[cache_key] = result
+        if tracing.debug_enabled:
+            logging.debug(f'[{self.get_name()}]  called action "{action_name}" with {pos_params}, got {result}')
 
         return result
 
 
+    def new_call_record_entry(self, action_name):
+        ak = self.get_kernel()
+        return ak.fresh_entry(container=ak.record_container(), generated_name_prefix=f"generated_by_{self.get_name()}_on_{action_name}_")
+
+
+    def fill_call_record_entry(self, call_record_entry, action_name, rt_call_specific):
+        "Complete the record of a call, whose own data already contains the mapping of the call's arguments"
+
+        captured_mapping = call_record_entry.own_data()
+
+        # adding all key-value pairs that were mentioned in the edit_dict, but not needed by the call(), to make sure they also get recorded
+        missing_filter_keys = set(rt_call_specific.own_data()) - set(captured_mapping.keys())
+        if missing_filter_keys:
+            rt_call_view = rt_call_specific.as_runnable()
+            for mfk in missing_filter_keys:
+                call_record_entry[mfk] = rt_call_view[mfk]
+
+        for a in ('__entry__', '__record_entry__'):
+            if a in captured_mapping:
+                del captured_mapping[a]
+
+        call_record_entry["_replay"] = [ "^^", "execute", [
+            [ [ "get_kernel" ] ] +
+            ( [ self.pickle_one()[1:] ] if hasattr(self, 'pickle_one') else [] ) +
+            [ [ action_name ] ]     # assuming all parameters have been properly recorded (scattered around) call_record_entry and are thus available
+        ] ]
+
+
     def nested_calls(self, unprocessed_struct):
         """Walk over the structure and perform any nested calls found in it.
             Can be quite expensive for large structures, but ok for a prototype.
 
+            The substructures escaped with AS^IS are shared rather than copied, so treat them as read-only
+            (plant() copies only the containers along the path being edited).
+
 Usage examples :
                 axs noop  --:='^^:substitute:#{alpha}#-#{beta}#' --alpha=11 --beta=22
                 axs noop  --:='AS^IS:^^:substitute:#{alpha}#-#{beta}#'
                 axs nested_calls  --:='AS^IS:^^:substitute:#{alpha}#-#{beta}#' --alpha=11 --beta=22
         """
 
-        side_effects_count = 0
-
         def nested_calls_rec(input_structure):
-            nonlocal side_effects_count
 
             if type(input_structure)==list and len(input_structure):
                 head = input_structure[0]
                 if head=='^^':
-                    side_effects_count += 1
+                    if tracing.events_enabled:
+                        tracing.event("nested_begin", entry=self.get_name(), head=head, action=input_structure[1] if len(input_structure)>1 else None)
                     try:
                         return self.call( *input_structure[1:], slice_relative_to=self )
                     except Exception as e:
                         as_part = f"\nas part of\n\t{unprocessed_struct}" if input_structure!=unprocessed_struct else ""
                         logging.error(f"[{self.get_name()}] While computing\n\t{input_structure}{as_part}\nthe following exception was raised:\n\t{e.__class__.__name__}({e})\n"+ ("="*120) )
                         raise e
+                    finally:
+                        if tracing.events_enabled:
+                            tracing.event("nested_end", entry=self.get_name(), head=head)
                 elif head=='^':
-                    side_effects_count += 1
+                    if tracing.events_enabled:
+                        tracing.event("nested_begin", entry=self.get_name(), head=head, action=input_structure[1] if len(input_structure)>1 else None)
                     try:
                         return self.get_kernel().call( *input_structure[1:], slice_relative_to=self )
                     except Exception as e:
                         as_part = f" as part of {unprocessed_struct}" if input_structure!=unprocessed_struct else ""
                         print("-"*120 + f"\n[{self.get_name()}] While computing {input_structure}{as_part} the following exception was raised:\n\t{e.__class__.__name__}({e})\n"+ "="*120, file=sys.stderr)
                         raise e
+                    finally:
+                        if tracing.events_enabled:
+                            tracing.event("nested_end", entry=self.get_name(), head=head)
                 elif head==self.ESCAPE_do_not_process:
-                    side_effects_count += 1                                                         # it is only a "side effect" for the purposes of our GC-facilitating decision making below
-                    return deepcopy( input_structure[1:] )                                          # drop the escape symbol, keeping the rest of the substructure intact
+                    return input_structure[1:]                                                      # drop the escape symbol, sharing the rest of the substructure intact
                 else:
-                    return [ nested_calls_rec(elem) for elem in input_structure ]                   # list elements are substituted
+                    processed_list = None                                                           # list elements are substituted, the list is copied on the first change
+                    for idx, elem in enumerate(input_structure):
+                        processed_elem = nested_calls_rec(elem)
+                        if processed_elem is not elem:
+                            if processed_list is None:
+                                processed_list = input_structure[:]
+                            processed_list[idx] = processed_elem
+                    return input_structure if processed_list is None else processed_list
             elif type(input_structure)==dict:
                 if self.ESCAPE_do_not_process in input_structure:
-                    side_effects_count += 1                                                         # it is only a "side effect" for the purposes of our GC-facilitating decision making below
-                    return deepcopy( input_structure[self.ESCAPE_do_not_process] )                  # follow just this one key (keeping the value intact), NB: all other keys of the dict are ignored
+                    return input_structure[self.ESCAPE_do_not_process]                              # follow just this one key (sharing the value intact), NB: all other keys of the dict are ignored
                 else:
-                    return { k : nested_calls_rec(input_structure[k]) for k in input_structure }    # only values are substituted
+                    processed_dict = None                                                           # only values are substituted, the dict is copied on the first change
+                    for k, v in input_structure.items():
+                        processed_v = nested_calls_rec(v)
+                        if processed_v is not v:
+                            if processed_dict is None:
+                                processed_dict = dict(input_structure)
+                            processed_dict[k] = processed_v
+                    return input_structure if processed_dict is None else processed_dict
             else:
                 return input_structure
 
-        processed_struct = nested_calls_rec(unprocessed_struct)
-
-        return processed_struct if side_effects_count else unprocessed_struct                   # keeping the original if unchanged should help with GC
+        return nested_calls_rec(unprocessed_struct)     # unchanged substructures (or the whole of it) are shared with the original
 
 
     def execute(self, pipeline, pipeline_wide_data=None):
@@ -460,75 +804,83 @@ Usage examples :
                 axs byname ls_output_entry , entry_dir:  get_path '' , , byname shell , run --shell_cmd_with_subs='ls -l #{entry_dir}#'
                 axs byname ls_output_entry , out_file_path: get_path , , byname shell , run --shell_cmd_with_subs='cat #{out_file_path}#'
         """
-        max_call_params     = 3     # action, pos_params, edit_dict
+        return self.execute_plan( pipeline_plan.compile_pipeline(pipeline), pipeline_wide_data )
+
+
+    def execute_plan(self, plan, pipeline_wide_data=None):
+        """Execute a PipelinePlan (see pipeline_plan.compile_pipeline()) starting from self, with optional pipeline-wide inputs.
+            The same plan can be executed any number of times, from different entries.
+
+Usage examples :
+                python3 -c 'import kernel, pipeline_plan; plan=pipeline_plan.compile_pipeline([["get","n"],0,["func","str"]]); print([ kernel.default_kernel.fresh_entry(own_data={"n":n}).execute_plan(plan) for n in range(3) ])'
+        """
         pipeline_wide_data  = pipeline_wide_data or {}
 #        rt_pipeline_wide    = self.get_kernel().bypath(path=f'rt_pipeline_wide_{Runnable.pipeline_counter}', own_data=pipeline_wide_data)  # the "service" pipeline-wide entry
-        rt_pipeline_wide    = Runnable(name=f'rt_pipeline_wide_{Runnable.pipeline_counter}', own_data=pipeline_wide_data, kernel=self.get_kernel()) # the "service" pipeline-wide entry
+        rt_pipeline_wide    = CallFrame.acquire(f'rt_pipeline_wide_{Runnable.pipeline_counter}', pipeline_wide_data, kernel=self.get_kernel())   # the "service" pipeline-wide frame
         Runnable.pipeline_counter += 1
 
         local_context       = [ rt_pipeline_wide ]
         result              = entry = self
-        passing_param       = None
 
-        for call_idx, call_params in enumerate(pipeline):
+        if tracing.events_enabled:     # an exception leaves the span unclosed, the sinks close it together with the enclosing one
+            tracing.event("execute_begin", entry=self.get_name(), steps=len(plan))
 
-            if type(call_params) in (int, str): # a number is a signal to insert the previous result into the pos_params of the next call,
-                                                # a string param name is a signal to add the previous result into edit_dict of the next call
-                protected_result = { self.ESCAPE_do_not_process : result } if type(result) in (dict, list) else result
-                passing_param = (call_params, protected_result)
-                entry = self
+        for call_idx, step in enumerate(plan.steps):
 
-            elif call_params == []:         # an empty list is a signal to start again from self
+            if step.kind == pipeline_plan.STEP_restart:     # start again from self (possibly passing the result to the next call)
                 entry = self
 
             else:
-                output_label    = call_params.pop(max_call_params) if len(call_params)>max_call_params else None    # NB: the order is important!
-                input_label     = call_params.pop(max_call_params) if len(call_params)>max_call_params else None
-
-                call_record_entry_ptr = []  # the value of call_record_entry is returned via appending to this empty list
-
-                call_params_iter    = iter(call_params)
-                action_name         = next(call_params_iter)
-                pos_params          = next(call_params_iter, [])
-                edit_dict           = { **pipeline_wide_data, **next(call_params_iter, {}) }    # shallow dictionary merge
-                export_params       = next(call_params_iter, None)
+                action_name             = step.action_name
+                pos_params              = step.pos_params
+                call_record_entry_ptr   = [] if step.input_label else None     # the value of call_record_entry is returned via appending to this empty list
 
-                if type(pos_params)!=list:      # first ensure pos_params is a list
-                    pos_params = [ pos_params ]     # simplified syntax for single positional parameter actions
+                if pipeline_wide_data or step.pass_name is not None:
+                    edit_dict           = { **pipeline_wide_data, **step.edit_dict }    # shallow dictionary merge
+                else:
+                    edit_dict           = step.edit_dict
 
-                if passing_param:
-                    param_position_or_name, param_value = passing_param
-                    if type(param_position_or_name) == int:     # insert the previous call's result into pos_params of the current call
-                        insert_position_offset = 1 if action_name=='func' else 0
-                        pos_params = pos_params[:]      # make a shallow copy to avoid editing original entry data
-                        pos_params.insert( param_position_or_name+insert_position_offset, param_value )
-                    elif type(param_position_or_name) == str:   # add the previous call's result to the edit_dict of the current call
-                        edit_dict[param_position_or_name] = param_value
+                if step.pass_position is not None or step.pass_name is not None:
+                    protected_result = { self.ESCAPE_do_not_process : result } if type(result) in (dict, list) else result
+                    if step.pass_position is not None:      # insert the previous call's result into pos_params of the current call
+                        pos_params = pos_params[:]          # make a shallow copy to avoid editing original entry data
+                        pos_params.insert( step.pass_position, protected_result )
+                    else:                                   # add the previous call's result to the edit_dict of the current call
+                        edit_dict[step.pass_name] = protected_result
 
-                    passing_param = None     # empty it after use
 
+                if tracing.events_enabled:
+                    tracing.event("step_begin", entry=self.get_name(), action=action_name, index=call_idx)
 
                 if hasattr(entry, 'call'):                                  # an Entry-specific or Runnable-generic method ("func" called on an Entry will fire here)
-                    # print(f"Before call({action_name}, {pos_params}, {edit_dict}, export:{export_params}, rel:+++{self}---)")
-                    result = entry.call(action_name, pos_params, edit_dict, export_params, slice_relative_to=self, call_record_entry_ptr=call_record_entry_ptr, nested_context=local_context)
+                    result = entry.call(action_name, pos_params, edit_dict, step.export_params, slice_relative_to=self, call_record_entry_ptr=call_record_entry_ptr, nested_context=local_context)
                 elif hasattr(entry, action_name):                           # a non-axs Object method
                     action_object   = getattr(entry, action_name)
-                    pos_params      = rt_pipeline_wide.nested_calls(pos_params)              # perform all nested calls if there are any
+                    if not step.constant_pos_params:
+                        pos_params  = rt_pipeline_wide.as_runnable().nested_calls(pos_params)    # perform all nested calls if there are any
                     result          = function_access.feed(action_object, pos_params, edit_dict)
-                elif action_name[0]=='.':   # presumably a qualified action_name, let's start from self
-                    result = self.call(action_name, pos_params, edit_dict, export_params, slice_relative_to=self, call_record_entry_ptr=call_record_entry_ptr, nested_context=local_context)
+                elif step.qualified:        # presumably a qualified action_name, let's start from self
+                    result = self.call(action_name, pos_params, edit_dict, step.export_params, slice_relative_to=self, call_record_entry_ptr=call_record_entry_ptr, nested_context=local_context)
                 else:
-                    display_pipeline = "\n\t".join([str(step) for step in ["["]+pipeline]) + "\n]"
-                    raise RuntimeError( f'In pipeline {display_pipeline} step {pipeline[call_idx]} cannot be executed on value ({entry}) produced by {pipeline[call_idx-1]}' )
+                    display_pipeline = "\n\t".join([str(display_step) for display_step in ["["]+plan.display_steps]) + "\n]"
+                    raise RuntimeError( f'In pipeline {display_pipeline} step {plan.display_steps[call_idx]} cannot be executed on value ({entry}) produced by {plan.display_steps[call_idx-1]}' )
+
+                if tracing.events_enabled:
+                    tracing.event("step_end", entry=self.get_name(), action=action_name, index=call_idx)
 
-                if input_label:
-                    rt_pipeline_wide[input_label] = call_record_entry_ptr[0]
+                if step.input_label:
+                    rt_pipeline_wide[step.input_label] = call_record_entry_ptr[0]
 
-                if output_label:
-                    rt_pipeline_wide[output_label] = function_access.to_num_or_not_to_num( result )
+                if step.output_label:
+                    rt_pipeline_wide[step.output_label] = function_access.to_num_or_not_to_num( result )
 
                 entry = result
 
+        if tracing.events_enabled:
+            tracing.event("execute_end", entry=self.get_name())
+
+        rt_pipeline_wide.release()
+
         return result
 
 
@@ -627,6 +979,7 @@ def plus_one(number):
 if __name__ == '__main__':
 
     logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s %(message)s")
+    tracing.refresh()
 
     print('-'*40 + ' Creating a hierarchy of Runnables: ' + '-'*40)
 
@@ -682,3 +1035,33 @@ if __name__ == '__main__':
         print(f"child.call('nonexistent')={child.call('nonexistent')}\n")
     except NameError as e:
         assert str(e)=="could not find the action 'nonexistent' neither among the ancestors (child, dad, granddad, mum) nor in the Runnable class"
+
+    print('-'*40 + ' Testing the cached ancestry: ' + '-'*40)
+
+    assert [ a.get_name() for a, _ in child.ancestry_generator() ]==['child', 'dad', 'granddad', 'mum'], "flattened ancestry"
+    assert child.reach_function('cube')==(mum.own_functions().cube, ['child', 'mum']), "reaching a function via the ancestry"
+    granddad2   = Runnable(name='granddad2', own_functions=Namespace( cube=(lambda x: -x) ) )
+    dad.parent_objects = [ granddad2 ]
+    assert [ a.get_name() for a, _ in child.ancestry_generator() ]==['child', 'dad', 'granddad2', 'mum'], "the ancestry follows the change of parents"
+    assert child.call('cube', [3])==-3, "the function cache follows the change of parents"
+    dad.parent_objects = [ granddad ]
+
+    print('-'*40 + ' Testing the call frames: ' + '-'*40)
+
+    stack_depth = len(child.runtime_stack())
+    child.call('get', ['x'])
+    assert len(child.runtime_stack())==stack_depth and CallFrame.pool, "call frames are popped off the runtime_stack and returned to the pool"
+    dad['dic'] = { 'a': 1 }
+    assert child.call('get', ['dic'], {'dic.b': 2})=={ 'a': 1, 'b': 2 }, "a pure edit planted into a call frame via its Runnable view"
+    assert dad['dic']=={ 'a': 1 }, "the inherited value stays intact"
+
+    if Runnable.PARAM_CACHE_enabled:
+        print('-'*40 + ' Testing the parameter cache: ' + '-'*40)
+
+        child['next_x'] = [ "^^", "func", [ "runnable.plus_one", [ "^^", "get", "x" ] ] ]
+
+        assert child['next_x']==101, "computing a parameter that depends on an inherited one"
+        dad['x']=200
+        assert child['next_x']==201, "recomputing after the inherited parameter has been edited"
+        assert child.call('get', ['next_x'], {'x': 300})==301, "recomputing when a runtime edit shadows the inherited parameter"
+        assert child['next_x']==201, "reusing the cached value once the runtime edit has gone"
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 
+import contextlib
 import importlib.util
 import logging
 import os
 import sys
+import threading
 import uuid
 
+import metrics
+import tracing
 import ufun
+from entry_journal import EntryJournal
 from runnable import Runnable
 
 
@@ -17,10 +22,16 @@ class Entry(Runnable):
     MODULENAME_functions    = 'code_axs'     # the actual filename ends in .py
     PREFIX_gen_entryname    = 'generated_entry_'
 
+    code_loading_lock       = threading.RLock()     # code is loaded by one thread at a time (it also edits sys.path)
+    code_being_loaded       = set()                 # the entries whose own_functions_cache is not final yet
+
     def __init__(self, entry_path=None, parameters_path=None, module_name=None, container=None, generated_name_prefix=None, is_stored=None, **kwargs):
         "Accept setting entry_path in addition to parent's parameters"
 
         self.generated_name_prefix  = generated_name_prefix or self.PREFIX_gen_entryname
+        self.loaded_disk_stamp      = None  # disk_stamp() at the time of loading the data (None if not loaded from disk)
+        self.journal_offset         = 0     # how much of the contained_entries journal has been merged into own_data
+        self.journal_lines          = 0
 
         self.set_container( container )
 
@@ -35,7 +46,8 @@ class Entry(Runnable):
 
         super().__init__(**kwargs)
 
-        logging.debug(f"[{self.get_name()}] Initializing the Entry with entry_path={self.entry_path}, parameters_path={self.parameters_path}, module_name={self.module_name}, generated_name_prefix={self.generated_name_prefix}")
+        if tracing.debug_enabled:
+            logging.debug(f"[{self.get_name()}] Initializing the Entry with entry_path={self.entry_path}, parameters_path={self.parameters_path}, module_name={self.module_name}, generated_name_prefix={self.generated_name_prefix}")
 
 
     def generate_name(self, prefix=''):
@@ -67,6 +79,7 @@ Usage examples :
 
         self.parameters_path    = None
         self.name               = None
+        self.data_changed()
 
         return self
 
@@ -232,15 +245,163 @@ Usage examples :
 
 
     def pure_data_loader(self):
-        "Returns the dictionary loaded or the (stringifiable) exception object"
+        "Returns the dictionary loaded (with the contained_entries journal merged in) or the (stringifiable) exception object"
 
         parameters_path = self.get_parameters_path()
-        try:
-            return ufun.load_json( parameters_path )
-        except OSError as e:
-            logging.warning(f"[{self.get_name()}] {e}")
+        journal         = self.get_journal()
+        with tracing.Span("load_data", entry=self.get_name(), path=parameters_path), journal.locked() if journal else contextlib.nullcontext() as journal_fd:
+            self.loaded_disk_stamp = self.disk_stamp()
+            try:
+                loaded_data = ufun.load_json( parameters_path )
+            except OSError as e:
+                logging.warning(f"[{self.get_name()}] {e}")
+                return None
+
+            metrics.counters["data_files_loaded"] += 1
+            if self.loaded_disk_stamp and self.loaded_disk_stamp[0]:
+                metrics.counters["json_bytes_parsed"] += self.loaded_disk_stamp[0][1]   # the size at the time of loading
+
+            self.journal_offset, self.journal_lines = 0, 0
+            if journal_fd is not None:
+                records, self.journal_offset = journal.read_records( journal_fd )
+                metrics.counters["json_bytes_parsed"] += self.journal_offset
+                self.journal_lines = len(records)
+                if records:
+                    journal.apply_records( loaded_data.setdefault("contained_entries", {}), records )
+
+        return loaded_data
+
+
+    def get_journal(self):
+        "The EntryJournal of contained_entries (None for entries stored as a bare parameters file)"
+
+        return None if self.parameters_path else EntryJournal( self.get_path( EntryJournal.FILENAME_journal ) )
+
+
+    def disk_stamp(self):
+        "The (mtime, size) of the entry's data file, code file, directory and journal (None for the missing ones)"
+
+        if self.parameters_path:
+            stamped_paths = ( self.parameters_path, )
+        elif self.entry_path:
+            stamped_paths = ( os.path.join(self.entry_path, self.FILENAME_parameters), os.path.join(self.entry_path, self.module_name+'.py'), self.entry_path,
+                              os.path.join(self.entry_path, EntryJournal.FILENAME_journal) )
+        else:
             return None
 
+        stamp = []
+        for stamped_path in stamped_paths:
+            try:
+                stat_result = os.stat( stamped_path )
+                stamp.append( (stat_result.st_mtime_ns, stat_result.st_size) )
+            except OSError:
+                stamp.append( None )
+        return tuple(stamp)
+
+
+    def journal_contained_entry(self, entry_name, relative_path=None):
+        """Attach (given the relative_path) or detach (without one) an entry in the contained_entries of this collection:
+            the change is applied in memory and appended to the journal, without rewriting data_axs.json
+            (until the journal grows long enough to be compacted).
+
+Usage examples :
+                axs work_collection , journal_contained_entry dynamically_attached dynamically_attached
+                axs work_collection , journal_contained_entry dynamically_attached
+        """
+        record  = {"add": entry_name, "path": relative_path} if relative_path is not None else {"remove": entry_name}
+        journal = self.get_journal()
+
+        if not journal or not self.is_stored:   # nothing to append to, store the whole entry instead
+            self.apply_journal_records( [ record ] )
+            return self.save( on_collision="force", completed=ufun.generate_current_timestamp() )
+
+        self.own_data()     # loading takes a shared lock of the journal, so it has to happen first
+        with journal.locked(exclusive=True, create=True) as journal_fd:
+            changed_elsewhere = self.catch_up_journal( journal, journal_fd )
+
+            self.apply_journal_records( [ record ] )
+            self.journal_offset = journal.seal( journal_fd, self.journal_offset )
+            self.journal_offset += journal.append( journal_fd, record )
+            metrics.counters["journal_appends"] += 1
+            self.journal_lines  += 1
+
+            if journal.compact_lines and self.journal_lines >= journal.compact_lines:
+                self.write_compacted( journal, journal_fd )
+
+            if not changed_elsewhere:
+                self.loaded_disk_stamp = self.disk_stamp()
+
+        return self
+
+
+    def compact_journal(self):
+        """Fold the journal of contained_entries into data_axs.json and empty it
+
+Usage examples :
+                axs work_collection , compact_journal
+        """
+        journal = self.get_journal()
+        if journal and self.is_stored:
+            self.own_data()
+            with journal.locked(exclusive=True) as journal_fd:
+                if journal_fd is not None:
+                    changed_elsewhere = self.catch_up_journal( journal, journal_fd )
+                    self.write_compacted( journal, journal_fd )
+                    if not changed_elsewhere:
+                        self.loaded_disk_stamp = self.disk_stamp()
+
+        return self
+
+
+    def apply_journal_records(self, records):
+        "An internal method replaying journal records onto own contained_entries in place (copying them first only if they may be shared)"
+
+        own_data            = self.own_data()
+        contained_entries   = own_data.get("contained_entries")
+        if type(contained_entries)!=dict or "contained_entries" in self.shared_keys:
+            own_data["contained_entries"] = contained_entries = dict( contained_entries if type(contained_entries)==dict else {} )
+            self.shared_keys.discard( "contained_entries" )
+
+        EntryJournal.apply_records( contained_entries, records )
+        self.data_changed( "contained_entries" )
+
+
+    def catch_up_journal(self, journal, journal_fd):
+        """An internal method merging the lines appended to the journal by others since this entry has last looked (the journal is locked).
+            If somebody else has compacted the journal meanwhile, contained_entries are re-read from the disk instead.
+            Returns whether there was anything new.
+        """
+        if self.loaded_disk_stamp and self.disk_stamp()[0]==self.loaded_disk_stamp[0] and os.fstat( journal_fd ).st_size>=self.journal_offset:
+            records, self.journal_offset = journal.read_records( journal_fd, self.journal_offset )
+            self.journal_lines += len(records)
+            if records:
+                self.apply_journal_records( records )
+            return bool(records)
+        else:
+            disk_contained_entries = ufun.load_json( self.get_parameters_path() ).get("contained_entries") or {}
+            records, self.journal_offset = journal.read_records( journal_fd )
+            self.journal_lines = len(records)
+            self.own_data()["contained_entries"] = journal.apply_records( disk_contained_entries, records )   # freshly loaded, so not shared
+            self.shared_keys.discard( "contained_entries" )
+            self.data_changed( "contained_entries" )
+            return True
+
+
+    def write_compacted(self, journal, journal_fd):
+        "An internal method storing own_data and emptying the journal (which has been caught up with and is locked)"
+
+        json_string = ufun.save_json( self.pickle_struct( self.own_data() ), self.get_parameters_path(), indent=4 )
+        journal.truncate( journal_fd )
+        self.journal_offset, self.journal_lines = 0, 0
+        logging.info(f"[{self.get_name()}] the journal of contained_entries has been compacted into '{self.get_parameters_path()}'")
+        return json_string
+
+
+    def is_stale(self):
+        "Has the entry changed on disk since its data was loaded?"
+
+        return self.loaded_disk_stamp is not None and self.disk_stamp()!=self.loaded_disk_stamp
+
 
     def own_functions(self):
         """Lazy-load and cache functions from the file system
@@ -253,39 +414,62 @@ Usage examples :
                 axs byname be_like , own_functions
                 axs byname dont_be_like , own_functions
         """
-        if self.own_functions_cache==None:    # lazy-loading condition
-            entry_path = self.get_path()
-            if entry_path:
-                module_name = self.get_module_name()
-
-                file_path = os.path.join( entry_path , module_name+'.py' )
-                if os.path.exists( file_path ):
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    self.own_functions_cache = False    # to avoid infinite recursion
-                    self.touch('_BEFORE_CODE_LOADING')
+        if self.own_functions_cache==None or (Entry.code_being_loaded and self in Entry.code_being_loaded):
+            with Entry.code_loading_lock:   # another thread may be loading the same code, wait for it to finish
+                if self.own_functions_cache==None:    # lazy-loading condition
+                    self.load_own_functions()
+
+        return self.own_functions_cache
+
+
+    def load_own_functions(self):
+        "An internal method loading the code of the entry (if any) while holding the code_loading_lock"
+
+        entry_path = self.get_path()
+        if entry_path:
+            module_name = self.get_module_name()
+
+            file_path = os.path.join( entry_path , module_name+'.py' )
+            if os.path.exists( file_path ):
+                spec = importlib.util.spec_from_file_location(module_name, file_path)
+                self.own_functions_cache = False    # to avoid infinite recursion
+                Entry.code_being_loaded.add( self )
+                try:
+                    if tracing.events_enabled:
+                        tracing.event("load_code_begin", entry=self.get_name(), path=file_path)
+                    if self.touch('_BEFORE_CODE_LOADING') is not None:
+                        self.lineage_changed()          # actions reached while this entry's code was not there yet should be looked up again
                     self.own_functions_cache = importlib.util.module_from_spec(spec)
                     sys.path.insert( 0, entry_path )    # allow (and prefer) code imports local to the entry
                     spec.loader.exec_module( self.own_functions_cache )
                     sys.path.pop( 0 )                   # /allow (and prefer) code imports local to the entry
-
-                else:
-                    self.own_functions_cache = False
+                    metrics.counters["code_modules_loaded"] += 1
+                finally:
+                    Entry.code_being_loaded.discard( self )
+                    if tracing.events_enabled:
+                        tracing.event("load_code_end", entry=self.get_name(), path=file_path)
 
             else:
-                logging.debug(f"[{self.get_name()}] The entry does not have a path, so no functions either")
                 self.own_functions_cache = False
 
-        return self.own_functions_cache
+        else:
+            if tracing.debug_enabled:
+                logging.debug(f"[{self.get_name()}] The entry does not have a path, so no functions either")
+            self.own_functions_cache = False
 
 
     def reload(self):
-        """Triggers reloading data, code and clears call cache.
+        """Triggers reloading data, code and clears call and parameter caches.
 
             Useful when another axs process is allowed to update entries and we need to pick up the changes.
         """
         self.own_data_cache         = None
-        self.call_cache             = {}
+        self.loaded_disk_stamp      = None
+        self.call_cache             = None
+        self.param_value_cache      = {}
         self.own_functions_cache    = None
+        self.data_changed()
+        self.lineage_changed()      # the code of this entry may now be different
 
         return self
 
@@ -362,15 +546,26 @@ Usage examples :
             else:
                 os.makedirs( parameters_dirname )
 
-        json_string = ufun.save_json( self.pickle_struct(own_data), parameters_path, indent=4 )
+        journal = self.get_journal()
+        with journal.locked(exclusive=True) if journal else contextlib.nullcontext() as journal_fd:
+            if journal_fd is not None and self.is_stored and self.loaded_disk_stamp is not None:
+                self.catch_up_journal( journal, journal_fd )    # keep the entries attached by others meanwhile
+                                                                # (otherwise the journal is left by a previous occupant of the directory)
+            json_string = ufun.save_json( self.pickle_struct(own_data), parameters_path, indent=4 )
+            if journal_fd is not None:
+                journal.truncate( journal_fd )
+            self.journal_offset, self.journal_lines = 0, 0
 
         logging.info(f"[{self.get_name()}] parameters {json_string} saved to '{parameters_path}'")
-
-        self.call('attach')
+        metrics.counters["entries_saved"] += 1
+        self.loaded_disk_stamp = self.disk_stamp()
 
         ak = self.get_kernel()
         if ak:
-            ak.encache( new_path, self )
+            ak.encache( new_path, self )    # before attaching, so that the container could index the entry without reloading it
+
+        self.call('attach')
+
         self.is_stored  = True
 
         return self
@@ -401,11 +596,16 @@ Usage examples :
 
 if __name__ == '__main__':
 
+    import tempfile
+
     logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(funcName)s %(message)s")
+    tracing.refresh()
+
+    test_dir = tempfile.mkdtemp()
 
     print('-'*40 + ' Entry direct creation and storing: ' + '-'*40)
 
-    base_ordinals = Entry(entry_path='base_ordinals', own_data={
+    base_ordinals = Entry(entry_path=os.path.join(test_dir, 'base_ordinals'), own_data={
         "0": "zero",
         "1": "one",
         "2": "two",
@@ -413,7 +613,7 @@ if __name__ == '__main__':
     })
     assert base_ordinals[2]=="two", "Accessing own parameter of an unstored object"
 
-    derived_ordinals = Entry(entry_path='derived_ordinals', own_data={
+    derived_ordinals = Entry(entry_path=os.path.join(test_dir, 'derived_ordinals'), own_data={
         "5": "five",
         "6": "six",
         "7": "seven",
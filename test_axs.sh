@@ -97,10 +97,39 @@ assert 'axs byname child_for_editing , get empty_dic --empty_dic+,::=beta:500' "
 assert 'axs byname child_for_editing , get empty_list --empty_list+,=100,200' "[100, 200]"
 assert_end editing_child_override
 
+export PRODUCER_LOG=`axs byquery shell_tool,can_download_url 2>&1 >/dev/null`
+assert 'echo "$PRODUCER_LOG" | grep -c "already been attached\|Collision"' 0
+assert 'ls `axs work_collection , get_path` | grep -c "_tool_"' 0
+axs byquery shell_tool,can_download_url --- , remove
+assert_end producing_an_entry_attaches_it_once
+
+assert 'axs byqueries source_code,factorizer source_code,square_root factorizer,source_code' "[['^', 'byname', 'factorizer'], ['^', 'byname', 'square_root_c'], ['^', 'byname', 'factorizer']]"
+assert 'axs byqueries source_code,factorizer source_code,square_root factorizer,source_code --parallel' "[['^', 'byname', 'factorizer'], ['^', 'byname', 'square_root_c'], ['^', 'byname', 'factorizer']]"
+assert_end byqueries_deduplication_and_order
+
+assert 'axs explain_query source_code,factorizer , __getitem__ outcome' 'found factorizer'
+assert 'axs byname factorizer , , stats , __getitem__ data_files_loaded , __gt__ 0' 'True'
+assert_end query_explanation_and_stats
+
+axs work_collection , attached_entry journal_alpha , plant n 1 , save
+axs work_collection , attached_entry journal_beta , plant n 2 , save
+assert 'axs work_collection , get contained_entries , get journal_alpha' 'journal_alpha'
+assert 'axs work_collection , get contained_entries , get journal_beta' 'journal_beta'
+axs work_collection , compact_journal
+assert 'wc -c < "`axs work_collection , get_path`/contained_entries_axs.jsonl" | tr -d " "' 0
+assert 'axs work_collection , get contained_entries , get journal_beta' 'journal_beta'
+axs byname journal_alpha , remove
+axs byname journal_beta , remove
+assert_end contained_entries_journal_and_compaction
+
 #axs byname git , clone --repo_name=counting_collection
 axs byquery git_repo,collection,repo_name=counting_collection,url_prefix=https://github.com/ens-lg4
 export REPO_DIG_OUTPUT=`axs byname French , dig number_mapping.5`
 assert "echo $REPO_DIG_OUTPUT" 'cinq'
+export DIG_FIVE='[["dig","number_mapping.5"]]'
+export SEQUENTIAL_DIGS=`axs all_byquery number_mapping. ---="$DIG_FIVE"`
+assert 'echo "$SEQUENTIAL_DIGS" | grep -c cinq' 1
+assert 'axs all_byquery number_mapping. ---="$DIG_FIVE" --parallel=4 --on_error=collect' "$SEQUENTIAL_DIGS"
 axs byquery git_repo,collection,repo_name=counting_collection , pull
 axs byname counting_collection , remove
 axs byquery shell_tool,can_git --- , remove
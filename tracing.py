@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""Near-zero-cost debug logging and structured trace events for the kernel's hot paths.
+
+    The kernel's logging.debug() calls are guarded by a module-level flag,
+    so when DEBUG is off their f-strings (which may format whole dicts and runtime stacks) are never built:
+
+        if tracing.debug_enabled:
+            logging.debug(f"...")
+
+    The flag follows the root logger's level at import time; call tracing.refresh() after reconfiguring logging.
+
+    Structured trace events are only emitted while at least one sink is registered:
+
+        if tracing.events_enabled:
+            tracing.event("call_begin", entry=..., action=...)
+
+    A span of work is a pair of <kind>_begin and <kind>_end events emitted by the same thread (an exception may leave a span unclosed,
+    in which case the sinks close it together with the enclosing one). Coarse-grained spans can use the Span context manager.
+
+Usage examples :
+                python3 -c 'import tracing; tracing.add_sink(print); tracing.event("hello", who="world")'
+"""
+
+import logging
+import os
+import time
+
+debug_enabled   = False     # are the kernel's logging.debug() calls worth formatting?
+events_enabled  = False     # is anyone listening to the structured trace events?
+sinks           = []        # callables of (event_kind, timestamp, fields_dict)
+
+
+def refresh():
+    "Re-read the logging level (and AXS_TRACE environment variable that forces debug logging on)"
+
+    global debug_enabled, events_enabled
+
+    if os.getenv('AXS_TRACE', '').lower() in ('1', 'on', 'yes', 'true') and not logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    debug_enabled   = logging.getLogger().isEnabledFor(logging.DEBUG)
+    events_enabled  = bool(sinks)
+
+    return debug_enabled
+
+
+def add_sink(sink):
+    "Start sending the structured trace events to the given callable"
+
+    sinks.append( sink )
+    refresh()
+    return sink
+
+
+def remove_sink(sink):
+    if sink in sinks:
+        sinks.remove( sink )
+    refresh()
+
+
+def event(event_kind, **fields):
+    "Send a structured trace event to all the sinks (check events_enabled before calling to keep it free when nobody listens)"
+
+    timestamp = time.perf_counter()
+    for sink in sinks:
+        sink(event_kind, timestamp, fields)
+
+
+class Span:
+    """Emits <kind>_begin and <kind>_end events around a block of code, if anyone is listening when the block starts.
+        Meant for the coarse-grained spans, the hot paths check events_enabled themselves.
+    """
+
+    __slots__ = ('kind', 'fields', 'emitted')
+
+    def __init__(self, kind, **fields):
+        self.kind   = kind
+        self.fields = fields
+
+
+    def __enter__(self):
+        self.emitted = events_enabled
+        if self.emitted:
+            event(self.kind+'_begin', **self.fields)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.emitted:
+            event(self.kind+'_end', **self.fields, **({"error": exc_type.__name__} if exc_type else {}))
+
+
+refresh()
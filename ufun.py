@@ -94,9 +94,10 @@ Usage examples :
     """
 
     contained_entry_names = []
-    for entry_name in os.listdir( collection_path ):
-        if os.path.isdir( os.path.join(collection_path, entry_name)) and not entry_name.startswith('.'):
-            contained_entry_names.append( entry_name )
+    with os.scandir( collection_path ) as dir_iterator:     # the entry type usually comes with the listing, saving a stat() per child
+        for dir_entry in dir_iterator:
+            if not dir_entry.name.startswith('.') and dir_entry.is_dir():
+                contained_entry_names.append( dir_entry.name )
 
     generated_index = { "core_collection": [ "^", "execute", [[ [ "core_collection" ], [ "get_path" ] ]] ] } if is_work_collection else {}
 
@@ -191,7 +192,12 @@ Usage examples :
         return orig_structure + diff                        # list top-up with another list  OR  string concatenation  OR  adding numbers
 
 
-def edit_structure(struct_ptr, key_path, value=None, edit_mode='ASSIGN'):
+def edit_structure(struct_ptr, key_path, value=None, edit_mode='ASSIGN', copy_on_write=False):
+    """Edit a nested structure in place along the given key_path.
+        With copy_on_write only the top container is changed in place,
+        while the containers below it along the key_path are replaced by their shallow copies before being edited,
+        so that the (possibly shared) original substructures stay intact.
+    """
 
     last_idx = len(key_path)-1
     for key_idx, key_syllable in enumerate(key_path):
@@ -206,6 +212,8 @@ def edit_structure(struct_ptr, key_path, value=None, edit_mode='ASSIGN'):
             struct_ptr[key_syllable] = {}               # explicit dict vivification
 
         if key_idx<last_idx:
+            if copy_on_write and type(struct_ptr[key_syllable]) in (list, dict):
+                struct_ptr[key_syllable] = struct_ptr[key_syllable].copy()
             struct_ptr = struct_ptr[key_syllable]       # iterative descent
         elif edit_mode == 'PLUCK':
             struct_ptr.pop(key_syllable)